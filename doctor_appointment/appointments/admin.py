@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import CustomUser, Doctor, Patient, TimeSlot, Availability, Appointment
+from .models import (
+    CustomUser,
+    Doctor,
+    Patient,
+    TimeSlot,
+    Availability,
+    Appointment,
+    ArchivedAppointment,
+)
 
 admin.site.register(CustomUser)
 admin.site.register(Doctor)
@@ -7,3 +15,4 @@ admin.site.register(Patient)
 admin.site.register(TimeSlot)
 admin.site.register(Availability)
 admin.site.register(Appointment)
+admin.site.register(ArchivedAppointment)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AppointmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appointments'
+
+    def ready(self):
+        from . import cache  # noqa: F401  (connects the invalidation receiver)
+        from . import events  # noqa: F401  (connects the event publisher)
@@ -0,0 +1,100 @@
+"""
+Moving past dates out of the live tables.
+
+Past appointments are copied to ArchivedAppointment and deleted; past
+availability and waitlist rows are deleted outright, since the DoctorDay
+row of each doctor-day already summarises which slots were free and
+booked. Work is done in batches, each in its own transaction, so the live
+tables stay writable throughout and an interrupted run can be resumed by
+running it again.
+"""
+
+from django.db import connections, router, transaction
+
+from . import partitions
+from .cache import availability_cache
+from .models import Appointment, ArchivedAppointment, Availability, Waitlist
+
+ARCHIVE_FIELDS = (
+    "id",
+    "doctor_id",
+    "patient_id",
+    "date",
+    "time_slot__start_time",
+    "time_slot__end_time",
+)
+
+
+def _archive_appointments(before, batch_size):
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Appointment.objects.select_for_update(of=("self",))
+                .filter(date__lt=before)
+                .order_by("date", "id")
+                .values_list(*ARCHIVE_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return moved
+            ArchivedAppointment.objects.bulk_create(
+                [
+                    ArchivedAppointment(
+                        appointment_id=appointment_id,
+                        doctor_id=doctor_id,
+                        patient_id=patient_id,
+                        date=date,
+                        start_time=start_time,
+                        end_time=end_time,
+                    )
+                    for appointment_id, doctor_id, patient_id, date, start_time, end_time in rows
+                ],
+                # Rows archived by an interrupted run that died before its
+                # delete committed are already there.
+                ignore_conflicts=True,
+            )
+            Appointment.objects.filter(id__in=[row[0] for row in rows]).delete()
+        moved += len(rows)
+
+
+def _delete_past(model, before, batch_size):
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                model.objects.filter(date__lt=before)
+                .order_by("date", "id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                return deleted
+            model.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+
+def archive_past(before, batch_size=5000):
+    """
+    Archive appointments dated before ``before`` and delete the availability
+    and waitlist rows for those dates. On PostgreSQL, monthly partitions
+    left empty are dropped. Returns a dict of counts.
+    """
+    summary = {
+        "appointments": _archive_appointments(before, batch_size),
+        "availability": _delete_past(Availability, before, batch_size),
+        "waitlist": _delete_past(Waitlist, before, batch_size),
+        "dropped_partitions": [],
+    }
+    for model in partitions.PARTITIONED_MODELS:
+        connection = connections[router.db_for_write(model)]
+        if connection.vendor == "postgresql" and partitions.is_partitioned(
+            connection, model._meta.db_table
+        ):
+            summary["dropped_partitions"] += partitions.drop_partitions_before(
+                connection, model, before
+            )
+
+    if summary["availability"]:
+        # Unscoped listings may include the deleted rows; entries scoped to
+        # the archived doctor-days are left to expire.
+        availability_cache.invalidate_all()
+    return summary
@@ -0,0 +1,200 @@
+"""
+Native async versions of the read-heavy endpoints.
+
+They mirror AvailabilityViewSet.list/retrieve, TimeSlotViewSet.list and
+AppointmentViewSet.search but run on the async ORM, so under ASGI a worker
+can hold many slow clients without parking a thread per request.
+"""
+
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .authentication import AsyncJWTAuthentication
+from .cache import availability_cache, timeslot_versions
+from .conditional import aconditional_response
+from .events import event_stream, get_broker
+from .models import TimeSlot
+from .pagination import KeysetPagination, SearchPagination
+from .search import search_appointments
+from .serializers import (
+    AppointmentSearchSerializer,
+    AppointmentSerializer,
+    AvailabilityEventsSerializer,
+    AvailabilityFilterSerializer,
+    AvailabilitySerializer,
+    TimeSlotSerializer,
+)
+from .views import AppointmentViewSet, AvailabilityViewSet
+
+authentication = AsyncJWTAuthentication()
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def async_api_view(view):
+    """Authenticate with JWT and turn DRF API exceptions into JSON responses."""
+
+    @require_GET
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request = Request(request)
+        try:
+            result = await authentication.aauthenticate(request)
+            if result is None:
+                raise NotAuthenticated()
+            request.user, request.auth = result
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            response = json_response({"detail": exc.detail}, status=exc.status_code)
+            if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+                response["WWW-Authenticate"] = authentication.authenticate_header(request)
+            return response
+
+    return wrapper
+
+
+class ValidationFailed(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+
+    def __init__(self, errors):
+        self.detail = errors
+
+
+def validated(serializer):
+    if not serializer.is_valid():
+        raise ValidationFailed(serializer.errors)
+    return serializer
+
+
+@async_api_view
+async def availability_list(request):
+    filters = validated(AvailabilityFilterSerializer(data=request.query_params))
+    queryset = filters.filter(AvailabilityViewSet.queryset.filter(is_available=True))
+
+    async def produce():
+        paginator = KeysetPagination()
+        rows = paginator.finish_page(
+            [row async for row in paginator.page_queryset(queryset, request)]
+        )
+        serializer = AvailabilitySerializer(rows, many=True)
+        return paginator.get_paginated_response(serializer.data).data
+
+    params = filters.validated_data
+    scope = None
+    single_day = "date_from" in params and params["date_from"] == params.get("date_to")
+    if "doctor" in params and single_day:
+        scope = (params["doctor"], params["date_from"])
+
+    async def respond():
+        data = await availability_cache.aget_or_set(
+            scope, request.build_absolute_uri(), produce
+        )
+        return json_response(data)
+
+    return await aconditional_response(request, availability_cache, scope, respond, "json")
+
+
+@async_api_view
+async def availability_detail(request, pk):
+    async def produce():
+        availability = await AvailabilityViewSet.queryset.filter(pk=pk).afirst()
+        if availability is None:
+            raise NotFound()
+        return AvailabilitySerializer(availability).data
+
+    async def respond():
+        return json_response(await availability_cache.aget_or_set(None, f"detail:{pk}", produce))
+
+    return await aconditional_response(request, availability_cache, None, respond, "json")
+
+
+@async_api_view
+async def availability_events(request):
+    """
+    Server-sent events for availability changes, optionally only for some
+    doctors (``doctor``, repeatable) and dates (``date_from``, ``date_to``).
+    Reconnecting clients resume after the Last-Event-ID header, or the
+    ``last_event_id`` parameter for clients that cannot set headers.
+    """
+    params = validated(AvailabilityEventsSerializer(data=request.query_params)).validated_data
+    stream = event_stream(
+        get_broker(),
+        last_event_id=request.headers.get("Last-Event-ID") or params.get("last_event_id"),
+        doctor_ids=set(params.get("doctor", [])),
+        date_from=params.get("date_from"),
+        date_to=params.get("date_to"),
+        heartbeat=getattr(settings, "AVAILABILITY_EVENT_HEARTBEAT", 15),
+    )
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Ask nginx not to buffer the stream.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@async_api_view
+async def timeslot_list(request):
+    async def respond():
+        slots = [
+            slot async for slot in TimeSlot.objects.order_by("start_time", "id").aiterator()
+        ]
+        return json_response(TimeSlotSerializer(slots, many=True).data)
+
+    return await aconditional_response(request, timeslot_versions, None, respond, "json")
+
+
+@async_api_view
+async def appointment_search(request):
+    params = validated(AppointmentSearchSerializer(data=request.query_params))
+    queryset = search_appointments(
+        doctor=params.validated_data.get("doctor"),
+        patient=params.validated_data.get("patient"),
+        queryset=params.filter(AppointmentViewSet.queryset.all()),
+    )
+
+    paginator = SearchPagination()
+    page_size = paginator.get_page_size(request)
+    try:
+        page = int(request.query_params.get(paginator.page_query_param, 1))
+    except ValueError:
+        raise NotFound(paginator.invalid_page_message)
+
+    count = await queryset.acount()
+    last_page = max(1, -(-count // page_size))
+    if not 1 <= page <= last_page:
+        raise NotFound(paginator.invalid_page_message)
+
+    offset = (page - 1) * page_size
+    rows = [row async for row in queryset[offset : offset + page_size]]
+
+    url = request.build_absolute_uri()
+    next_link = (
+        replace_query_param(url, paginator.page_query_param, page + 1)
+        if page < last_page
+        else None
+    )
+    if page <= 1:
+        previous_link = None
+    elif page == 2:
+        previous_link = remove_query_param(url, paginator.page_query_param)
+    else:
+        previous_link = replace_query_param(url, paginator.page_query_param, page - 1)
+
+    return json_response(
+        {
+            "count": count,
+            "next": next_link,
+            "previous": previous_link,
+            "results": AppointmentSerializer(rows, many=True).data,
+        }
+    )
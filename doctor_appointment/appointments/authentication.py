@@ -0,0 +1,228 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    InvalidToken,
+    TokenError,
+)
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def role_claims(user):
+    """
+    Claims copied into every token so requests can be authorised without
+    loading the user. "is_doctor" doubles as the marker for tokens that
+    carry them.
+    """
+    return {
+        "username": user.username,
+        "is_staff": user.is_staff,
+        "is_superuser": user.is_superuser,
+        "is_doctor": user.is_doctor,
+        "is_patient": user.is_patient,
+        "doctor_id": user.doctor_id,
+        "patient_id": user.patient_id,
+    }
+
+
+class RoleUser(TokenUser):
+    """
+    Stateless user built from a token's role claims.
+
+    Exposes is_doctor, is_patient, doctor_id and patient_id like the claims
+    it was built from; ``full_user`` loads the CustomUser row for the rare
+    code that needs it.
+    """
+
+    def __str__(self):
+        return self.username
+
+    @property
+    def full_user(self):
+        return ClaimsJWTAuthentication.load_user(self.id)
+
+
+class TTLCache:
+    """A small thread-safe LRU mapping whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that authorises from the token's role claims.
+
+    Tokens issued by RoleTokenObtainPairSerializer need no query at all.
+    Older tokens without the claims fall back to the user row, kept in a
+    per-process TTL-bounded LRU cache. Because the user is not reloaded,
+    deactivating a user or changing their role takes effect when their
+    access token expires.
+    """
+
+    user_cache = TTLCache(
+        maxsize=getattr(settings, "JWT_USER_CACHE_SIZE", 1024),
+        ttl=getattr(settings, "JWT_USER_CACHE_TTL", 60),
+    )
+
+    @staticmethod
+    def user_queryset():
+        return get_user_model().objects.select_related("doctor_profile", "patient_profile")
+
+    @classmethod
+    def load_user(cls, user_id):
+        user = cls.user_cache.get(user_id)
+        if user is None:
+            try:
+                user = cls.user_queryset().get(**{api_settings.USER_ID_FIELD: user_id})
+            except get_user_model().DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cls.user_cache.set(user_id, user)
+        return user
+
+    def get_user(self, validated_token):
+        if "is_doctor" in validated_token:
+            return self.claims_user(validated_token)
+        user = self.load_user(self.user_id(validated_token))
+        return self.checked_user(user, validated_token)
+
+    def claims_user(self, validated_token):
+        self.user_id(validated_token)
+        return RoleUser(validated_token)
+
+    def user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def checked_user(self, user, validated_token):
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return RoleUser({**validated_token.payload, **role_claims(user)})
+
+
+class AsyncJWTAuthentication(ClaimsJWTAuthentication):
+    """
+    ClaimsJWTAuthentication for plain async Django views.
+
+    Header parsing and signature checks are pure CPU and reused as is; only
+    the fallback user lookup is swapped for the async ORM.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if "is_doctor" in validated_token:
+            return self.claims_user(validated_token)
+
+        user_id = self.user_id(validated_token)
+        user = self.user_cache.get(user_id)
+        if user is None:
+            try:
+                user = await self.user_queryset().aget(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            self.user_cache.set(user_id, user)
+        return self.checked_user(user, validated_token)
+
+
+def is_blacklisted(jti):
+    """
+    BlacklistedToken lookup through the default cache. Blacklisting a token
+    updates its entry straight away (see remember_blacklisted below), so
+    the timeout only bounds how long a "not blacklisted" answer is kept.
+    """
+    key = f"jwt-blacklist:{jti}"
+    blacklisted = cache.get(key)
+    if blacklisted is None:
+        blacklisted = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        cache.set(key, blacklisted, getattr(settings, "JWT_BLACKLIST_CACHE_TIMEOUT", 300))
+    return blacklisted
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def remember_blacklisted(sender, instance, **kwargs):
+    cache.set(
+        f"jwt-blacklist:{instance.token.jti}",
+        True,
+        getattr(settings, "JWT_BLACKLIST_CACHE_TIMEOUT", 300),
+    )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_cached_user(sender, instance, **kwargs):
+    ClaimsJWTAuthentication.user_cache.discard(instance.pk)
+
+
+class CachedRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist check goes through is_blacklisted."""
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
@@ -0,0 +1,307 @@
+from collections import Counter, namedtuple
+
+from django.db import IntegrityError, transaction
+
+from . import doctor_days, stats
+from .metrics import count_outcome
+from .models import Appointment, Availability, PromotionTask, Waitlist
+from .signals import SlotChange, notify_slot_changed
+
+
+class BookingOutcome:
+    BOOKED = "booked"
+    WAITLISTED = "waitlisted"
+    ALREADY_WAITLISTED = "already_waitlisted"
+    CONFLICT = "conflict"
+    UNAVAILABLE = "unavailable"
+
+
+BookingResult = namedtuple("BookingResult", ["outcome", "appointment"])
+BatchBookingResult = namedtuple(
+    "BatchBookingResult", ["outcome", "appointments", "waitlisted", "rejected"]
+)
+
+
+@count_outcome("single")
+def book_slot(patient_id, doctor_id, date, time_slot_id):
+    """
+    Book a slot for a patient.
+
+    The fast path claims the availability row with a single conditional
+    UPDATE and inserts the appointment in the same transaction; the unique
+    constraints on Appointment reject double bookings, so no read-then-write
+    checks are needed. Only a failed claim falls back to the slower queries
+    that decide between conflict, waitlist and unavailable.
+    """
+    try:
+        with transaction.atomic():
+            claimed = Availability.objects.filter(
+                doctor_id=doctor_id,
+                date=date,
+                time_slot_id=time_slot_id,
+                is_available=True,
+            ).update(is_available=False)
+            if claimed:
+                appointment = Appointment.objects.create(
+                    patient_id=patient_id,
+                    doctor_id=doctor_id,
+                    date=date,
+                    time_slot_id=time_slot_id,
+                )
+                doctor_days.mark_booked(doctor_id, date, [time_slot_id])
+                stats.record(doctor_id, date, booked=1)
+                notify_slot_changed(doctor_id, date, [time_slot_id], SlotChange.BOOKED)
+                return BookingResult(BookingOutcome.BOOKED, appointment)
+    except IntegrityError:
+        # The claim is rolled back together with the rejected insert.
+        pass
+
+    return _resolve_unclaimed(patient_id, doctor_id, date, time_slot_id)
+
+
+def _resolve_unclaimed(patient_id, doctor_id, date, time_slot_id):
+    if Appointment.objects.filter(
+        patient_id=patient_id, date=date, time_slot_id=time_slot_id
+    ).exists():
+        return BookingResult(BookingOutcome.CONFLICT, None)
+
+    slot = dict(doctor_id=doctor_id, date=date, time_slot_id=time_slot_id)
+    # A slot awaiting promotion is still taken: join the back of its queue.
+    if (
+        Appointment.objects.filter(**slot).exists()
+        or PromotionTask.objects.filter(**slot).exists()
+    ):
+        _, created = Waitlist.objects.get_or_create(
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            date=date,
+            time_slot_id=time_slot_id,
+        )
+        if created:
+            stats.record(doctor_id, date, waitlisted=1)
+            return BookingResult(BookingOutcome.WAITLISTED, None)
+        return BookingResult(BookingOutcome.ALREADY_WAITLISTED, None)
+
+    return BookingResult(BookingOutcome.UNAVAILABLE, None)
+
+
+def _matching(queryset, slots, fields=("doctor_id", "date", "time_slot_id")):
+    """
+    The subset of ``slots`` present in ``queryset``, as one query.
+
+    The database narrows by each column's IN list; the exact tuples are
+    then matched here.
+    """
+    columns = list(zip(*slots))
+    queryset = queryset.filter(
+        **{f"{field}__in": set(values) for field, values in zip(fields, columns)}
+    )
+    return set(queryset.values_list(*fields)) & set(slots)
+
+
+@count_outcome("batch")
+def book_slots(patient_id, slots):
+    """
+    Book several (doctor_id, date, time_slot_id) slots for one patient,
+    all or nothing.
+
+    Patient conflicts and undeclared slots reject the whole batch. Free
+    slots are claimed with one UPDATE and booked with one bulk insert;
+    slots that are already booked put the patient on their waitlists in
+    the same transaction.
+    """
+    slots = list(dict.fromkeys(slots))
+    times = Counter((date, time_slot_id) for _, date, time_slot_id in slots)
+    booked_times = _matching(
+        Appointment.objects.filter(patient_id=patient_id),
+        list(times),
+        fields=("date", "time_slot_id"),
+    )
+    clashing = [
+        slot for slot in slots if times[slot[1:]] > 1 or slot[1:] in booked_times
+    ]
+    if clashing:
+        return BatchBookingResult(BookingOutcome.CONFLICT, [], [], clashing)
+
+    try:
+        with transaction.atomic():
+            wanted = set(slots)
+            candidates = (
+                Availability.objects.select_for_update()
+                .filter(
+                    doctor_id__in={slot[0] for slot in slots},
+                    date__in={slot[1] for slot in slots},
+                    time_slot_id__in={slot[2] for slot in slots},
+                    is_available=True,
+                )
+                .values_list("id", "doctor_id", "date", "time_slot_id")
+            )
+            open_rows = {
+                tuple(row[1:]): row[0] for row in candidates if tuple(row[1:]) in wanted
+            }
+            taken = [slot for slot in slots if slot not in open_rows]
+            if taken:
+                waiting = _matching(Appointment.objects.all(), taken) | _matching(
+                    PromotionTask.objects.all(), taken
+                )
+                rejected = [slot for slot in taken if slot not in waiting]
+                if rejected:
+                    return BatchBookingResult(
+                        BookingOutcome.UNAVAILABLE, [], [], rejected
+                    )
+
+            claimed = [slot for slot in slots if slot in open_rows]
+            Availability.objects.filter(
+                id__in=[open_rows[slot] for slot in claimed]
+            ).update(is_available=False)
+            appointments = Appointment.objects.bulk_create(
+                Appointment(
+                    patient_id=patient_id,
+                    doctor_id=doctor_id,
+                    date=date,
+                    time_slot_id=time_slot_id,
+                )
+                for doctor_id, date, time_slot_id in claimed
+            )
+            # Slots the patient already waits for are not queued twice.
+            joined = taken
+            if taken:
+                queued = _matching(Waitlist.objects.filter(patient_id=patient_id), taken)
+                joined = [slot for slot in taken if slot not in queued]
+            Waitlist.objects.bulk_create(
+                (
+                    Waitlist(
+                        patient_id=patient_id,
+                        doctor_id=doctor_id,
+                        date=date,
+                        time_slot_id=time_slot_id,
+                    )
+                    for doctor_id, date, time_slot_id in joined
+                ),
+                ignore_conflicts=True,
+            )
+
+            by_day = {}
+            for doctor_id, date, time_slot_id in claimed:
+                by_day.setdefault((doctor_id, date), []).append(time_slot_id)
+            for (doctor_id, date), time_slot_ids in by_day.items():
+                doctor_days.mark_booked(doctor_id, date, time_slot_ids)
+                notify_slot_changed(doctor_id, date, time_slot_ids, SlotChange.BOOKED)
+            changes = Counter()
+            for doctor_id, date, _ in claimed:
+                changes[doctor_id, date, "booked"] += 1
+            for doctor_id, date, _ in joined:
+                changes[doctor_id, date, "waitlisted"] += 1
+            for (doctor_id, date, field), delta in changes.items():
+                stats.record(doctor_id, date, **{field: delta})
+    except IntegrityError:
+        # The patient booked one of these times concurrently.
+        return BatchBookingResult(BookingOutcome.CONFLICT, [], [], [])
+
+    outcome = BookingOutcome.BOOKED if appointments else BookingOutcome.WAITLISTED
+    return BatchBookingResult(outcome, appointments, taken, [])
+
+
+def cancel_appointment(appointment):
+    """
+    Cancel an appointment.
+
+    If anyone is waiting for the slot it stays reserved and a PromotionTask
+    is queued for the promotion worker, so cancelling costs the same however
+    long the waitlist is. Otherwise the slot is freed straight away.
+    """
+    slot = dict(
+        doctor_id=appointment.doctor_id,
+        date=appointment.date,
+        time_slot_id=appointment.time_slot_id,
+    )
+    with transaction.atomic():
+        appointment.delete()
+        stats.record(appointment.doctor_id, appointment.date, booked=-1, cancelled=1)
+        if Waitlist.objects.filter(**slot).exists():
+            PromotionTask.objects.create(**slot)
+            doctor_days.mark_reserved(
+                appointment.doctor_id, appointment.date, [appointment.time_slot_id]
+            )
+        else:
+            Availability.objects.filter(**slot).update(is_available=True)
+            doctor_days.mark_free(
+                appointment.doctor_id, appointment.date, [appointment.time_slot_id]
+            )
+            notify_slot_changed(
+                appointment.doctor_id,
+                appointment.date,
+                [appointment.time_slot_id],
+                SlotChange.FREED,
+            )
+
+
+def process_promotions(batch_size=100):
+    """
+    Drain up to ``batch_size`` queued promotions in one transaction.
+
+    Tasks are claimed with SKIP LOCKED so several workers can run side by
+    side, and each slot's availability row is locked while its waitlist
+    head is promoted. Returns the number of tasks processed.
+    """
+    with transaction.atomic():
+        tasks = list(
+            PromotionTask.objects.select_for_update(skip_locked=True).order_by("id")[
+                :batch_size
+            ]
+        )
+        for task in tasks:
+            promote_slot(task.doctor_id, task.date, task.time_slot_id)
+        PromotionTask.objects.filter(id__in=[task.id for task in tasks]).delete()
+    return len(tasks)
+
+
+def promote_slot(doctor_id, date, time_slot_id):
+    """Give a vacant slot to the head of its waitlist, or free it."""
+    slot = dict(doctor_id=doctor_id, date=date, time_slot_id=time_slot_id)
+    list(Availability.objects.select_for_update().filter(**slot))
+    if Appointment.objects.filter(**slot).exists():
+        # Already handled by an earlier task for the same slot.
+        return None
+
+    promoted = _promote_waitlist(doctor_id, date, time_slot_id)
+    Availability.objects.filter(**slot).update(is_available=promoted is None)
+    if promoted is None:
+        doctor_days.mark_free(doctor_id, date, [time_slot_id])
+    else:
+        doctor_days.mark_booked(doctor_id, date, [time_slot_id])
+        stats.record(doctor_id, date, booked=1)
+    notify_slot_changed(
+        doctor_id,
+        date,
+        [time_slot_id],
+        SlotChange.FREED if promoted is None else SlotChange.PROMOTED,
+    )
+    return promoted
+
+
+def _promote_waitlist(doctor_id, date, time_slot_id):
+    entries = Waitlist.objects.filter(
+        doctor_id=doctor_id, date=date, time_slot_id=time_slot_id
+    ).order_by("added_at", "id")
+
+    # Take the head one row at a time; the queue index makes each probe cheap.
+    while True:
+        entry = entries.first()
+        if entry is None:
+            return None
+        try:
+            with transaction.atomic():
+                appointment = Appointment.objects.create(
+                    patient_id=entry.patient_id,
+                    doctor_id=doctor_id,
+                    date=date,
+                    time_slot_id=time_slot_id,
+                )
+        except IntegrityError:
+            # The patient has since booked another appointment at this time.
+            appointment = None
+        entry.delete()
+        stats.record(doctor_id, date, waitlisted=-1)
+        if appointment is not None:
+            return appointment
@@ -0,0 +1,124 @@
+"""
+Booking windows: batching concurrent bookings of one doctor-day.
+
+With settings.BOOKING_WINDOW set to a number of seconds, a booking for a
+doctor-day that another request of this process is already booking does
+not race it for the same rows. It joins a window instead. The first
+request to join waits out the window, then books everyone in it, in
+arrival order, in one transaction. Each request still gets the outcome
+book_slot would have given it, but the day's rows are locked once per
+window instead of once per request, and the waitlist is filled in the
+order requests arrived. A booking with nothing else in flight for its day
+runs straight away.
+
+Windows only gather the requests of one process; requests served by other
+processes compete for the rows as usual.
+
+A request that has waited settings.BOOKING_WINDOW_TIMEOUT seconds without
+being booked, because the request leading its window died, leaves the
+window and books on its own. If the leader had already taken it for
+booking, the outcome is unknown and TimeoutError is raised instead.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .booking import book_slot
+
+_window = None
+
+
+class _Pending:
+    def __init__(self, patient_id, time_slot_id):
+        self.patient_id = patient_id
+        self.time_slot_id = time_slot_id
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BookingWindow:
+    def __init__(self, interval, timeout=10):
+        self.interval = interval
+        self.timeout = timeout
+        self._in_flight = {}
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def book(self, patient_id, doctor_id, date, time_slot_id):
+        """book_slot, batched with the other bookings of a busy doctor-day."""
+        day = (doctor_id, str(date))
+        with self._lock:
+            busy = self._in_flight.get(day, 0)
+            self._in_flight[day] = busy + 1
+            if busy:
+                pending = _Pending(patient_id, time_slot_id)
+                window = self._windows.setdefault(day, [])
+                window.append(pending)
+                leader = len(window) == 1
+        try:
+            if not busy:
+                return book_slot(patient_id, doctor_id, date, time_slot_id)
+            if leader:
+                time.sleep(self.interval)
+                with self._lock:
+                    window = self._windows.pop(day)
+                self._allocate(doctor_id, date, window)
+            if not pending.done.wait(self.interval + self.timeout):
+                return self._withdraw(day, pending, doctor_id, date)
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+        finally:
+            with self._lock:
+                self._in_flight[day] -= 1
+                if not self._in_flight[day]:
+                    del self._in_flight[day]
+
+    def _withdraw(self, day, pending, doctor_id, date):
+        with self._lock:
+            window = self._windows.get(day, [])
+            waiting = any(entry is pending for entry in window)
+            if waiting:
+                window.remove(pending)
+                if not window:
+                    del self._windows[day]
+        if not waiting:
+            raise TimeoutError(f"Booking window for {day} did not finish")
+        return book_slot(pending.patient_id, doctor_id, date, pending.time_slot_id)
+
+    def _allocate(self, doctor_id, date, window):
+        try:
+            with transaction.atomic():
+                for pending in window:
+                    try:
+                        # A savepoint each, so one failed booking does not
+                        # undo the others.
+                        with transaction.atomic():
+                            pending.result = book_slot(
+                                pending.patient_id, doctor_id, date, pending.time_slot_id
+                            )
+                    except Exception as error:
+                        pending.error = error
+        except Exception as error:
+            # The commit failed: nothing in the window was booked.
+            for pending in window:
+                pending.result, pending.error = None, error
+        finally:
+            for pending in window:
+                pending.done.set()
+
+
+def get_booking_window():
+    """The process's BookingWindow, or None when windows are disabled."""
+    global _window
+    interval = getattr(settings, "BOOKING_WINDOW", None)
+    if not interval:
+        return None
+    timeout = getattr(settings, "BOOKING_WINDOW_TIMEOUT", 10)
+    if _window is None or (_window.interval, _window.timeout) != (interval, timeout):
+        _window = BookingWindow(interval, timeout)
+    return _window
@@ -0,0 +1,191 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .db_routers import primary_reads
+from .models import TimeSlot
+from .signals import slot_changed
+
+
+class AvailabilityCache:
+    """
+    Read-through cache for availability reads.
+
+    Entries are scoped to a (doctor, date) pair, or to the global listing,
+    and their keys embed that scope's generation counter. Writers bump the
+    counters instead of deleting entries, so a stale entry is simply never
+    looked up again and expires on its own; nothing is ever flushed.
+
+    The generations, with the time of the last bump, also serve as HTTP
+    validators (see ``validators``).
+    """
+
+    prefix = "availability"
+
+    def __init__(self, alias="default", timeout=300, prefix=None):
+        self.alias = alias
+        self.timeout = timeout
+        if prefix is not None:
+            self.prefix = prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _generation_key(self, scope):
+        if scope is None:
+            return f"{self.prefix}:gen"
+        doctor_id, date = scope
+        return f"{self.prefix}:gen:{doctor_id}:{date.isoformat()}"
+
+    def _changed_key(self, scope):
+        return self._generation_key(scope).replace(":gen", ":changed", 1)
+
+    def generation(self, scope=None):
+        key = self._generation_key(scope)
+        value = self.cache.get(key)
+        if value is None:
+            # Seed from the clock so a counter lost to eviction or a restart
+            # never comes back with a value an old entry was stored under.
+            self.cache.add(key, time.time_ns() // 1000, timeout=None)
+            value = self.cache.get(key)
+        return value
+
+    def _bump(self, scope):
+        key = self._generation_key(scope)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, time.time_ns() // 1000, timeout=None)
+        self.cache.set(self._changed_key(scope), time.time(), timeout=None)
+
+    def invalidate(self, doctor_id, date):
+        self._bump((doctor_id, date))
+        self._bump(None)
+
+    def invalidate_all(self):
+        self._bump(None)
+
+    def validators(self, scope=None):
+        """
+        (generation, changed_at) of a scope, read in one round trip.
+        ``changed_at`` is the Unix time of the last bump; when it or the
+        generation has been lost it restarts from now, which can only make
+        clients refetch.
+        """
+        generation_key, changed_key = self._generation_key(scope), self._changed_key(scope)
+        values = self.cache.get_many([generation_key, changed_key])
+        if generation_key in values and changed_key in values:
+            return values[generation_key], values[changed_key]
+        generation = self.generation(scope)
+        if generation_key not in values:
+            self.cache.set(changed_key, time.time(), timeout=None)
+        else:
+            self.cache.add(changed_key, time.time(), timeout=None)
+        return generation, self.cache.get(changed_key)
+
+    def _data_key(self, scope, generation, params):
+        digest = hashlib.md5(params.encode()).hexdigest()
+        scope_key = "all" if scope is None else f"{scope[0]}:{scope[1].isoformat()}"
+        return f"{self.prefix}:data:{scope_key}:{generation}:{digest}"
+
+    def get_or_set(self, scope, params, producer):
+        key = self._data_key(scope, self.generation(scope), params)
+
+        value = self.cache.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        self._count("misses")
+        # The entry is stored under the generation the primary's last
+        # commit set, so it must not be built from a lagging replica.
+        with primary_reads():
+            value = producer()
+        self.cache.set(key, value, self.timeout)
+        return value
+
+    async def ageneration(self, scope=None):
+        key = self._generation_key(scope)
+        value = await self.cache.aget(key)
+        if value is None:
+            await self.cache.aadd(key, time.time_ns() // 1000, timeout=None)
+            value = await self.cache.aget(key)
+        return value
+
+    async def avalidators(self, scope=None):
+        generation_key, changed_key = self._generation_key(scope), self._changed_key(scope)
+        values = await self.cache.aget_many([generation_key, changed_key])
+        if generation_key in values and changed_key in values:
+            return values[generation_key], values[changed_key]
+        generation = await self.ageneration(scope)
+        if generation_key not in values:
+            await self.cache.aset(changed_key, time.time(), timeout=None)
+        else:
+            await self.cache.aadd(changed_key, time.time(), timeout=None)
+        return generation, await self.cache.aget(changed_key)
+
+    async def aget_or_set(self, scope, params, producer):
+        """get_or_set for async views; ``producer`` is a coroutine function."""
+        key = self._data_key(scope, await self.ageneration(scope), params)
+
+        value = await self.cache.aget(key)
+        if value is not None:
+            await self._acount("hits")
+            return value
+
+        await self._acount("misses")
+        with primary_reads():
+            value = await producer()
+        await self.cache.aset(key, value, self.timeout)
+        return value
+
+    async def _acount(self, name):
+        key = f"{self.prefix}:{name}"
+        try:
+            await self.cache.aincr(key)
+        except ValueError:
+            if not await self.cache.aadd(key, 1, timeout=None):
+                await self.cache.aincr(key)
+
+    def _count(self, name):
+        key = f"{self.prefix}:{name}"
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            if not self.cache.add(key, 1, timeout=None):
+                self.cache.incr(key)
+
+    def stats(self):
+        values = self.cache.get_many([f"{self.prefix}:hits", f"{self.prefix}:misses"])
+        return {
+            "hits": values.get(f"{self.prefix}:hits", 0),
+            "misses": values.get(f"{self.prefix}:misses", 0),
+        }
+
+
+availability_cache = AvailabilityCache(
+    alias=getattr(settings, "AVAILABILITY_CACHE_ALIAS", "default"),
+    timeout=getattr(settings, "AVAILABILITY_CACHE_TIMEOUT", 300),
+)
+
+# Only versions the time slot table for conditional requests; time slots
+# are not cached.
+timeslot_versions = AvailabilityCache(
+    alias=getattr(settings, "AVAILABILITY_CACHE_ALIAS", "default"), prefix="timeslot"
+)
+
+
+@receiver(slot_changed)
+def invalidate_availability(sender, doctor_id, date, **kwargs):
+    availability_cache.invalidate(doctor_id, date)
+
+
+@receiver(post_save, sender=TimeSlot)
+@receiver(post_delete, sender=TimeSlot)
+def invalidate_timeslots(sender, **kwargs):
+    timeslot_versions.invalidate_all()
@@ -0,0 +1,66 @@
+"""
+Columnar list responses, selected with ``?format=columnar`` or by
+accepting ColumnarRenderer's media type.
+
+Instead of one object per row, a page is one object of parallel arrays,
+``{"id": [...], "date": [...], ...}``, so each key is sent once per page.
+Rows are read with values_list() and never become model instances or
+pass through a serializer. Availability can also be sent as bitmasks,
+``{doctor: {date: mask}}``, with bit i set when the slot starting
+i * SLOT_MINUTES minutes after midnight is free.
+"""
+
+from .doctor_days import SLOT_MINUTES, slot_bit
+
+FORMAT = "columnar"
+LAYOUTS = ("columns", "bitmask")
+
+# (key in the response, values_list() field), matching what
+# AvailabilitySerializer and AppointmentSerializer return per row.
+AVAILABILITY_COLUMNS = (
+    ("id", "id"),
+    ("doctor", "doctor_id"),
+    ("doctor_name", "doctor__user__username"),
+    ("date", "date"),
+    ("time_slot", "time_slot_id"),
+    ("start_time", "start_time"),
+    ("end_time", "time_slot__end_time"),
+    ("is_available", "is_available"),
+)
+APPOINTMENT_COLUMNS = (
+    ("id", "id"),
+    ("doctor", "doctor_id"),
+    ("doctor_name", "doctor__user__username"),
+    ("patient", "patient_id"),
+    ("patient_name", "patient__user__username"),
+    ("date", "date"),
+    ("time_slot", "time_slot_id"),
+    ("start_time", "time_slot__start_time"),
+    ("end_time", "time_slot__end_time"),
+)
+# What the bitmask layout reads, plus what KeysetPagination pages on.
+MASK_FIELDS = ("id", "doctor_id", "date", "start_time")
+
+
+def fields(columns):
+    return [field for _, field in columns]
+
+
+def to_columns(rows, columns):
+    """Parallel arrays, one per column, from values_list() rows."""
+    if not rows:
+        return {key: [] for key, _ in columns}
+    return {key: list(values) for (key, _), values in zip(columns, zip(*rows))}
+
+
+def to_masks(rows):
+    """
+    {doctor id: {ISO date: mask}} from (id, doctor_id, date, start_time)
+    rows. Slots that do not start on the SLOT_MINUTES grid are left out.
+    """
+    masks = {}
+    for _, doctor_id, date, start_time in rows:
+        days = masks.setdefault(str(doctor_id), {})
+        day = date.isoformat()
+        days[day] = days.get(day, 0) | slot_bit(start_time)
+    return {"slot_minutes": SLOT_MINUTES, "doctors": masks}
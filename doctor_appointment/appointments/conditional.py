@@ -0,0 +1,57 @@
+"""
+Conditional GET for the cached read endpoints.
+
+The ETag and Last-Modified of a response come from the generation counter
+of the cache scope it was built from (see AvailabilityCache.validators),
+so deciding on a 304 costs one cache round trip and never touches the
+database or a serializer.
+"""
+
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def _validators(versions, scope, generation, changed_at, variant):
+    scope_key = "all" if scope is None else f"{scope[0]}:{scope[1].isoformat()}"
+    # The variant (e.g. the renderer) is hashed so that ETags stay short
+    # and free of characters that need quoting.
+    digest = hashlib.md5(variant.encode()).hexdigest()[:8]
+    etag = quote_etag(f"{versions.prefix}:{scope_key}:{generation}:{digest}")
+    # HTTP dates have one-second resolution; the ETag, which clients
+    # prefer when they have both, tells apart changes within a second.
+    return etag, int(changed_at)
+
+
+def _finish(response, etag, last_modified):
+    if response.status_code not in (200, 304):
+        return response
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Cacheable by the client only, and only after revalidating.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_response(request, versions, scope, respond, variant=""):
+    """
+    A 304 when the client's validators match ``scope``'s current version,
+    otherwise the response built by calling ``respond()``, with validators.
+    """
+    etag, last_modified = _validators(versions, scope, *versions.validators(scope), variant)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = respond()
+    return _finish(response, etag, last_modified)
+
+
+async def aconditional_response(request, versions, scope, respond, variant=""):
+    """conditional_response for async views; ``respond`` is a coroutine function."""
+    etag, last_modified = _validators(
+        versions, scope, *await versions.avalidators(scope), variant
+    )
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await respond()
+    return _finish(response, etag, last_modified)
@@ -0,0 +1,133 @@
+"""
+Primary/replica routing.
+
+ReplicaRoutingMiddleware marks a request as replica-safe when it is a
+safe-method request for one of settings.REPLICA_READ_VIEWS and the client
+has not written recently; PrimaryReplicaRouter then sends that request's reads to
+a replica. Everything else, including any read inside a transaction or
+after a write in the same request, stays on the primary.
+"""
+
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import Resolver404, resolve
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+replica_reads = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def primary_reads():
+    """Send the reads made inside the block to the primary."""
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not replica_reads.get():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Read your own writes for the rest of the request. Returning the
+        # alias (not None) also keeps Django from saving an instance back
+        # to the replica it was read from.
+        replica_reads.set(False)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            # Replicas receive the schema through replication.
+            return False
+        return None
+
+
+def pin_key(request):
+    """
+    Cache key identifying the client by its credentials, or None for
+    anonymous requests. JWT authentication runs inside the view, after the
+    routing decision, so the token stands in for the user here.
+    """
+    credentials = request.headers.get("Authorization") or request.COOKIES.get(
+        settings.SESSION_COOKIE_NAME
+    )
+    if not credentials:
+        return None
+    return "replica-pin:" + hashlib.md5(credentials.encode()).hexdigest()
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def replica_safe(self, request):
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return False
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return False
+        return url_name in settings.REPLICA_READ_VIEWS
+
+    def should_pin(self, request, response):
+        """Keep a client that just wrote on the primary for a while."""
+        return (
+            bool(settings.DATABASE_REPLICAS)
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        key = pin_key(request)
+        use_replica = self.replica_safe(request) and not (key and cache.get(key))
+        token = replica_reads.set(use_replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+
+        if key and self.should_pin(request, response):
+            cache.set(key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        key = pin_key(request)
+        use_replica = self.replica_safe(request) and not (key and await cache.aget(key))
+        token = replica_reads.set(use_replica)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+
+        if key and self.should_pin(request, response):
+            await cache.aset(key, True, settings.REPLICA_PIN_SECONDS)
+        return response
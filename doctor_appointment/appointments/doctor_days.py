@@ -0,0 +1,177 @@
+"""
+Bitmask view of a doctor's day, kept in step with Availability and
+Appointment by the write paths in booking.py, schedule.py and views.py.
+
+Free-slot questions ("who is free at 14:00 on X", "first free slot for Y
+this week") then read one DoctorDay row per doctor-day instead of one
+Availability row per slot.
+"""
+
+from datetime import time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Appointment, Availability, DoctorDay, TimeSlot
+
+SLOT_MINUTES = 30
+
+
+def slot_bit(start_time):
+    """
+    Bit for a slot starting at ``start_time``, or 0 for starts that are not
+    on the half-hour grid (those slots are not represented).
+    """
+    minutes = start_time.hour * 60 + start_time.minute
+    if minutes % SLOT_MINUTES:
+        return 0
+    return 1 << (minutes // SLOT_MINUTES)
+
+
+def bit_time(index):
+    minutes = index * SLOT_MINUTES
+    return time(minutes // 60, minutes % 60)
+
+
+def set_bits(mask):
+    index = 0
+    while mask:
+        if mask & 1:
+            yield index
+        mask >>= 1
+        index += 1
+
+
+def lowest_bit(mask):
+    return (mask & -mask).bit_length() - 1
+
+
+def slots_mask(time_slot_ids):
+    """
+    Combined bit mask of the given time slots. Start times are read from
+    the database every time: a copy held by one process would miss edits
+    made by others, or through QuerySet.update().
+    """
+    mask = 0
+    for start_time in TimeSlot.objects.filter(id__in=set(time_slot_ids)).values_list(
+        "start_time", flat=True
+    ):
+        mask |= slot_bit(start_time)
+    return mask
+
+
+def _apply(doctor_id, date, time_slot_ids, free=None, booked=None):
+    """Set (True) or clear (False) the slots' bits in either mask."""
+    mask = slots_mask(time_slot_ids)
+    if not mask:
+        return
+    changes = {}
+    for field, value in (("free_mask", free), ("booked_mask", booked)):
+        if value is True:
+            changes[field] = F(field).bitor(mask)
+        elif value is False:
+            changes[field] = F(field).bitand(~mask)
+    if not DoctorDay.objects.filter(doctor_id=doctor_id, date=date).update(**changes):
+        refresh_doctor_day(doctor_id, date)
+
+
+def mark_free(doctor_id, date, time_slot_ids):
+    _apply(doctor_id, date, time_slot_ids, free=True, booked=False)
+
+
+def mark_booked(doctor_id, date, time_slot_ids):
+    _apply(doctor_id, date, time_slot_ids, free=False, booked=True)
+
+
+def mark_reserved(doctor_id, date, time_slot_ids):
+    """Neither bookable nor booked, e.g. held for the waitlist."""
+    _apply(doctor_id, date, time_slot_ids, free=False, booked=False)
+
+
+def refresh_doctor_day(doctor_id, date):
+    """Recompute one doctor-day from the base tables."""
+    free = booked = 0
+    for start_time in Availability.objects.filter(
+        doctor_id=doctor_id, date=date, is_available=True
+    ).values_list("start_time", flat=True):
+        free |= slot_bit(start_time)
+    for start_time in Appointment.objects.filter(doctor_id=doctor_id, date=date).values_list(
+        "time_slot__start_time", flat=True
+    ):
+        booked |= slot_bit(start_time)
+
+    try:
+        with transaction.atomic():
+            DoctorDay.objects.update_or_create(
+                doctor_id=doctor_id,
+                date=date,
+                defaults={"free_mask": free, "booked_mask": booked},
+            )
+    except IntegrityError:
+        # Created concurrently; the other writer's row is just as fresh.
+        DoctorDay.objects.filter(doctor_id=doctor_id, date=date).update(
+            free_mask=free, booked_mask=booked
+        )
+
+
+def refresh_doctor_days(doctor_id, dates):
+    """
+    Recompute many of a doctor's days with two reads and one upsert, for
+    bulk writers that would otherwise pay several queries per day.
+    """
+    dates = set(dates)
+    if not dates:
+        return
+    masks = {date: [0, 0] for date in dates}
+    span = dict(doctor_id=doctor_id, date__gte=min(dates), date__lte=max(dates))
+    for date, start_time in Availability.objects.filter(
+        is_available=True, **span
+    ).values_list("date", "start_time"):
+        if date in masks:
+            masks[date][0] |= slot_bit(start_time)
+    for date, start_time in Appointment.objects.filter(**span).values_list(
+        "date", "time_slot__start_time"
+    ):
+        if date in masks:
+            masks[date][1] |= slot_bit(start_time)
+
+    DoctorDay.objects.bulk_create(
+        [
+            DoctorDay(doctor_id=doctor_id, date=date, free_mask=free, booked_mask=booked)
+            for date, (free, booked) in masks.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["doctor", "date"],
+        update_fields=["free_mask", "booked_mask"],
+    )
+
+
+def free_doctors(date, start_time):
+    """Ids of the doctors with a bookable slot at ``start_time`` on ``date``."""
+    bit = slot_bit(start_time)
+    if not bit:
+        return []
+    return list(
+        DoctorDay.objects.filter(date=date)
+        .alias(hit=F("free_mask").bitand(bit))
+        .filter(hit__gt=0)
+        .order_by("doctor_id")
+        .values_list("doctor_id", flat=True)
+    )
+
+
+def first_free(doctor_id, date_from, days=7):
+    """(date, start_time) of the doctor's first bookable slot, or None."""
+    rows = (
+        DoctorDay.objects.filter(
+            doctor_id=doctor_id,
+            date__gte=date_from,
+            date__lt=date_from + timedelta(days=days),
+            free_mask__gt=0,
+        )
+        .order_by("date")
+        .values_list("date", "free_mask")
+    )
+    for date, free_mask in rows[:1]:
+        return date, bit_time(lowest_bit(free_mask))
+    return None
@@ -0,0 +1,213 @@
+"""
+Availability change events for the server-sent events stream.
+
+Every slot_changed signal becomes an Event published to the configured
+broker (settings.AVAILABILITY_EVENT_BROKER), which hands it to the
+streams subscribed in this process and keeps the most recent events so a
+reconnecting client can resume from the last event id it saw.
+
+InProcessBroker is enough when every stream is served by the process that
+handles the writes. With several processes, use a broker backed by a
+shared message bus with the same four methods.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .signals import slot_changed
+
+RESET = "reset"
+
+_broker = None
+
+
+class Event(namedtuple("Event", ["sequence", "id", "doctor_id", "date", "time_slot_ids", "change"])):
+    def encode(self):
+        data = json.dumps(
+            {
+                "doctor": self.doctor_id,
+                "date": self.date.isoformat(),
+                "time_slots": self.time_slot_ids,
+                "change": self.change,
+            }
+        )
+        return f"id: {self.id}\nevent: {self.change}\ndata: {data}\n\n"
+
+
+def reset_message():
+    """Tells the client it may have missed events and should refetch."""
+    return f"event: {RESET}\ndata: {{}}\n\n"
+
+
+class Subscription:
+    """A stream's queue of events, fed from whichever thread publishes."""
+
+    def __init__(self, maxsize):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The stream's event loop has closed; it is about to unsubscribe.
+            pass
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class EventBroker:
+    """Interface of the pluggable event brokers."""
+
+    def publish(self, doctor_id, date, time_slot_ids, change):
+        raise NotImplementedError
+
+    def replay(self, last_event_id):
+        """
+        The events published after ``last_event_id``, or None when some of
+        them can no longer be replayed.
+        """
+        raise NotImplementedError
+
+    def subscribe(self):
+        """A new Subscription receiving every event published from now on."""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class InProcessBroker(EventBroker):
+    """
+    Fans events out to this process's subscribers and keeps the last
+    ``buffer_size`` for replay. Event ids are prefixed with a per-process
+    epoch, so an id issued by another process or before a restart is
+    recognised and answered with a reset instead of a wrong replay.
+    """
+
+    def __init__(self, buffer_size=1000, queue_size=1000):
+        self.epoch = format(time.time_ns(), "x")
+        self.queue_size = queue_size
+        self._sequence = 0
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, doctor_id, date, time_slot_ids, change):
+        with self._lock:
+            self._sequence += 1
+            event = Event(
+                self._sequence,
+                f"{self.epoch}-{self._sequence}",
+                doctor_id,
+                date,
+                time_slot_ids,
+                change,
+            )
+            self._buffer.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return event
+
+    def replay(self, last_event_id):
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        with self._lock:
+            if sequence > self._sequence:
+                return None
+            # Events up to the oldest buffered one's predecessor are gone.
+            oldest = self._buffer[0].sequence if self._buffer else self._sequence + 1
+            if sequence < oldest - 1:
+                return None
+            return [event for event in self._buffer if event.sequence > sequence]
+
+    def subscribe(self):
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        broker_class = import_string(
+            getattr(settings, "AVAILABILITY_EVENT_BROKER", "appointments.events.InProcessBroker")
+        )
+        _broker = broker_class(**getattr(settings, "AVAILABILITY_EVENT_BROKER_OPTIONS", {}))
+    return _broker
+
+
+@receiver(slot_changed)
+def publish_slot_change(sender, doctor_id, date, time_slot_ids, change, **kwargs):
+    get_broker().publish(doctor_id, date, time_slot_ids, change)
+
+
+def _matches(event, doctor_ids, date_from, date_to):
+    return (
+        (not doctor_ids or event.doctor_id in doctor_ids)
+        and (date_from is None or event.date >= date_from)
+        and (date_to is None or event.date <= date_to)
+    )
+
+
+async def event_stream(
+    broker, last_event_id=None, doctor_ids=None, date_from=None, date_to=None, heartbeat=15
+):
+    """
+    Server-sent events for the matching changes: first those missed since
+    ``last_event_id``, then new ones as they are published. A comment line
+    is sent after ``heartbeat`` idle seconds so proxies keep the connection
+    open and dead clients are noticed.
+    """
+    # Subscribe before replaying so nothing published in between is lost;
+    # events seen in both are skipped by sequence.
+    subscription = broker.subscribe()
+    try:
+        replayed = 0
+        if last_event_id:
+            missed = broker.replay(last_event_id)
+            if missed is None:
+                yield reset_message()
+            else:
+                for event in missed:
+                    replayed = event.sequence
+                    if _matches(event, doctor_ids, date_from, date_to):
+                        yield event.encode()
+
+        while True:
+            try:
+                event = await subscription.get(heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if subscription.overflowed:
+                # Events were dropped while this client was not reading.
+                subscription.overflowed = False
+                yield reset_message()
+            if event.sequence > replayed and _matches(event, doctor_ids, date_from, date_to):
+                yield event.encode()
+    finally:
+        broker.unsubscribe(subscription)
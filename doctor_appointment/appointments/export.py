@@ -0,0 +1,99 @@
+"""
+Streaming export of appointments as CSV or newline-delimited JSON.
+
+Rows are read with values_list() in keyset-paginated chunks, so neither
+model instances nor the whole result set are ever held in memory, and each
+row is encoded to one line as it is read. Unlike iterator(), this needs no
+server-side cursor, which a transaction-pooling PgBouncer cannot keep open
+between queries. The export endpoint and the export_appointments
+command both write the lines produced here.
+"""
+
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import Appointment
+
+FORMATS = ("csv", "ndjson")
+CONTENT_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# (column name, field path) pairs, in output order.
+COLUMNS = (
+    ("id", "id"),
+    ("date", "date"),
+    ("start_time", "time_slot__start_time"),
+    ("end_time", "time_slot__end_time"),
+    ("doctor_id", "doctor_id"),
+    ("doctor_name", "doctor__user__username"),
+    ("patient_id", "patient_id"),
+    ("patient_name", "patient__user__username"),
+)
+HEADER = [name for name, _ in COLUMNS]
+FIELDS = [path for _, path in COLUMNS]
+
+
+def export_rows(queryset=None, date_from=None, date_to=None, doctor_id=None, chunk_size=2000):
+    """
+    Tuples of COLUMNS for the matching appointments in (date, start time)
+    order, fetched ``chunk_size`` at a time.
+    """
+    if queryset is None:
+        queryset = Appointment.objects.all()
+    if date_from is not None:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(date__lte=date_to)
+    if doctor_id is not None:
+        queryset = queryset.filter(doctor_id=doctor_id)
+    queryset = queryset.order_by("date", "time_slot__start_time", "id").values_list(*FIELDS)
+
+    position = None
+    while True:
+        chunk = queryset
+        if position is not None:
+            chunk = chunk.filter(_after(*position))
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        row_id, row_date, start_time = rows[-1][:3]
+        position = (row_date, start_time, row_id)
+
+
+def _after(row_date, start_time, row_id):
+    """Rows strictly after a position in (date, start time, id) order."""
+    return Q(date__gte=row_date) & (
+        Q(date__gt=row_date)
+        | Q(date=row_date, time_slot__start_time__gt=start_time)
+        | Q(date=row_date, time_slot__start_time=start_time, id__gt=row_id)
+    )
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    for row in rows:
+        yield encoder.encode(dict(zip(HEADER, row))) + "\n"
+
+
+def export_lines(rows, format):
+    if format == "csv":
+        return csv_lines(rows)
+    if format == "ndjson":
+        return ndjson_lines(rows)
+    raise ValueError(f"Unknown format {format!r}; expected one of {FORMATS}")
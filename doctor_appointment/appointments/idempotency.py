@@ -0,0 +1,188 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client that may retry a write sends the same ``Idempotency-Key`` header
+with every attempt. The first attempt runs and its response is stored for
+settings.IDEMPOTENCY_KEY_TTL seconds; later attempts get the stored
+response back, marked with ``Idempotent-Replayed: true``, without running
+the view again. An attempt that arrives while the first is still running
+waits for its response instead of racing it.
+
+Keys are scoped to the user, and a key is bound to the request it was
+first used with: reusing it for a different method, path or body is
+rejected with 422. Server errors and exceptions are not stored, so such an
+attempt can be retried under the same key.
+
+Responses live in the cache, so with several processes the cache named by
+settings.IDEMPOTENCY_CACHE must be shared by all of them.
+"""
+
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# Response headers worth replaying; the rest are recomputed per response.
+STORED_HEADERS = ("Location",)
+
+
+class IdempotencyStore:
+    """
+    Stored responses and in-flight locks, both kept in a cache.
+
+    A lock is taken with cache.add, which only one of several concurrent
+    callers can win. It expires after ``lock_timeout`` seconds, so a
+    process that dies mid-request does not hold its key forever.
+    """
+
+    prefix = "idempotency"
+
+    def __init__(self, alias="default", ttl=86400, lock_timeout=30, wait=10, poll_interval=0.05):
+        self.alias = alias
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+        self.poll_interval = poll_interval
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, scope, idempotency_key):
+        # Hashed so any client-chosen key is a valid cache key.
+        digest = hashlib.sha256(idempotency_key.encode()).hexdigest()
+        return f"{self.prefix}:{scope}:{digest}"
+
+    def get(self, key):
+        return self.cache.get(f"{key}:response")
+
+    def acquire(self, key):
+        return self.cache.add(f"{key}:lock", 1, self.lock_timeout)
+
+    def release(self, key):
+        self.cache.delete(f"{key}:lock")
+
+    def save(self, key, record):
+        self.cache.set(f"{key}:response", record, self.ttl)
+        self.release(key)
+
+    def claim(self, key):
+        """
+        The stored record for ``key``, or None once the caller holds its
+        lock. Polls while another request holds it, for up to ``wait``
+        seconds; raises TimeoutError if it is still held after that.
+        """
+        deadline = time.monotonic() + self.wait
+        while True:
+            record = self.get(key)
+            if record is not None:
+                return record
+            if self.acquire(key):
+                # The holder may have stored its response and released the
+                # lock between the two calls above.
+                record = self.get(key)
+                if record is not None:
+                    self.release(key)
+                return record
+            if time.monotonic() >= deadline:
+                raise TimeoutError(key)
+            time.sleep(self.poll_interval)
+
+
+idempotency_store = IdempotencyStore(
+    alias=getattr(settings, "IDEMPOTENCY_CACHE", "default"),
+    ttl=getattr(settings, "IDEMPOTENCY_KEY_TTL", 86400),
+    lock_timeout=getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 30),
+    wait=getattr(settings, "IDEMPOTENCY_WAIT", 10),
+)
+
+
+def is_replay(request):
+    """Whether the request's Idempotency-Key already has a stored response."""
+    idempotency_key = request.headers.get(HEADER)
+    if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+        return False
+    key = idempotency_store.key(request.user.pk, idempotency_key)
+    return idempotency_store.get(key) is not None
+
+
+def fingerprint(request, args, kwargs):
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    body = json.dumps([args, kwargs, data], sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode()).hexdigest()
+
+
+def idempotent(handler):
+    """
+    Make a viewset write action honour the Idempotency-Key header.
+
+    Requests without the header run as usual. Nested calls for the same
+    request, like partial_update calling update, run straight through.
+    """
+
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        idempotency_key = request.headers.get(HEADER)
+        if idempotency_key is None or getattr(request, "idempotency_key", None) is not None:
+            return handler(self, request, *args, **kwargs)
+        if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH or not idempotency_key.isprintable():
+            return Response(
+                {"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} printable characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        request.idempotency_key = idempotency_key
+
+        key = idempotency_store.key(request.user.pk, idempotency_key)
+        request_fingerprint = fingerprint(request, args, kwargs)
+        try:
+            record = idempotency_store.claim(key)
+        except TimeoutError:
+            return Response(
+                {"error": f"A request with this {HEADER} is still in progress."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        if record is None:
+            try:
+                response = handler(self, request, *args, **kwargs)
+            except BaseException:
+                idempotency_store.release(key)
+                raise
+            if response.status_code >= 500 or not isinstance(response, Response):
+                idempotency_store.release(key)
+                return response
+            idempotency_store.save(
+                key,
+                {
+                    "fingerprint": request_fingerprint,
+                    "status": response.status_code,
+                    "data": response.data,
+                    "headers": {
+                        name: response[name] for name in STORED_HEADERS if response.has_header(name)
+                    },
+                },
+            )
+            return response
+
+        if record["fingerprint"] != request_fingerprint:
+            return Response(
+                {"error": f"This {HEADER} was already used for a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return Response(
+            record["data"],
+            status=record["status"],
+            headers={**record["headers"], REPLAYED_HEADER: "true"},
+        )
+
+    return wrapper
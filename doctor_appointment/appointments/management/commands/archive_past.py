@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from appointments.archive import archive_past
+
+
+class Command(BaseCommand):
+    help = (
+        "Move appointments older than --keep-days into the archive table and "
+        "delete availability and waitlist rows for those dates"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-days",
+            type=int,
+            default=30,
+            help="Days before today to keep in the live tables (default 30).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows moved per transaction (default 5000).",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.localdate() - timedelta(days=options["keep_days"])
+        summary = archive_past(before, options["batch_size"])
+
+        for name in summary["dropped_partitions"]:
+            self.stderr.write(f"Dropped empty partition {name}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {summary['appointments']} appointments and deleted "
+                f"{summary['availability']} availability and {summary['waitlist']} "
+                f"waitlist rows dated before {before}"
+            )
+        )
@@ -0,0 +1,345 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time as clock
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from appointments.models import (
+    Availability,
+    CustomUser,
+    Doctor,
+    Patient,
+    TimeSlot,
+)
+from appointments.serializers import RoleTokenObtainPairSerializer
+
+PASSWORD = "bench-password"
+SCENARIOS = ["token", "availability_list", "timeslots", "book", "search"]
+INTERFACES = ["wsgi", "asgi"]
+# Read endpoints with a native async implementation; everything else is
+# served by the ASGI handler running the sync view in a thread.
+ASYNC_ROUTES = {
+    "/api/availabilities/": "/api/async/availabilities/",
+    "/api/timeslots/": "/api/async/timeslots/",
+    "/api/appointments/search/": "/api/async/appointments/search/",
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and benchmark the booking, listing, search "
+        "and token endpoints, printing latency percentiles as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--doctors", type=int, default=20)
+        parser.add_argument("--days", type=int, default=14)
+        parser.add_argument("--patients", type=int, default=200)
+        parser.add_argument(
+            "--requests", type=int, default=500, help="Requests per scenario."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Concurrent clients."
+        )
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=SCENARIOS,
+            help="Scenario to run; repeat for several (default: all).",
+        )
+        parser.add_argument(
+            "--interface",
+            action="append",
+            choices=INTERFACES,
+            help=(
+                "Drive requests through the WSGI handler with a thread per client, "
+                "or through the ASGI handler from one event loop (using the async "
+                "views where they exist). Repeat to compare both (default: wsgi)."
+            ),
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1.")
+        self.random = random.Random(options["seed"])
+        self.tokens = {}
+        old_name = self.create_database()
+        setup_test_environment()
+        try:
+            self.seed(options["doctors"], options["days"], options["patients"])
+            report = {
+                "commit": self.git_commit(),
+                "database": connection.vendor,
+                "config": {
+                    key: options[key]
+                    for key in ("doctors", "days", "patients", "requests", "concurrency", "seed")
+                },
+                "scenarios": {},
+            }
+            for interface in options["interface"] or ["wsgi"]:
+                report["scenarios"][interface] = {
+                    name: self.run_scenario(
+                        name, interface, options["requests"], options["concurrency"]
+                    )
+                    for name in options["scenario"] or SCENARIOS
+                }
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if self.sqlite_dir is not None:
+                shutil.rmtree(self.sqlite_dir, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(output + "\n")
+        self.stdout.write(output)
+
+    def create_database(self):
+        """Create a test database so benchmarking never touches real data."""
+        old_name = connection.settings_dict["NAME"]
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        self.sqlite_dir = None
+        if connection.vendor == "sqlite":
+            # The shared in-memory database locks whole tables; a file lets
+            # concurrent clients wait on each other instead of failing. It
+            # gets its own directory rather than TEST["NAME"], which a
+            # running test suite may be using.
+            self.sqlite_dir = tempfile.mkdtemp(prefix="bench-")
+            test_settings["NAME"] = os.path.join(self.sqlite_dir, "bench.sqlite3")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        return old_name
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def seed(self, doctors, days, patients):
+        started = clock.perf_counter()
+        password = make_password(PASSWORD)
+
+        slots = []
+        current = datetime(2000, 1, 1, 9)
+        while current.hour < 21:
+            slots.append(
+                TimeSlot(
+                    start_time=current.time(),
+                    end_time=(current + timedelta(minutes=30)).time(),
+                )
+            )
+            current += timedelta(minutes=30)
+        self.slots = TimeSlot.objects.bulk_create(slots)
+
+        def users(prefix, count, **flags):
+            return CustomUser.objects.bulk_create(
+                CustomUser(
+                    username=f"{prefix}{i}",
+                    email=f"{prefix}{i}@bench.invalid",
+                    password=password,
+                    **flags,
+                )
+                for i in range(count)
+            )
+
+        self.doctors = Doctor.objects.bulk_create(
+            Doctor(user=user) for user in users("doctor", doctors, is_doctor=True)
+        )
+        self.patients = Patient.objects.bulk_create(
+            Patient(user=user) for user in users("patient", patients, is_patient=True)
+        )
+
+        today = timezone.localdate()
+        self.dates = [today + timedelta(days=offset) for offset in range(days)]
+        Availability.objects.bulk_create(
+            (
+                Availability(
+                    doctor=doctor, date=day, time_slot=slot, start_time=slot.start_time
+                )
+                for doctor in self.doctors
+                for day in self.dates
+                for slot in self.slots
+            ),
+            batch_size=2000,
+        )
+        self.stderr.write(
+            f"Seeded {len(self.doctors)} doctors x {days} days x {len(self.slots)} slots, "
+            f"{len(self.patients)} patients in {clock.perf_counter() - started:.1f}s"
+        )
+
+    def token(self, user):
+        # Tokens as issued by the token endpoint, with role claims; one per
+        # user, since issuing also records the refresh token.
+        if user.pk not in self.tokens:
+            access = RoleTokenObtainPairSerializer.get_token(user).access_token
+            self.tokens[user.pk] = f"Bearer {access}"
+        return self.tokens[user.pk]
+
+    def make_request(self, name):
+        """Return (method, path, data, headers) for one request of a scenario."""
+        patient = self.random.choice(self.patients)
+        if name == "token":
+            return (
+                "post",
+                "/api/api/token_obtain/",
+                {"username": patient.user.username, "password": PASSWORD},
+                {},
+            )
+        headers = {"Authorization": self.token(patient.user)}
+        if name == "availability_list":
+            path = "/api/availabilities/?page_size=50"
+            if self.random.random() < 0.5:
+                doctor = self.random.choice(self.doctors)
+                day = self.random.choice(self.dates)
+                path += f"&doctor={doctor.id}&date_from={day}&date_to={day}"
+            return "get", path, None, headers
+        if name == "timeslots":
+            return "get", "/api/timeslots/", None, headers
+        if name == "book":
+            data = {
+                "patient": patient.id,
+                "doctor": self.random.choice(self.doctors).id,
+                "date": self.random.choice(self.dates).isoformat(),
+                "time_slot": self.random.choice(self.slots).id,
+            }
+            return "post", "/api/appointments/", data, headers
+        if name == "search":
+            doctor = self.random.choice(self.doctors)
+            return "get", f"/api/appointments/search/?doctor={doctor.user.username}", None, headers
+        raise ValueError(name)
+
+    def run_scenario(self, name, interface, requests, concurrency):
+        # Build every request up front so the clients only measure the server.
+        plan = [self.make_request(name) for _ in range(requests)]
+        if interface == "asgi":
+            results, elapsed = asyncio.run(self.send_asgi(plan, concurrency))
+        else:
+            results, elapsed = self.send_wsgi(plan, concurrency)
+        return self.summarise(results, elapsed)
+
+    def send_wsgi(self, plan, concurrency):
+        pending = iter(enumerate(plan))
+        lock = threading.Lock()
+        results = [None] * len(plan)
+        failures = []
+
+        def send(client, request):
+            method, path, data, headers = request
+            counter = QueryCounter()
+            started = clock.perf_counter()
+            with connection.execute_wrapper(counter):
+                if method == "get":
+                    response = client.get(path, headers=headers)
+                else:
+                    response = client.post(
+                        path, data, content_type="application/json", headers=headers
+                    )
+            return clock.perf_counter() - started, response.status_code, counter.count
+
+        def run_client():
+            client = Client()
+            try:
+                while not failures:
+                    with lock:
+                        index, request = next(pending, (None, None))
+                    if request is None:
+                        return
+                    results[index] = send(client, request)
+            except Exception as exc:
+                failures.append(exc)
+            finally:
+                # Each client thread has its own connection; close it here,
+                # since no other thread may.
+                connection.close()
+
+        clients = [threading.Thread(target=run_client) for _ in range(concurrency)]
+        started = clock.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = clock.perf_counter() - started
+        if failures:
+            raise failures[0]
+        return results, elapsed
+
+    async def send_asgi(self, plan, concurrency):
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def send(request):
+            method, path, data, headers = request
+            route, _, query = path.partition("?")
+            if route in ASYNC_ROUTES:
+                path = ASYNC_ROUTES[route] + ("?" + query if query else "")
+            async with slots:
+                started = clock.perf_counter()
+                if method == "get":
+                    response = await client.get(path, headers=headers)
+                else:
+                    response = await client.post(
+                        path, data, content_type="application/json", headers=headers
+                    )
+            # Queries run on the ORM's worker thread, out of reach of a
+            # per-connection wrapper installed here.
+            return clock.perf_counter() - started, response.status_code, None
+
+        started = clock.perf_counter()
+        results = await asyncio.gather(*(send(request) for request in plan))
+        return results, clock.perf_counter() - started
+
+    def summarise(self, results, elapsed):
+        latencies = [latency * 1000 for latency, _, _ in results]
+        statuses = {}
+        for _, status_code, _ in results:
+            statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+        queries = [count for _, _, count in results if count is not None]
+        return {
+            "requests": len(results),
+            "errors": sum(1 for _, status_code, _ in results if status_code >= 500),
+            "statuses": statuses,
+            "throughput_rps": round(len(results) / elapsed, 1),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.50), 2),
+                "p95": round(percentile(latencies, 0.95), 2),
+                "p99": round(percentile(latencies, 0.99), 2),
+                "max": round(max(latencies), 2),
+            },
+            "queries_per_request": (
+                round(sum(queries) / len(queries), 2) if queries else None
+            ),
+        }
@@ -0,0 +1,57 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from appointments.export import FORMATS, export_lines, export_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Write appointments as CSV or newline-delimited JSON, streaming rows "
+        "from the database so memory use does not grow with the export"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=FORMATS, default="csv", help="Output format (default csv)."
+        )
+        parser.add_argument("--date-from", type=date.fromisoformat)
+        parser.add_argument("--date-to", type=date.fromisoformat)
+        parser.add_argument("--doctor", type=int, help="Only this doctor's appointments.")
+        parser.add_argument(
+            "--output", default="-", help="Output file, or - for standard output (default)."
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Rows fetched from the database at a time (default 2000).",
+        )
+
+    def handle(self, *args, **options):
+        rows = export_rows(
+            date_from=options["date_from"],
+            date_to=options["date_to"],
+            doctor_id=options["doctor"],
+            chunk_size=options["chunk_size"],
+        )
+        handle = None
+        if options["output"] == "-":
+            def write(line):
+                self.stdout.write(line, ending="")
+        else:
+            handle = open(options["output"], "w", newline="", encoding="utf-8")
+            write = handle.write
+
+        count = 0
+        try:
+            for line in export_lines(rows, options["format"]):
+                write(line)
+                count += 1
+        finally:
+            if handle is not None:
+                handle.close()
+
+        if options["format"] == "csv":
+            count -= 1
+        self.stderr.write(f"Exported {count} appointments")
@@ -0,0 +1,84 @@
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.onboarding import FORMATS, ROLES, import_users, read_records
+from appointments.workers import process_pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Register doctors and patients in bulk from a CSV or JSON Lines file "
+        "with username, email, password and optionally role, first_name, last_name"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or - for standard input.")
+        parser.add_argument(
+            "--format", choices=FORMATS, help="Input format (default: from the file extension)."
+        )
+        parser.add_argument(
+            "--role", choices=list(ROLES), help="Role for records without a role column."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Password hashing processes (default: one per CPU; 0 hashes in process).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Records hashed and inserted per transaction (default 500).",
+        )
+        parser.add_argument(
+            "--start",
+            type=int,
+            default=0,
+            help=(
+                "Skip this many records first, e.g. the count reported before an "
+                "interruption. Rerunning without it is also safe: existing users "
+                "are skipped."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"]
+        if format is None:
+            format = "csv" if path.endswith(".csv") else "jsonl"
+
+        def progress(summary):
+            self.stderr.write(
+                f"{options['start'] + summary.read} records read, {summary.created} created, "
+                f"{summary.skipped} already present, {len(summary.errors)} invalid"
+            )
+
+        handle = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            records = islice(read_records(handle, format), options["start"], None)
+            if options["workers"] == 0:
+                summary = import_users(
+                    records, None, options["role"], options["chunk_size"], progress
+                )
+            else:
+                with process_pool(options["workers"]) as executor:
+                    summary = import_users(
+                        records, executor, options["role"], options["chunk_size"], progress
+                    )
+        except ValueError as exc:
+            raise CommandError(exc)
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+
+        for error in summary.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {summary.created} users, skipped {summary.skipped} existing, "
+                f"{len(summary.errors)} invalid"
+            )
+        )
@@ -0,0 +1,110 @@
+import time as clock
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from appointments.models import Doctor
+from appointments.schedule import (
+    ALL_WEEKDAYS,
+    expand_dates,
+    materialize_calendar,
+    time_slot_grid,
+    weekday_mask,
+)
+
+
+def parse_time(value):
+    try:
+        return datetime.strptime(value, "%H:%M").time()
+    except ValueError:
+        raise CommandError(f"Expected HH:MM, got {value!r}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a time slot grid and, unless --slots-only, declare doctors "
+        "available in it over a date range. Safe to rerun: only missing rows "
+        "are inserted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", default="09:00", help="First slot start (HH:MM).")
+        parser.add_argument("--end", default="21:00", help="Last slot end (HH:MM).")
+        parser.add_argument(
+            "--slot-minutes", type=int, default=30, help="Slot length (default 30)."
+        )
+        parser.add_argument(
+            "--slots-only", action="store_true", help="Only create the time slot grid."
+        )
+        parser.add_argument(
+            "--doctor",
+            type=int,
+            action="append",
+            help="Doctor id; repeat for several (default: every doctor).",
+        )
+        parser.add_argument(
+            "--date-from", type=date.fromisoformat, help="Default today."
+        )
+        parser.add_argument(
+            "--days", type=int, default=28, help="Days from --date-from (default 28)."
+        )
+        parser.add_argument(
+            "--weekdays",
+            help="Comma-separated weekday numbers, 0 is Monday (default: every day).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes to spread doctors over (SQLite always uses one).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Availability rows per insert (default 1000).",
+        )
+
+    def handle(self, *args, **options):
+        started = clock.perf_counter()
+        start, end = parse_time(options["start"]), parse_time(options["end"])
+        if options["slot_minutes"] <= 0 or end <= start:
+            raise CommandError("--end must be after --start and --slot-minutes positive.")
+
+        time_slot_ids = time_slot_grid(start, end, options["slot_minutes"])
+        self.stdout.write(f"Time slot grid has {len(time_slot_ids)} slots")
+        if options["slots_only"]:
+            return
+
+        weekdays = ALL_WEEKDAYS
+        if options["weekdays"]:
+            try:
+                weekdays = weekday_mask(int(day) for day in options["weekdays"].split(","))
+            except ValueError:
+                raise CommandError("--weekdays must be comma-separated numbers 0-6.")
+        date_from = options["date_from"] or timezone.localdate()
+        dates = list(
+            expand_dates(date_from, date_from + timedelta(days=options["days"] - 1), weekdays)
+        )
+        doctor_ids = options["doctor"] or list(
+            Doctor.objects.order_by("id").values_list("id", flat=True)
+        )
+
+        # SQLite allows one writer at a time; extra processes would only queue.
+        workers = 1 if connection.vendor == "sqlite" else options["workers"]
+
+        def progress(done, created, skipped):
+            if done % 50 == 0 or done == len(doctor_ids):
+                self.stderr.write(f"{done}/{len(doctor_ids)} doctors, {created} rows created")
+
+        created, skipped = materialize_calendar(
+            doctor_ids, dates, time_slot_ids, workers, options["chunk_size"], progress
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {created} availability slots ({skipped} already present) for "
+                f"{len(doctor_ids)} doctors in {clock.perf_counter() - started:.1f}s"
+            )
+        )
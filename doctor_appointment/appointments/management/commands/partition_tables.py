@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.utils import timezone
+
+from appointments.partitions import (
+    PARTITIONED_MODELS,
+    convert_table,
+    ensure_partitions,
+    is_partitioned,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "PostgreSQL only: partition the availability and appointment tables by "
+        "month, converting them on first use, and create the monthly "
+        "partitions for the booking horizon. Run it daily, like roll_schedules."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=400,
+            help="Create partitions for this many days ahead of today (default 400).",
+        )
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help=(
+                "Rebuild tables that are not partitioned yet. This copies every "
+                "row while holding an exclusive lock on the table."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        until = timezone.localdate() + timedelta(days=options["days"])
+        for model in PARTITIONED_MODELS:
+            table = model._meta.db_table
+            connection = connections[router.db_for_write(model)]
+            if connection.vendor != "postgresql":
+                raise CommandError("Table partitioning requires PostgreSQL.")
+
+            if not is_partitioned(connection, table):
+                if not options["convert"]:
+                    raise CommandError(
+                        f"{table} is not partitioned; rerun with --convert to rebuild it."
+                    )
+                convert_table(connection, model, until)
+                self.stdout.write(f"Converted {table} to monthly partitions")
+
+            for name in ensure_partitions(connection, model, until):
+                self.stdout.write(f"Created partition {name}")
+        self.stdout.write(self.style.SUCCESS(f"Partitions cover dates up to {until}"))
@@ -1,21 +1,17 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
-from datetime import time, timedelta, datetime
-from appointments.models import TimeSlot
 
 
 class Command(BaseCommand):
     help = "Populate TimeSlot model with 30 minute intervals from 9 AM to 9 PM"
 
     def handle(self, *args, **kwargs):
-        start_time = datetime.strptime("09:00", "%H:%M")
-        end_time = datetime.strptime("21:00", "%H:%M")
-        current_time = start_time
-
-        while current_time < end_time:
-            TimeSlot.objects.get_or_create(
-                start_time=current_time.time(),
-                end_time=(current_time + timedelta(minutes=30)).time(),
-            )
-            current_time += timedelta(minutes=30)
-
+        call_command(
+            "materialize_calendar",
+            "--start=09:00",
+            "--end=21:00",
+            "--slot-minutes=30",
+            "--slots-only",
+            stdout=self.stdout,
+        )
         self.stdout.write(self.style.SUCCESS("Successfully populated TimeSlot model"))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from appointments.booking import process_promotions
+
+
+class Command(BaseCommand):
+    help = "Promote waitlisted patients into slots freed by cancellations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Promotions processed per transaction (default 100).",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new work instead of exiting when the queue is empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when the queue is empty in --loop mode.",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_promotions(options["batch_size"])
+            total += processed
+            if processed:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} promotions"))
@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from appointments import stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the declared, booked and waitlisted counts of the doctor "
+        "utilization summaries from the live tables, a window of days at a time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date-from",
+            type=date.fromisoformat,
+            help=(
+                "First day to rebuild (default: earliest day in the live tables). "
+                "Earlier days are never rebuilt, so archived summaries survive."
+            ),
+        )
+        parser.add_argument(
+            "--date-to",
+            type=date.fromisoformat,
+            help="Last day to rebuild (default: latest day in the live tables).",
+        )
+        parser.add_argument("--doctor", type=int, help="Only this doctor's summaries.")
+        parser.add_argument(
+            "--batch-days",
+            type=int,
+            default=31,
+            help="Days recomputed per transaction (default 31).",
+        )
+
+    def handle(self, *args, **options):
+        span = stats.counted_span()
+        if span is None:
+            self.stdout.write("Nothing to rebuild")
+            return
+        # Days before the first live row were archived (or never had rows);
+        # their summaries are all that is left of them, so keep them.
+        date_from = max(options["date_from"] or span[0], span[0])
+        date_to = options["date_to"] or span[1]
+        if date_from > date_to:
+            self.stdout.write("Nothing to rebuild")
+            return
+
+        step = timedelta(days=max(1, options["batch_days"]))
+        days = 0
+        window = date_from
+        while window <= date_to:
+            last = min(window + step - timedelta(days=1), date_to)
+            days += stats.recount(window, last, options["doctor"])
+            window = last + timedelta(days=1)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {days} doctor-day summaries from {date_from} to {date_to}"
+            )
+        )
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from appointments.models import ScheduleTemplate
+from appointments.schedule import roll_template
+
+
+class Command(BaseCommand):
+    help = "Roll active schedule templates forward into Availability rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=28,
+            help="How many days ahead of today to keep materialised (default 28).",
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        until = today + timedelta(days=options["days"])
+        created = 0
+
+        templates = ScheduleTemplate.objects.filter(is_active=True).order_by("id")
+        for template in templates.iterator():
+            created += roll_template(template, today, until)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Created {created} availability slots up to {until}")
+        )
@@ -0,0 +1,162 @@
+"""
+Prometheus metrics: request latency, response size and SQL cost per route
+and viewset action, and booking outcomes.
+
+MetricsMiddleware records the request metrics and ``metrics_view`` serves
+everything in the Prometheus text format. Under gunicorn, or any other
+pre-forking server, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+shared by the workers; each worker then writes its samples there and the
+endpoint aggregates them, whichever worker serves the scrape.
+"""
+
+import os
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+UNMATCHED = "unmatched"
+LABELS = ("route", "action", "method", "status")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request.",
+    LABELS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Size of non-streaming response bodies.",
+    LABELS,
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000),
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL queries run while handling a request.",
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds",
+    "Total time spent in SQL queries while handling a request.",
+    LABELS,
+)
+BOOKING_OUTCOMES = Counter(
+    "booking_outcomes",
+    "Booking attempts by outcome; kind is single or batch.",
+    ("kind", "outcome"),
+)
+
+
+def count_outcome(kind):
+    """Count the outcome of every result the decorated booking function returns."""
+
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            BOOKING_OUTCOMES.labels(kind=kind, outcome=result.outcome).inc()
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+class QueryTimer:
+    """execute_wrapper that counts queries and adds up their duration."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Record latency, response size and SQL cost of every request, labelled
+    with the URL name and, for viewsets, the action.
+
+    Latency of streaming responses covers producing the response, not
+    sending its body. SQL is only measured for requests handled
+    synchronously: an async view's queries run on the ORM's worker thread,
+    whose connections are out of reach of a wrapper installed here.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Viewset routes map each method to an action; other views have none.
+        actions = getattr(view_func, "actions", None) or {}
+        request.metrics_action = actions.get(request.method.lower(), "")
+
+    def labels(self, request, response):
+        match = request.resolver_match
+        return {
+            "route": (match.view_name if match else None) or UNMATCHED,
+            "action": getattr(request, "metrics_action", ""),
+            "method": request.method,
+            "status": str(response.status_code),
+        }
+
+    def record(self, request, response, started, timer=None):
+        labels = self.labels(request, response)
+        REQUEST_LATENCY.labels(**labels).observe(time.perf_counter() - started)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(**labels).observe(len(response.content))
+        if timer is not None:
+            REQUEST_QUERIES.labels(**labels).observe(timer.count)
+            REQUEST_DB_TIME.labels(**labels).observe(timer.seconds)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        self.record(request, response, started, timer)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+
+def metrics_view(request):
+    """All metrics in the Prometheus text format."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:53
+
+from django.db import migrations, models
+
+
+def remove_duplicate_appointments(apps, schema_editor):
+    """
+    Promotions used to book the waitlisted patient without deleting the
+    cancelled appointment, leaving two rows for the slot. The newest row of
+    each slot, and then of each patient-time, is the one that stands.
+    """
+    Appointment = apps.get_model("appointments", "Appointment")
+    for fields in (("doctor_id", "date", "time_slot_id"), ("patient_id", "date", "time_slot_id")):
+        duplicates = (
+            Appointment.objects.values(*fields)
+            .annotate(count=models.Count("id"), keep=models.Max("id"))
+            .filter(count__gt=1)
+        )
+        for row in duplicates:
+            Appointment.objects.filter(**{field: row[field] for field in fields}).exclude(
+                id=row["keep"]
+            ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_waitlist'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_appointments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date', 'time_slot'), name='unique_doctor_appointment_slot'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('patient', 'date', 'time_slot'), name='unique_patient_appointment_slot'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def copy_start_times(apps, schema_editor):
+    TimeSlot = apps.get_model("appointments", "TimeSlot")
+    Availability = apps.get_model("appointments", "Availability")
+    for slot_id, start_time in TimeSlot.objects.values_list("id", "start_time"):
+        Availability.objects.filter(time_slot_id=slot_id).update(start_time=start_time)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_appointment_unique_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='availability',
+            name='start_time',
+            field=models.TimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(copy_start_times, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='availability',
+            name='start_time',
+            field=models.TimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['date', 'start_time', 'id'], name='availability_open_keyset_idx'),
+        ),
+    ]
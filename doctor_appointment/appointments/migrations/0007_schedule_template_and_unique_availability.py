@@ -0,0 +1,52 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def remove_duplicate_availability(apps, schema_editor):
+    Availability = apps.get_model("appointments", "Availability")
+    duplicates = (
+        Availability.objects.values("doctor_id", "date", "time_slot_id")
+        .annotate(count=models.Count("id"), keep=models.Min("id"))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        rows = Availability.objects.filter(
+            doctor_id=row["doctor_id"], date=row["date"], time_slot_id=row["time_slot_id"]
+        )
+        # A slot booked through any of its copies stays booked.
+        is_available = not rows.filter(is_available=False).exists()
+        rows.exclude(id=row["keep"]).delete()
+        rows.update(is_available=is_available)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_availability_start_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekdays', models.PositiveSmallIntegerField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('rolled_until', models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(remove_duplicate_availability, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='availability',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date', 'time_slot'), name='unique_doctor_availability_slot'),
+        ),
+        migrations.AddField(
+            model_name='scheduletemplate',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_templates', to='appointments.doctor'),
+        ),
+    ]
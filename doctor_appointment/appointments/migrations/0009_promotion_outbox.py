@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-18 07:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0008_user_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromotionTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='waitlist',
+            index=models.Index(fields=['doctor', 'date', 'time_slot', 'added_at'], name='waitlist_queue_idx'),
+        ),
+        migrations.AddField(
+            model_name='promotiontask',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appointments.doctor'),
+        ),
+        migrations.AddField(
+            model_name='promotiontask',
+            name='time_slot',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appointments.timeslot'),
+        ),
+    ]
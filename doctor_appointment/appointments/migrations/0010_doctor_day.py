@@ -0,0 +1,65 @@
+# Generated by Django 5.0.6 on 2026-10-18 07:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def slot_bit(start_time):
+    minutes = start_time.hour * 60 + start_time.minute
+    if minutes % 30:
+        return 0
+    return 1 << (minutes // 30)
+
+
+def backfill_doctor_days(apps, schema_editor):
+    Availability = apps.get_model("appointments", "Availability")
+    Appointment = apps.get_model("appointments", "Appointment")
+    DoctorDay = apps.get_model("appointments", "DoctorDay")
+
+    days = {}
+    rows = Availability.objects.filter(is_available=True).values_list(
+        "doctor_id", "date", "start_time"
+    )
+    for doctor_id, date, start_time in rows.iterator(chunk_size=5000):
+        masks = days.setdefault((doctor_id, date), [0, 0])
+        masks[0] |= slot_bit(start_time)
+    rows = Appointment.objects.values_list("doctor_id", "date", "time_slot__start_time")
+    for doctor_id, date, start_time in rows.iterator(chunk_size=5000):
+        masks = days.setdefault((doctor_id, date), [0, 0])
+        masks[1] |= slot_bit(start_time)
+
+    DoctorDay.objects.bulk_create(
+        (
+            DoctorDay(doctor_id=doctor_id, date=date, free_mask=free, booked_mask=booked)
+            for (doctor_id, date), (free, booked) in days.items()
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_promotion_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('free_mask', models.BigIntegerField(default=0)),
+                ('booked_mask', models.BigIntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appointments.doctor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='doctor_day_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='doctorday',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date'), name='unique_doctor_day'),
+        ),
+        migrations.RunPython(backfill_doctor_days, migrations.RunPython.noop),
+    ]
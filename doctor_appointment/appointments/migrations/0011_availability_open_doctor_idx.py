@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 07:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0010_doctor_day'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['doctor', 'date', 'start_time'], name='availability_open_doctor_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_availability_open_doctor_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_id', models.BigIntegerField(unique=True)),
+                ('doctor_id', models.IntegerField()),
+                ('patient_id', models.IntegerField()),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['doctor_id', 'date'], name='archived_appt_doctor_idx'), models.Index(fields=['patient_id', 'date'], name='archived_appt_patient_idx')],
+            },
+        ),
+    ]
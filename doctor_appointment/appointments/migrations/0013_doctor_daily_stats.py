@@ -0,0 +1,63 @@
+# Generated by Django 5.0.6 on 2026-10-18 07:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_doctor_daily_stats(apps, schema_editor):
+    DoctorDailyStats = apps.get_model("appointments", "DoctorDailyStats")
+
+    days = {}
+    for field, model_name in (
+        ("declared", "Availability"),
+        ("booked", "Appointment"),
+        ("waitlisted", "Waitlist"),
+    ):
+        rows = (
+            apps.get_model("appointments", model_name)
+            .objects.order_by()
+            .values("doctor_id", "date")
+            .annotate(count=Count("id"))
+            .values_list("doctor_id", "date", "count")
+        )
+        for doctor_id, date, count in rows.iterator(chunk_size=5000):
+            days.setdefault((doctor_id, date), {})[field] = count
+
+    DoctorDailyStats.objects.bulk_create(
+        (
+            DoctorDailyStats(doctor_id=doctor_id, date=date, **counts)
+            for (doctor_id, date), counts in days.items()
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0012_archived_appointment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('declared', models.IntegerField(default=0)),
+                ('booked', models.IntegerField(default=0)),
+                ('cancelled', models.IntegerField(default=0)),
+                ('waitlisted', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appointments.doctor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='doctor_daily_stats_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='doctordailystats',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date'), name='unique_doctor_daily_stats'),
+        ),
+        migrations.RunPython(backfill_doctor_daily_stats, migrations.RunPython.noop),
+    ]
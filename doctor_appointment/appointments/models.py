@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
+from django.db.models.functions import Lower
 
 
 class CustomUser(AbstractUser):
@@ -9,9 +11,34 @@ class CustomUser(AbstractUser):
 
     REQUIRED_FIELDS = ["email"]
 
+    class Meta(AbstractUser.Meta):
+        # Prefix search indexes; PostgreSQL additionally gets pg_trgm GIN
+        # indexes for substring search (see migration 0008).
+        indexes = [
+            models.Index(Lower("username"), name="customuser_username_lower_idx"),
+            models.Index(Lower("first_name"), name="customuser_first_lower_idx"),
+            models.Index(Lower("last_name"), name="customuser_last_lower_idx"),
+        ]
+
     def __str__(self):
         return self.username
 
+    # Profile ids under the same names as the token claims, so code can use
+    # request.user.doctor_id whether the user came from a token or a row.
+    @property
+    def doctor_id(self):
+        try:
+            return self.doctor_profile.id
+        except ObjectDoesNotExist:
+            return None
+
+    @property
+    def patient_id(self):
+        try:
+            return self.patient_profile.id
+        except ObjectDoesNotExist:
+            return None
+
 
 class Doctor(models.Model):
     user = models.OneToOneField(
@@ -35,13 +62,126 @@ class TimeSlot(models.Model):
     start_time = models.TimeField()
     end_time = models.TimeField()
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Keep the copy used for keyset ordering in step with the slot.
+        self.availability_set.exclude(start_time=self.start_time).update(
+            start_time=self.start_time
+        )
+
+
+class AvailabilityQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        missing = {obj.time_slot_id for obj in objs if obj.start_time is None}
+        if missing:
+            start_times = dict(
+                TimeSlot.objects.filter(id__in=missing).values_list("id", "start_time")
+            )
+            for obj in objs:
+                if obj.start_time is None:
+                    obj.start_time = start_times[obj.time_slot_id]
+        return super().bulk_create(objs, *args, **kwargs)
+
 
 class Availability(models.Model):
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     date = models.DateField()
     time_slot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE)
+    # Denormalised from time_slot so listings can be ordered and paged by
+    # (date, start_time, id) straight off one index.
+    start_time = models.TimeField(editable=False)
     is_available = models.BooleanField(default=True)
 
+    objects = AvailabilityQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["doctor", "date", "time_slot"],
+                name="unique_doctor_availability_slot",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["date", "start_time", "id"],
+                condition=models.Q(is_available=True),
+                name="availability_open_keyset_idx",
+            ),
+            models.Index(
+                fields=["doctor", "date", "start_time"],
+                condition=models.Q(is_available=True),
+                name="availability_open_doctor_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.start_time = self.time_slot.start_time
+        super().save(*args, **kwargs)
+
+
+class DoctorDay(models.Model):
+    """
+    One row per doctor and date holding the day's half-hour grid as
+    bitmasks: bit n covers the slot starting n * 30 minutes after midnight.
+    A bit in free_mask means the slot is declared and bookable, a bit in
+    booked_mask that it holds an appointment.
+    """
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    date = models.DateField()
+    free_mask = models.BigIntegerField(default=0)
+    booked_mask = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["doctor", "date"], name="unique_doctor_day"),
+        ]
+        indexes = [
+            models.Index(fields=["date"], name="doctor_day_date_idx"),
+        ]
+
+
+class DoctorDailyStats(models.Model):
+    """
+    Per doctor and date counts kept current by the write paths (see
+    stats.py): availability slots declared, appointments booked, waitlist
+    entries, and cancellations. All but ``cancelled``, which counts events
+    rather than rows, can be recomputed from the base tables.
+    """
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    date = models.DateField()
+    declared = models.IntegerField(default=0)
+    booked = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+    waitlisted = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["doctor", "date"], name="unique_doctor_daily_stats"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["date"], name="doctor_daily_stats_date_idx"),
+        ]
+
+
+class ScheduleTemplate(models.Model):
+    """A recurring weekly block of availability, e.g. Mon-Fri 09:00-13:00."""
+
+    doctor = models.ForeignKey(
+        Doctor, on_delete=models.CASCADE, related_name="schedule_templates"
+    )
+    # Bit 0 is Monday, matching date.weekday().
+    weekdays = models.PositiveSmallIntegerField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    is_active = models.BooleanField(default=True)
+    # Last date already materialised into Availability rows.
+    rolled_until = models.DateField(null=True, blank=True)
+
 
 class Appointment(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
@@ -49,6 +189,39 @@ class Appointment(models.Model):
     date = models.DateField()
     time_slot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["doctor", "date", "time_slot"],
+                name="unique_doctor_appointment_slot",
+            ),
+            models.UniqueConstraint(
+                fields=["patient", "date", "time_slot"],
+                name="unique_patient_appointment_slot",
+            ),
+        ]
+
+
+class ArchivedAppointment(models.Model):
+    """
+    A past appointment moved out of Appointment by archive_past. Doctor and
+    patient are kept as plain ids rather than foreign keys, so archived rows
+    neither hold up nor cascade with changes to the live tables.
+    """
+
+    appointment_id = models.BigIntegerField(unique=True)
+    doctor_id = models.IntegerField()
+    patient_id = models.IntegerField()
+    date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["doctor_id", "date"], name="archived_appt_doctor_idx"),
+            models.Index(fields=["patient_id", "date"], name="archived_appt_patient_idx"),
+        ]
+
 
 class Waitlist(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
@@ -58,4 +231,23 @@ class Waitlist(models.Model):
     added_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        unique_together = ('patient', 'doctor', 'date', 'time_slot')
\ No newline at end of file
+        unique_together = ('patient', 'doctor', 'date', 'time_slot')
+        indexes = [
+            # Head of the queue for a slot is one index probe.
+            models.Index(
+                fields=["doctor", "date", "time_slot", "added_at"],
+                name="waitlist_queue_idx",
+            ),
+        ]
+
+
+class PromotionTask(models.Model):
+    """
+    Outbox entry asking the promotion worker to hand a cancelled slot to
+    the head of its waitlist. Rows are deleted once processed.
+    """
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    date = models.DateField()
+    time_slot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""
+Bulk registration of doctors and patients from CSV or JSON Lines.
+
+Records are read lazily, hashed (in a process pool when the import_users
+command runs) and written a chunk at a time: users with one bulk_create,
+then their profiles with another, each chunk in its own transaction.
+Usernames and emails that already exist are skipped, including those
+registered by a concurrent request while a chunk was being hashed, so an
+interrupted import can simply be run again.
+"""
+
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import CustomUser, Doctor, Patient
+
+ROLES = ("doctor", "patient")
+FORMATS = ("csv", "jsonl")
+# Fields checked against CustomUser's own validators (format and length).
+VALIDATED_FIELDS = ("username", "email", "first_name", "last_name")
+
+
+class ImportSummary:
+    def __init__(self):
+        self.read = 0
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    def as_dict(self):
+        return {
+            "read": self.read,
+            "created": self.created,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+
+def read_records(lines, format):
+    """Yield (line number, record) pairs from an iterable of text lines."""
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    elif format == "jsonl":
+        for number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except json.JSONDecodeError as exc:
+                    yield number, {"_error": f"Invalid JSON: {exc.msg}"}
+    else:
+        raise ValueError(f"Unknown format {format!r}; expected one of {FORMATS}")
+
+
+def _validate(record, default_role):
+    if not isinstance(record, dict):
+        return "Expected an object"
+    if "_error" in record:
+        return record["_error"]
+    missing = [field for field in ("username", "email", "password") if not record.get(field)]
+    if missing:
+        return f"Missing {', '.join(missing)}"
+    if (record.get("role") or default_role) not in ROLES:
+        return f"Role must be one of {', '.join(ROLES)}"
+    for field in ("password", *VALIDATED_FIELDS):
+        if not isinstance(record.get(field) or "", str):
+            return f"{field} must be a string"
+    for field in VALIDATED_FIELDS:
+        if record.get(field):
+            try:
+                CustomUser._meta.get_field(field).run_validators(record[field])
+            except ValidationError as exc:
+                return f"{field}: {' '.join(exc.messages)}"
+    return None
+
+
+def import_users(records, executor=None, default_role=None, chunk_size=500, progress=None):
+    """
+    Register users from (line number, record) pairs.
+
+    Each record has username, email and password, and optionally role,
+    first_name and last_name. Passwords are hashed with ``executor.map``
+    when an executor is given, in process otherwise. ``progress`` is called
+    with the running ImportSummary after every chunk.
+    """
+    summary = ImportSummary()
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        summary.read += len(chunk)
+        _import_chunk(chunk, executor, default_role, summary)
+        if progress is not None:
+            progress(summary)
+    return summary
+
+
+def _import_chunk(chunk, executor, default_role, summary):
+    valid = []
+    seen = set()
+    for number, record in chunk:
+        error = _validate(record, default_role)
+        keys = () if error else (("username", record["username"]), ("email", record["email"]))
+        if any(key in seen for key in keys):
+            error = "Duplicate of an earlier record"
+        if error is not None:
+            summary.errors.append({"line": number, "error": error})
+            continue
+        seen.update(keys)
+        valid.append(record)
+
+    new = _unregistered(valid, lambda record: (record["username"], record["email"]))
+    summary.skipped += len(valid) - len(new)
+    if not new:
+        return
+
+    passwords = [record["password"] for record in new]
+    if executor is None:
+        hashed = [make_password(password) for password in passwords]
+    else:
+        hashed = list(executor.map(make_password, passwords, chunksize=16))
+
+    users = [
+        CustomUser(
+            username=record["username"],
+            email=record["email"],
+            password=password,
+            first_name=record.get("first_name") or "",
+            last_name=record.get("last_name") or "",
+            is_doctor=(record.get("role") or default_role) == "doctor",
+            is_patient=(record.get("role") or default_role) == "patient",
+        )
+        for record, password in zip(new, hashed)
+    ]
+    while users:
+        try:
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(users)
+                Doctor.objects.bulk_create(Doctor(user=user) for user in users if user.is_doctor)
+                Patient.objects.bulk_create(
+                    Patient(user=user) for user in users if user.is_patient
+                )
+        except IntegrityError:
+            # Some were registered concurrently while the chunk was hashed.
+            remaining = _unregistered(users, lambda user: (user.username, user.email))
+            if len(remaining) == len(users):
+                raise
+            summary.skipped += len(users) - len(remaining)
+            for user in remaining:
+                user.pk = None
+            users = remaining
+        else:
+            summary.created += len(users)
+            return
+
+
+def _unregistered(items, identity):
+    """The ``items`` whose (username, email) ``identity`` is not yet in use."""
+    usernames = {identity(item)[0] for item in items}
+    emails = {identity(item)[1] for item in items}
+    existing = CustomUser.objects.filter(Q(username__in=usernames) | Q(email__in=emails))
+    taken = set()
+    for username, email in existing.values_list("username", "email"):
+        taken.update((("username", username), ("email", email)))
+    return [
+        item
+        for item in items
+        if ("username", identity(item)[0]) not in taken
+        and ("email", identity(item)[1]) not in taken
+    ]
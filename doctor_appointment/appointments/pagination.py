@@ -0,0 +1,120 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, time
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (date, start_time, id).
+
+    Each page is fetched with a range condition on the ordering columns and
+    a LIMIT, so it walks the matching index instead of counting or skipping
+    rows; page N costs the same as page 1.
+    """
+
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+    ordering = ("date", "start_time", "id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    def page_queryset(self, queryset, request):
+        """The unevaluated query for the requested page (plus one look-ahead row)."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        return queryset.order_by(*self.ordering)[: self.page_size + 1]
+
+    def paginate_values(self, queryset, request, fields):
+        """
+        A page of values_list() rows of ``fields``, which must include
+        those of ``ordering``.
+        """
+        rows = self.page_queryset(queryset, request).values_list(*fields, named=True)
+        return self.finish_page(list(rows))
+
+    def finish_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_position(self, row):
+        return (row.date, row.start_time, row.id)
+
+    def after(self, position):
+        """Rows strictly after ``position`` in (date, start_time, id) order."""
+        row_date, start_time, row_id = position
+        # The leading date bound lets the database start the index scan at
+        # the cursor rather than filtering the whole range.
+        return Q(date__gte=row_date) & (
+            Q(date__gt=row_date)
+            | Q(date=row_date, start_time__gt=start_time)
+            | Q(date=row_date, start_time=start_time, id__gt=row_id)
+        )
+
+    def encode_cursor(self, position):
+        row_date, start_time, row_id = position
+        raw = f"{row_date.isoformat()}|{start_time.isoformat()}|{row_id}"
+        return urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = urlsafe_b64decode(encoded.encode()).decode()
+            row_date, start_time, row_id = raw.split("|")
+            return (
+                date.fromisoformat(row_date),
+                time.fromisoformat(start_time),
+                int(row_id),
+            )
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class SearchPagination(PageNumberPagination):
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = "page_size"
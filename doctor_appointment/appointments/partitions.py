@@ -0,0 +1,216 @@
+"""
+Monthly range partitioning by date of the Availability and Appointment
+tables, on PostgreSQL.
+
+convert_table() rebuilds a plain table as a partitioned one under the same
+name, with the same columns, constraints and indexes, except that the
+primary key becomes (id, date) as PostgreSQL requires. Django keeps
+treating ``id`` as the primary key; ids still come from one sequence.
+ensure_partitions() then keeps a partition ready for every month up to the
+booking horizon, and drop_partitions_before() drops whole months once
+archive_past has emptied them, so old data costs neither index depth nor
+vacuum time on the hot paths.
+
+Rows outside every monthly partition land in a DEFAULT partition, so an
+insert never fails for want of a partition; ensure_partitions() moves them
+into their month when it creates it.
+"""
+
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Appointment, Availability
+
+PARTITIONED_MODELS = (Availability, Appointment)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def is_partitioned(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def monthly_partitions(connection, table):
+    """{first day of month: partition name} of ``table``'s monthly partitions."""
+    prefix = f"{table}_p"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            [table],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+    months = {}
+    for name in names:
+        suffix = name[len(prefix) :]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            months[date(int(suffix[:4]), int(suffix[4:]), 1)] = name
+    return months
+
+
+def convert_table(connection, model, until):
+    """
+    Rebuild ``model``'s table as a monthly partitioned table holding the
+    same rows, with partitions from its first month up to ``until``.
+
+    Runs in one transaction holding an exclusive lock on the table while
+    the rows are copied, so run it in a maintenance window.
+    """
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    old = f"{table}_unpartitioned"
+    sequence = f"{table}_id_partitioned_seq"
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+        # Definitions are read while the table still has its own name, so
+        # that they can be replayed as they are against the new table.
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')",
+            [table],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT c.relname, pg_get_indexdef(c.oid) FROM pg_index x "
+            "JOIN pg_class c ON c.oid = x.indexrelid "
+            "WHERE x.indrelid = %s::regclass AND NOT EXISTS ("
+            "  SELECT 1 FROM pg_constraint k"
+            "  WHERE k.conindid = x.indexrelid AND k.contype IN ('p', 'u', 'x'))",
+            [table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(f"SELECT min(date), max(id) FROM {qn(table)}")
+        first_day, max_id = cursor.fetchone()
+
+        # Index names are schema-wide: free them for the new table.
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(old)}")
+        for name, kind, _ in constraints:
+            if kind in ("p", "u"):
+                cursor.execute(f"ALTER TABLE {qn(old)} DROP CONSTRAINT {qn(name)}")
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {qn(name)}")
+
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (date)"
+        )
+        # Identity columns cannot be declared on a partitioned table before
+        # PostgreSQL 17; a sequence default does the same job.
+        cursor.execute(f"CREATE SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.id")
+        cursor.execute("SELECT setval(%s, %s, false)", [sequence, (max_id or 0) + 1])
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ALTER COLUMN id SET DEFAULT nextval(%s::regclass)",
+            [sequence],
+        )
+        cursor.execute(f"ALTER TABLE {qn(table)} ADD PRIMARY KEY (id, date)")
+        cursor.execute(
+            f"CREATE TABLE {qn(default_partition_name(table))} PARTITION OF {qn(table)} DEFAULT"
+        )
+        month = month_start(first_day or until)
+        while month <= until:
+            _create_partition(cursor, qn, table, month)
+            month = next_month(month)
+
+        cursor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(old)}")
+        for name, kind, definition in constraints:
+            if kind in ("u", "f"):
+                cursor.execute(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}")
+        for _, definition in indexes:
+            cursor.execute(definition)
+        cursor.execute(f"DROP TABLE {qn(old)}")
+        cursor.execute(f"ALTER SEQUENCE {qn(sequence)} RENAME TO {qn(f'{table}_id_seq')}")
+        cursor.execute(f"ANALYZE {qn(table)}")
+
+
+def _create_partition(cursor, qn, table, month):
+    cursor.execute(
+        f"CREATE TABLE {qn(partition_name(table, month))} PARTITION OF {qn(table)} "
+        f"FOR VALUES FROM (%s) TO (%s)",
+        [month, next_month(month)],
+    )
+
+
+def ensure_partitions(connection, model, until):
+    """
+    Create the missing monthly partitions from this month up to ``until``,
+    moving any rows the DEFAULT partition holds for them. Returns the names
+    of the partitions created.
+    """
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    default = default_partition_name(table)
+    existing = monthly_partitions(connection, table)
+    created = []
+    month = month_start(timezone.localdate())
+    while month <= until:
+        if month not in existing:
+            name = partition_name(table, month)
+            bounds = [month, next_month(month)]
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT EXISTS (SELECT 1 FROM {qn(default)} WHERE date >= %s AND date < %s)",
+                    bounds,
+                )
+                if not cursor.fetchone()[0]:
+                    _create_partition(cursor, qn, table, month)
+                else:
+                    # A partition cannot be attached while the default
+                    # partition still holds rows in its range.
+                    cursor.execute(
+                        f"CREATE TABLE {qn(name)} "
+                        f"(LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                    )
+                    cursor.execute(
+                        f"WITH moved AS (DELETE FROM {qn(default)} "
+                        f"WHERE date >= %s AND date < %s RETURNING *) "
+                        f"INSERT INTO {qn(name)} SELECT * FROM moved",
+                        bounds,
+                    )
+                    cursor.execute(
+                        f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} "
+                        f"FOR VALUES FROM (%s) TO (%s)",
+                        bounds,
+                    )
+            created.append(name)
+        month = next_month(month)
+    return created
+
+
+def drop_partitions_before(connection, model, before):
+    """
+    Drop the monthly partitions that end on or before ``before`` and hold
+    no rows. Returns the names of the partitions dropped.
+    """
+    qn = connection.ops.quote_name
+    dropped = []
+    for month, name in sorted(monthly_partitions(connection, model._meta.db_table).items()):
+        if next_month(month) > before:
+            break
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {qn(name)})")
+            if cursor.fetchone()[0]:
+                continue
+            cursor.execute(f"DROP TABLE {qn(name)}")
+        dropped.append(name)
+    return dropped
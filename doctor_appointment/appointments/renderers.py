@@ -0,0 +1,50 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .columnar import FORMAT as COLUMNAR_FORMAT
+from .export import CONTENT_TYPES
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Lets ``?format=`` and the Accept header select an export format.
+
+    Successful exports return a StreamingHttpResponse that bypasses the
+    renderer; only error payloads are rendered here, as JSON.
+    """
+
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return JSONRenderer().render(data)
+
+
+class CSVRenderer(ExportRenderer):
+    format = "csv"
+    media_type = CONTENT_TYPES["csv"]
+
+
+class NDJSONRenderer(ExportRenderer):
+    format = "ndjson"
+    media_type = CONTENT_TYPES["ndjson"]
+
+
+class ColumnarRenderer(BaseRenderer):
+    """
+    Compact JSON for columnar list pages (see appointments.columnar).
+    """
+
+    format = COLUMNAR_FORMAT
+    media_type = "application/vnd.columnar+json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(
+            data, cls=DjangoJSONEncoder, separators=(",", ":"), ensure_ascii=False
+        ).encode()
@@ -0,0 +1,227 @@
+import heapq
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import doctor_days, stats
+from .cache import timeslot_versions
+from .models import Availability, Doctor, TimeSlot
+from .signals import SlotChange, notify_slot_changed
+from .workers import process_pool
+
+ALL_WEEKDAYS = 0b1111111
+
+
+def weekday_mask(weekdays):
+    mask = 0
+    for weekday in weekdays:
+        mask |= 1 << weekday
+    return mask
+
+
+def weekdays_from_mask(mask):
+    return [weekday for weekday in range(7) if mask & (1 << weekday)]
+
+
+def slots_between(start_time, end_time):
+    """Ids of the time slots that fit entirely inside [start_time, end_time]."""
+    return list(
+        TimeSlot.objects.filter(start_time__gte=start_time, end_time__lte=end_time)
+        .order_by("start_time")
+        .values_list("id", flat=True)
+    )
+
+
+def expand_dates(date_from, date_to, weekdays=ALL_WEEKDAYS):
+    day = date_from
+    while day <= date_to:
+        if weekdays & (1 << day.weekday()):
+            yield day
+        day += timedelta(days=1)
+
+
+def lock_declarations(doctor_id):
+    """
+    Make Availability writers for ``doctor_id`` take turns until the
+    current transaction ends, so each sees what the previous one declared.
+    NO KEY UPDATE leaves bookings, which only reference the doctor row,
+    free to proceed.
+    """
+    list(Doctor.objects.select_for_update(no_key=True).filter(id=doctor_id).values_list("id"))
+
+
+def declare_availability(doctor_id, dates, time_slot_ids, chunk_size=1000):
+    """
+    Declare a doctor available in every given slot on every given date.
+
+    Slots the doctor has already declared are skipped; the rest are written
+    with chunked bulk_create inside one transaction. Returns the number of
+    rows actually inserted and of slots skipped as already declared.
+    """
+    dates = list(dates)
+    time_slot_ids = list(time_slot_ids)
+    if not dates or not time_slot_ids:
+        return 0, 0
+
+    declarations = Availability.objects.filter(
+        doctor_id=doctor_id,
+        date__gte=min(dates),
+        date__lte=max(dates),
+        time_slot_id__in=time_slot_ids,
+    )
+    start_times = dict(
+        TimeSlot.objects.filter(id__in=time_slot_ids).values_list("id", "start_time")
+    )
+
+    with transaction.atomic():
+        lock_declarations(doctor_id)
+        existing = set(declarations.values_list("date", "time_slot_id"))
+        rows = [
+            Availability(
+                doctor_id=doctor_id,
+                date=day,
+                time_slot_id=slot_id,
+                start_time=start_times[slot_id],
+            )
+            for day in dates
+            for slot_id in time_slot_ids
+            if (day, slot_id) not in existing
+        ]
+        # Declarations here and through the API take the lock, so nothing
+        # has been declared since the check above; ignore_conflicts only
+        # covers writers that skip it, like the admin.
+        Availability.objects.bulk_create(rows, batch_size=chunk_size, ignore_conflicts=True)
+
+        declared = {}
+        for row in rows:
+            declared.setdefault(row.date, []).append(row.time_slot_id)
+        doctor_days.refresh_doctor_days(doctor_id, declared)
+        if declared:
+            # Recounted rather than incremented, in case rows were skipped.
+            stats.recount(min(declared), max(declared), doctor_id, fields=("declared",))
+        for day, slot_ids in declared.items():
+            notify_slot_changed(doctor_id, day, slot_ids, SlotChange.DECLARED)
+
+    return len(rows), len(dates) * len(time_slot_ids) - len(rows)
+
+
+def time_slot_grid(start_time, end_time, minutes=30):
+    """
+    Ids of the ``minutes``-long slots tiling [start_time, end_time], in
+    order. Slots missing from the grid are created with one bulk insert.
+    """
+    step = timedelta(minutes=minutes)
+    current = datetime.combine(date.min, start_time)
+    stop = datetime.combine(date.min, end_time)
+    bounds = []
+    while current + step <= stop:
+        bounds.append((current.time(), (current + step).time()))
+        current += step
+    if not bounds:
+        return []
+
+    def existing():
+        rows = TimeSlot.objects.filter(
+            start_time__in=[start for start, _ in bounds]
+        ).values_list("id", "start_time", "end_time")
+        return {(start, end): slot_id for slot_id, start, end in rows}
+
+    slots = existing()
+    missing = [bound for bound in bounds if bound not in slots]
+    if missing:
+        TimeSlot.objects.bulk_create(
+            TimeSlot(start_time=start, end_time=end) for start, end in missing
+        )
+        # bulk_create sends no post_save for the cache receivers to see.
+        timeslot_versions.invalidate_all()
+        slots = existing()
+    return [slots[bound] for bound in bounds]
+
+
+def _declare_for_doctor(job):
+    return declare_availability(*job)
+
+
+def materialize_calendar(
+    doctor_ids, dates, time_slot_ids, workers=1, chunk_size=1000, progress=None
+):
+    """
+    Declare every doctor available in the given slots on the given dates.
+
+    Each doctor is one declare_availability call, so reruns only insert
+    what is missing. With ``workers`` > 1 doctors are spread over a process
+    pool. ``progress`` is called with (doctors done, created, skipped) as
+    each doctor finishes. Returns the rows created and skipped.
+    """
+    dates = list(dates)
+    time_slot_ids = list(time_slot_ids)
+    jobs = [(doctor_id, dates, time_slot_ids, chunk_size) for doctor_id in doctor_ids]
+
+    created = skipped = 0
+
+    def collect(results):
+        nonlocal created, skipped
+        for done, (doctor_created, doctor_skipped) in enumerate(results, start=1):
+            created += doctor_created
+            skipped += doctor_skipped
+            if progress is not None:
+                progress(done, created, skipped)
+
+    if workers > 1:
+        with process_pool(workers) as executor:
+            collect(executor.map(_declare_for_doctor, jobs))
+    else:
+        collect(map(_declare_for_doctor, jobs))
+    return created, skipped
+
+
+def roll_template(template, today, until):
+    """
+    Materialise a schedule template from ``today`` up to ``until``.
+
+    Dates before ``template.rolled_until`` were handled by an earlier run
+    and are not expanded again. Returns the number of rows created.
+    """
+    start = today
+    if template.rolled_until and template.rolled_until >= start:
+        start = template.rolled_until + timedelta(days=1)
+    if start > until:
+        return 0
+
+    with transaction.atomic():
+        created, _ = declare_availability(
+            template.doctor_id,
+            expand_dates(start, until, template.weekdays),
+            slots_between(template.start_time, template.end_time),
+        )
+        template.rolled_until = until
+        template.save(update_fields=["rolled_until"])
+    return created
+
+
+def next_free_slots(queryset, after, k, doctor_ids=None):
+    """
+    The ``k`` earliest open availabilities starting at or after ``after``.
+
+    Each query is a range scan over a partial index on open rows, ordered
+    the same way as the index and cut off with LIMIT k, so its cost depends
+    on k and not on how much availability is declared. With ``doctor_ids``
+    every doctor gets its own such query and the results are merged.
+    """
+    ordering = ("date", "start_time", "id")
+    queryset = queryset.filter(
+        Q(date__gte=after.date())
+        & (Q(date__gt=after.date()) | Q(start_time__gte=after.time())),
+        is_available=True,
+    ).order_by(*ordering)
+
+    if doctor_ids is None:
+        return list(queryset[:k])
+
+    def key(row):
+        return row.date, row.start_time, row.id
+
+    per_doctor = [list(queryset.filter(doctor_id=doctor_id)[:k]) for doctor_id in doctor_ids]
+    return list(islice(heapq.merge(*per_doctor, key=key), k))
@@ -0,0 +1,97 @@
+import sys
+
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest, Lower
+
+from .models import Appointment, CustomUser
+
+NAME_FIELDS = ("username", "first_name", "last_name")
+
+
+def uses_trigram_index(using="default"):
+    return connections[using].vendor == "postgresql"
+
+
+def prefix_upper_bound(prefix):
+    """
+    The smallest string greater than every string starting with ``prefix``,
+    or None when there is none (``prefix`` is all U+10FFFF).
+    """
+    stripped = prefix.rstrip(chr(sys.maxunicode))
+    if not stripped:
+        return None
+    return stripped[:-1] + chr(ord(stripped[-1]) + 1)
+
+
+def matching_users(term, using="default"):
+    """
+    Users whose username, first or last name matches ``term``.
+
+    On PostgreSQL this is a substring match served by the pg_trgm GIN
+    indexes on UPPER(column). Other databases fall back to a
+    case-insensitive prefix match expressed as a range over the
+    LOWER(column) indexes, which a plain B-tree can answer.
+    """
+    users = CustomUser.objects.using(using)
+    if uses_trigram_index(using):
+        condition = Q()
+        for field in NAME_FIELDS:
+            condition |= Q(**{f"{field}__icontains": term})
+        return users.filter(condition)
+
+    lower = term.lower()
+    upper_bound = prefix_upper_bound(lower)
+    condition = Q()
+    for field in NAME_FIELDS:
+        bounds = {f"lower_{field}__gte": lower}
+        if upper_bound is not None:
+            bounds[f"lower_{field}__lt"] = upper_bound
+        condition |= Q(**bounds)
+    return users.alias(
+        **{f"lower_{field}": Lower(field) for field in NAME_FIELDS}
+    ).filter(condition)
+
+
+def _rank(prefix, term, using):
+    if uses_trigram_index(using):
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        return Greatest(
+            *(TrigramSimilarity(f"{prefix}__user__{field}", term) for field in NAME_FIELDS)
+        )
+    return Case(
+        *(
+            When(**{f"{prefix}__user__{field}__iexact": term}, then=Value(1))
+            for field in NAME_FIELDS
+        ),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def search_appointments(doctor=None, patient=None, queryset=None, using="default"):
+    """Appointments matching the given names, best matches first."""
+    if queryset is None:
+        queryset = Appointment.objects.using(using)
+
+    ranks = []
+    if doctor:
+        queryset = queryset.filter(
+            doctor__user__in=matching_users(doctor, using).values("id")
+        )
+        ranks.append(_rank("doctor", doctor, using))
+    if patient:
+        queryset = queryset.filter(
+            patient__user__in=matching_users(patient, using).values("id")
+        )
+        ranks.append(_rank("patient", patient, using))
+
+    ordering = ["date", "time_slot__start_time", "id"]
+    if ranks:
+        rank = ranks[0]
+        for other in ranks[1:]:
+            rank = rank + other
+        queryset = queryset.annotate(rank=rank)
+        ordering.insert(0, F("rank").desc())
+    return queryset.order_by(*ordering)
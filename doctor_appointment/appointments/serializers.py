@@ -1,6 +1,25 @@
 from rest_framework import serializers
-from .models import CustomUser, Doctor, Patient, TimeSlot, Availability, Appointment
-from django.contrib.auth.hashers import make_password
+from .models import (
+    CustomUser,
+    Doctor,
+    Patient,
+    TimeSlot,
+    Availability,
+    Appointment,
+    ScheduleTemplate,
+)
+from .columnar import LAYOUTS
+from .schedule import ALL_WEEKDAYS, weekday_mask, weekdays_from_mask
+from .authentication import CachedRefreshToken, is_blacklisted, role_claims
+from django.db import transaction
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+    TokenVerifySerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+from django.utils import timezone
 
 
 class TimeSlotSerializer(serializers.ModelSerializer):
@@ -10,13 +29,190 @@ class TimeSlotSerializer(serializers.ModelSerializer):
 
 
 class AvailabilitySerializer(serializers.ModelSerializer):
+    doctor_name = serializers.CharField(source="doctor.user.username", read_only=True)
+    end_time = serializers.TimeField(source="time_slot.end_time", read_only=True)
 
     class Meta:
         model = Availability
         fields = "__all__"
 
 
+class AvailabilityFilterSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    doctor = serializers.IntegerField(required=False)
+    # Only read by the columnar format.
+    layout = serializers.ChoiceField(choices=LAYOUTS, required=False)
+
+    def filter(self, queryset):
+        params = self.validated_data
+        if "date_from" in params:
+            queryset = queryset.filter(date__gte=params["date_from"])
+        if "date_to" in params:
+            queryset = queryset.filter(date__lte=params["date_to"])
+        if "doctor" in params:
+            queryset = queryset.filter(doctor_id=params["doctor"])
+        return queryset
+
+
+class AvailabilityEventsSerializer(serializers.Serializer):
+    doctor = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=50
+    )
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    last_event_id = serializers.CharField(required=False, max_length=64)
+
+
+class FreeDoctorsSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    time = serializers.TimeField()
+
+
+class FirstFreeSerializer(serializers.Serializer):
+    doctor = serializers.IntegerField()
+    date_from = serializers.DateField(required=False)
+    days = serializers.IntegerField(min_value=1, max_value=366, default=7)
+
+
+class NextSlotsSerializer(serializers.Serializer):
+    after = serializers.DateTimeField(required=False)
+    k = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    doctor = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=50
+    )
+
+
+class WeekdaysField(serializers.ListField):
+    """Weekday numbers (0 is Monday) stored as a bitmask."""
+
+    child = serializers.IntegerField(min_value=0, max_value=6)
+
+    def to_internal_value(self, data):
+        return weekday_mask(super().to_internal_value(data))
+
+    def to_representation(self, value):
+        return weekdays_from_mask(value)
+
+
+class BulkAvailabilitySerializer(serializers.Serializer):
+    max_days = 366
+
+    doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all())
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    time_slots = serializers.PrimaryKeyRelatedField(
+        queryset=TimeSlot.objects.all(), many=True, required=False
+    )
+    weekdays = WeekdaysField(required=False, default=ALL_WEEKDAYS)
+    start_time = serializers.TimeField(required=False)
+    end_time = serializers.TimeField(required=False)
+
+    def validate(self, attrs):
+        if attrs["date_to"] < attrs["date_from"]:
+            raise serializers.ValidationError("date_to must not be before date_from.")
+        if (attrs["date_to"] - attrs["date_from"]).days >= self.max_days:
+            raise serializers.ValidationError(
+                f"A bulk declaration may span at most {self.max_days} days."
+            )
+        has_window = "start_time" in attrs and "end_time" in attrs
+        if not attrs.get("time_slots") and not has_window:
+            raise serializers.ValidationError(
+                "Provide either time_slots or start_time and end_time."
+            )
+        if has_window and attrs["end_time"] <= attrs["start_time"]:
+            raise serializers.ValidationError("end_time must be after start_time.")
+        return attrs
+
+
+class ScheduleTemplateSerializer(serializers.ModelSerializer):
+    weekdays = WeekdaysField(allow_empty=False)
+
+    class Meta:
+        model = ScheduleTemplate
+        fields = "__all__"
+        read_only_fields = ["rolled_until"]
+
+    def validate(self, attrs):
+        start_time = attrs.get("start_time", getattr(self.instance, "start_time", None))
+        end_time = attrs.get("end_time", getattr(self.instance, "end_time", None))
+        if end_time <= start_time:
+            raise serializers.ValidationError("end_time must be after start_time.")
+        return attrs
+
+
+class AppointmentSearchSerializer(serializers.Serializer):
+    UPCOMING = "upcoming"
+    PAST = "past"
+
+    # A blank name matches everyone, as an absent one does.
+    doctor = serializers.CharField(required=False, allow_blank=True, max_length=150)
+    patient = serializers.CharField(required=False, allow_blank=True, max_length=150)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=[UPCOMING, PAST], required=False)
+
+    def filter(self, queryset):
+        params = self.validated_data
+        if "date_from" in params:
+            queryset = queryset.filter(date__gte=params["date_from"])
+        if "date_to" in params:
+            queryset = queryset.filter(date__lte=params["date_to"])
+        if params.get("status") == self.UPCOMING:
+            queryset = queryset.filter(date__gte=timezone.localdate())
+        elif params.get("status") == self.PAST:
+            queryset = queryset.filter(date__lt=timezone.localdate())
+        return queryset
+
+
+class AppointmentExportSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    doctor = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if "date_from" in attrs and "date_to" in attrs and attrs["date_to"] < attrs["date_from"]:
+            raise serializers.ValidationError("date_to must not be before date_from.")
+        return attrs
+
+
+class DoctorStatsSerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    doctor = serializers.IntegerField(required=False)
+    by = serializers.ChoiceField(choices=["doctor", "day"], default="doctor")
+
+    def validate(self, attrs):
+        if attrs["date_to"] < attrs["date_from"]:
+            raise serializers.ValidationError("date_to must not be before date_from.")
+        return attrs
+
+
+class SlotRequestSerializer(serializers.Serializer):
+    doctor = serializers.IntegerField()
+    date = serializers.DateField()
+    time_slot = serializers.IntegerField()
+
+
+class BatchBookingSerializer(serializers.Serializer):
+    max_slots = 20
+
+    patient = serializers.PrimaryKeyRelatedField(queryset=Patient.objects.all())
+    slots = SlotRequestSerializer(many=True, allow_empty=False, max_length=max_slots)
+
+    def slot_keys(self):
+        return [
+            (slot["doctor"], slot["date"], slot["time_slot"])
+            for slot in self.validated_data["slots"]
+        ]
+
+
 class AppointmentSerializer(serializers.ModelSerializer):
+    doctor_name = serializers.CharField(source="doctor.user.username", read_only=True)
+    patient_name = serializers.CharField(source="patient.user.username", read_only=True)
+    start_time = serializers.TimeField(source="time_slot.start_time", read_only=True)
+    end_time = serializers.TimeField(source="time_slot.end_time", read_only=True)
+
     class Meta:
         model = Appointment
         fields = "__all__"
@@ -46,14 +242,11 @@ class DoctorRegistrationSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user_data = validated_data.pop("user")
-        user = UserRegistrationSerializer.create(
-            UserRegistrationSerializer(), validated_data=user_data
-        )
-        user.is_doctor = True
-        user_password = make_password(user.password)
-        user.password = user_password
-        user.save()
-        doctor = Doctor.objects.create(user=user)
+        # One insert with the password hashed up front, instead of an insert
+        # followed by a second save to hash it.
+        with transaction.atomic():
+            user = CustomUser.objects.create_user(**user_data, is_doctor=True)
+            doctor = Doctor.objects.create(user=user)
         return doctor
 
 
@@ -66,12 +259,34 @@ class PatientRegistrationSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user_data = validated_data.pop("user")
-        user = UserRegistrationSerializer.create(
-            UserRegistrationSerializer(), validated_data=user_data
-        )
-        user.is_patient = True
-        user_password = make_password(user.password)
-        user.password = user_password
-        user.save()
-        patient = Patient.objects.create(user=user)
+        # One insert with the password hashed up front, instead of an insert
+        # followed by a second save to hash it.
+        with transaction.atomic():
+            user = CustomUser.objects.create_user(**user_data, is_patient=True)
+            patient = Patient.objects.create(user=user)
         return patient
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token pair whose claims include the user's roles and profile ids."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim, value in role_claims(user).items():
+            token[claim] = value
+        return token
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedRefreshToken
+
+
+class CachedTokenVerifySerializer(TokenVerifySerializer):
+    def validate(self, attrs):
+        token = UntypedToken(attrs["token"])
+        if api_settings.BLACKLIST_AFTER_ROTATION and is_blacklisted(
+            token.get(api_settings.JTI_CLAIM)
+        ):
+            raise serializers.ValidationError("Token is blacklisted")
+        return {}
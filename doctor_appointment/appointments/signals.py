@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils.dateparse import parse_date
+
+
+class SlotChange:
+    DECLARED = "declared"
+    UPDATED = "updated"
+    REMOVED = "removed"
+    BOOKED = "booked"
+    FREED = "freed"
+    PROMOTED = "promoted"
+
+
+# Sent once the writing transaction commits, with doctor_id, date,
+# time_slot_ids (a list) and change (a SlotChange value).
+slot_changed = Signal()
+
+
+def notify_slot_changed(doctor_id, date, time_slot_ids, change):
+    if isinstance(date, str):
+        date = parse_date(date)
+    doctor_id = int(doctor_id)
+    time_slot_ids = [int(time_slot_id) for time_slot_id in time_slot_ids]
+    transaction.on_commit(
+        lambda: slot_changed.send(
+            sender=SlotChange,
+            doctor_id=doctor_id,
+            date=date,
+            time_slot_ids=time_slot_ids,
+            change=change,
+        )
+    )
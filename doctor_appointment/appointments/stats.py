@@ -0,0 +1,136 @@
+"""
+Per doctor-day utilisation counts in DoctorDailyStats.
+
+The write paths in booking.py, schedule.py and views.py adjust the counts
+with F() expressions as they change the base tables, so a report over any
+date range reads one summary row per doctor-day. recount() recomputes the
+row-derived counts from the base tables, for bulk writers and for the
+rebuild_doctor_stats command.
+
+Bookings, cancellations and promotions keep ``booked`` in step with the
+Appointment rows, but archive_past does not touch the counts: the summary
+of an archived day outlives its rows.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum
+
+from .models import Appointment, Availability, DoctorDailyStats, Waitlist
+
+# Counts that mirror a base table: the number of its rows per doctor-day.
+COUNTED = {
+    "declared": Availability,
+    "booked": Appointment,
+    "waitlisted": Waitlist,
+}
+
+
+def record(doctor_id, date, **deltas):
+    """Add ``deltas`` (e.g. booked=1, waitlisted=-1) to a doctor-day's counts."""
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not changes:
+        return
+    day = DoctorDailyStats.objects.filter(doctor_id=doctor_id, date=date)
+    if day.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DoctorDailyStats.objects.create(doctor_id=doctor_id, date=date, **deltas)
+    except IntegrityError:
+        # Created concurrently; apply the deltas to that row instead.
+        day.update(**changes)
+
+
+def recount(date_from, date_to, doctor_id=None, fields=tuple(COUNTED)):
+    """
+    Recompute ``fields`` of every doctor-day between ``date_from`` and
+    ``date_to`` from the base tables, with one grouped query per field and
+    one upsert. ``cancelled`` counts events that leave no rows behind, so it
+    is never recomputed. Returns the number of doctor-days with rows.
+
+    The span's DoctorDailyStats rows are locked before the base tables are
+    counted, so a record() running alongside either lands before the count
+    or waits and adds to it. A doctor-day that has no summary row yet has
+    nothing to lock.
+
+    Days emptied by archive_past would be zeroed, so callers must keep the
+    span to dates the live tables still hold (see counted_span()).
+    """
+    span = dict(date__gte=date_from, date__lte=date_to)
+    if doctor_id is not None:
+        span["doctor_id"] = doctor_id
+
+    with transaction.atomic():
+        summaries = DoctorDailyStats.objects.filter(**span)
+        list(summaries.select_for_update().order_by("doctor_id", "date").values_list("id"))
+
+        days = {}
+        for field in fields:
+            rows = (
+                COUNTED[field]
+                .objects.filter(**span)
+                .order_by()
+                .values("doctor_id", "date")
+                .annotate(count=Count("id"))
+                .values_list("doctor_id", "date", "count")
+            )
+            for row_doctor_id, date, count in rows:
+                days.setdefault((row_doctor_id, date), dict.fromkeys(fields, 0))[field] = count
+
+        # Days whose rows are all gone get no upsert below.
+        summaries.update(**dict.fromkeys(fields, 0))
+        DoctorDailyStats.objects.bulk_create(
+            [
+                DoctorDailyStats(doctor_id=row_doctor_id, date=date, **counts)
+                for (row_doctor_id, date), counts in days.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["doctor", "date"],
+            update_fields=list(fields),
+        )
+    return len(days)
+
+
+def counted_span():
+    """First and last date held by the base tables, or None when all are empty."""
+    bounds = [
+        model.objects.aggregate(first=Min("date"), last=Max("date"))
+        for model in COUNTED.values()
+    ]
+    firsts = [bound["first"] for bound in bounds if bound["first"] is not None]
+    if not firsts:
+        return None
+    return min(firsts), max(bound["last"] for bound in bounds if bound["last"] is not None)
+
+
+REPORT_FIELDS = ("declared", "booked", "cancelled", "waitlisted")
+GROUPINGS = {"doctor": "doctor_id", "day": "date"}
+
+
+def report(date_from, date_to, doctor_id=None, by="doctor", queryset=None):
+    """
+    Counts summed over ``date_from``..``date_to``, one row per doctor or per
+    day, each with the share of declared slots that were booked.
+    """
+    if queryset is None:
+        queryset = DoctorDailyStats.objects.all()
+    queryset = queryset.filter(date__gte=date_from, date__lte=date_to)
+    if doctor_id is not None:
+        queryset = queryset.filter(doctor_id=doctor_id)
+    key = GROUPINGS[by]
+    columns = [key, "doctor__user__username"] if by == "doctor" else [key]
+    rows = (
+        queryset.order_by()
+        .values(*columns)
+        .annotate(**{field: Sum(field) for field in REPORT_FIELDS})
+        .order_by(key)
+    )
+    for row in rows:
+        entry = {by: row[key]}
+        if by == "doctor":
+            entry["doctor_name"] = row["doctor__user__username"]
+        entry.update((field, row[field]) for field in REPORT_FIELDS)
+        entry["utilization"] = (
+            round(row["booked"] / row["declared"], 4) if row["declared"] else None
+        )
+        yield entry
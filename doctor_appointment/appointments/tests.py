@@ -1,3 +1,1700 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+from datetime import date, time, timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, router, transaction
+from django.http import HttpResponse
+from django.test import (
+    AsyncClient,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .booking import (
+    BookingOutcome,
+    book_slot,
+    book_slots,
+    cancel_appointment,
+    process_promotions,
+)
+from .authentication import ClaimsJWTAuthentication
+from .cache import availability_cache
+from .db_routers import ReplicaRoutingMiddleware
+from .events import InProcessBroker, get_broker
+from .export import HEADER
+from .booking_window import BookingWindow
+from .idempotency import idempotency_store
+from .throttles import BookingThrottle, TokenBucketThrottle
+from .doctor_days import first_free, free_doctors, mark_free, slot_bit
+from .schedule import declare_availability
+from .onboarding import import_users
+from .search import matching_users, prefix_upper_bound
+from .serializers import AvailabilitySerializer, TimeSlotSerializer
+from .models import (
+    Appointment,
+    ArchivedAppointment,
+    Availability,
+    CustomUser,
+    Doctor,
+    DoctorDailyStats,
+    DoctorDay,
+    Patient,
+    PromotionTask,
+    ScheduleTemplate,
+    TimeSlot,
+    Waitlist,
+)
+
+
+def make_doctor(username):
+    user = CustomUser.objects.create_user(
+        username=username, email=f"{username}@example.com", password=None, is_doctor=True
+    )
+    return Doctor.objects.create(user=user)
+
+
+def make_patient(username):
+    user = CustomUser.objects.create_user(
+        username=username, email=f"{username}@example.com", password=None, is_patient=True
+    )
+    return Patient.objects.create(user=user)
+
+
+def make_slot(hour, minute=0):
+    end_minute = minute + 30
+    return TimeSlot.objects.create(
+        start_time=time(hour, minute),
+        end_time=time(hour + end_minute // 60, end_minute % 60),
+    )
+
+
+class QueryBudgetMixin:
+    """Assertions that an endpoint's query count does not grow with its data."""
+
+    def count_queries(self, client, url):
+        # Measure the database path, not the availability cache.
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return queries
+
+    def assertQueryBudget(self, client, url, grow, budget=None):
+        """
+        Fetch ``url``, call ``grow()`` to add rows, fetch it again and fail
+        unless both requests issued the same number of queries (and no more
+        than ``budget``, when given).
+        """
+        before = self.count_queries(client, url)
+        grow()
+        after = self.count_queries(client, url)
+
+        self.assertEqual(
+            len(after),
+            len(before),
+            f"{url} issued {len(before)} then {len(after)} queries:\n"
+            + "\n".join(query["sql"] for query in after.captured_queries),
+        )
+        if budget is not None:
+            self.assertLessEqual(len(after), budget)
+
+
+class BookingTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor("doctor1")
+        self.patient = make_patient("patient1")
+        self.other_patient = make_patient("patient2")
+        self.slot = make_slot(9)
+        self.day = date(2024, 5, 22)
+        Availability.objects.create(
+            doctor=self.doctor, date=self.day, time_slot=self.slot
+        )
+        self.client = APIClient()
+
+    def book(self, patient):
+        self.client.force_authenticate(patient.user)
+        return self.client.post(
+            "/api/appointments/",
+            {
+                "patient": patient.id,
+                "doctor": self.doctor.id,
+                "date": self.day.isoformat(),
+                "time_slot": self.slot.id,
+            },
+            format="json",
+        )
+
+    def test_booking_claims_slot(self):
+        response = self.book(self.patient)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Availability.objects.get().is_available)
+
+    def test_booked_slot_puts_patient_on_waitlist(self):
+        self.book(self.patient)
+
+        response = self.book(self.other_patient)
+        self.assertEqual(response.status_code, 202)
+        response = self.book(self.other_patient)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Waitlist.objects.count(), 1)
+
+    def test_patient_cannot_double_book_a_time(self):
+        self.book(self.patient)
+        other_doctor = make_doctor("doctor2")
+        Availability.objects.create(
+            doctor=other_doctor, date=self.day, time_slot=self.slot
+        )
+
+        result = book_slot(self.patient.id, other_doctor.id, self.day, self.slot.id)
+
+        self.assertEqual(result.outcome, BookingOutcome.CONFLICT)
+        # The failed insert must roll back the claim on the second slot.
+        self.assertTrue(
+            Availability.objects.get(doctor=other_doctor).is_available
+        )
+
+    def test_undeclared_slot_is_unavailable(self):
+        result = book_slot(self.patient.id, self.doctor.id, date(2024, 5, 23), self.slot.id)
+
+        self.assertEqual(result.outcome, BookingOutcome.UNAVAILABLE)
+
+    def test_cancel_promotes_head_of_waitlist(self):
+        appointment_id = self.book(self.patient).data["id"]
+        self.book(self.other_patient)
+
+        self.client.force_authenticate(self.patient.user)
+        response = self.client.delete(f"/api/appointments/{appointment_id}/")
+
+        self.assertEqual(response.status_code, 204)
+        # The slot is held for the waitlist until the worker runs.
+        self.assertFalse(Availability.objects.get().is_available)
+        self.assertEqual(PromotionTask.objects.count(), 1)
+        self.assertEqual(self.book(make_patient("patient3")).status_code, 202)
+
+        self.assertEqual(process_promotions(), 1)
+
+        self.assertEqual(Appointment.objects.get().patient, self.other_patient)
+        self.assertEqual(Waitlist.objects.count(), 1)
+        self.assertFalse(PromotionTask.objects.exists())
+        self.assertFalse(Availability.objects.get().is_available)
+
+    def test_cancel_without_waitlist_frees_slot(self):
+        appointment_id = self.book(self.patient).data["id"]
+
+        self.client.delete(f"/api/appointments/{appointment_id}/")
+
+        self.assertTrue(Availability.objects.get().is_available)
+        self.assertFalse(PromotionTask.objects.exists())
+
+    def test_promotion_skips_patients_booked_elsewhere(self):
+        self.book(self.patient)
+        Waitlist.objects.create(
+            patient=self.other_patient, doctor=self.doctor, date=self.day, time_slot=self.slot
+        )
+        other_doctor = make_doctor("doctor2")
+        Appointment.objects.create(
+            patient=self.other_patient, doctor=other_doctor, date=self.day, time_slot=self.slot
+        )
+        PromotionTask.objects.create(doctor=self.doctor, date=self.day, time_slot=self.slot)
+        Appointment.objects.filter(doctor=self.doctor).delete()
+
+        call_command("process_promotions", stdout=StringIO())
+
+        self.assertFalse(Waitlist.objects.exists())
+        self.assertTrue(Availability.objects.get().is_available)
+
+    def book_batch(self, patient, slots):
+        self.client.force_authenticate(patient.user)
+        return self.client.post(
+            "/api/appointments/batch/",
+            {
+                "patient": patient.id,
+                "slots": [
+                    {"doctor": doctor.id, "date": self.day.isoformat(), "time_slot": slot.id}
+                    for doctor, slot in slots
+                ],
+            },
+            format="json",
+        )
+
+    def test_batch_books_a_block(self):
+        slots = [self.slot, make_slot(9, 30), make_slot(10)]
+        for slot in slots[1:]:
+            Availability.objects.create(doctor=self.doctor, date=self.day, time_slot=slot)
+
+        response = self.book_batch(self.patient, [(self.doctor, slot) for slot in slots])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [row["start_time"] for row in response.data["appointments"]],
+            ["09:00:00", "09:30:00", "10:00:00"],
+        )
+        self.assertFalse(Availability.objects.filter(is_available=True).exists())
+
+    def test_batch_is_all_or_nothing(self):
+        undeclared = make_slot(10)
+
+        response = self.book_batch(
+            self.patient, [(self.doctor, self.slot), (self.doctor, undeclared)]
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["slots"][0]["time_slot"], undeclared.id)
+        self.assertFalse(Appointment.objects.exists())
+        self.assertTrue(Availability.objects.get().is_available)
+
+    def test_batch_waitlists_booked_slots(self):
+        self.book(self.other_patient)
+        later = make_slot(9, 30)
+        Availability.objects.create(doctor=self.doctor, date=self.day, time_slot=later)
+
+        response = self.book_batch(
+            self.patient, [(self.doctor, self.slot), (self.doctor, later)]
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["appointments"]), 1)
+        self.assertEqual(response.data["waitlisted"][0]["time_slot"], self.slot.id)
+        self.assertTrue(Waitlist.objects.filter(patient=self.patient).exists())
+
+    def test_batch_rejects_patient_conflicts(self):
+        self.book(self.patient)
+        other_doctor = make_doctor("doctor2")
+        Availability.objects.create(doctor=other_doctor, date=self.day, time_slot=self.slot)
+
+        response = self.book_batch(self.patient, [(other_doctor, self.slot)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Availability.objects.get(doctor=other_doctor).is_available)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor("doctor1")
+        self.patient = make_patient("patient1")
+        self.slot = make_slot(9)
+        self.day = date(2024, 5, 22)
+        Availability.objects.create(doctor=self.doctor, date=self.day, time_slot=self.slot)
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+
+    def book(self, key, time_slot=None):
+        return self.client.post(
+            "/api/appointments/",
+            {
+                "patient": self.patient.id,
+                "doctor": self.doctor.id,
+                "date": self.day.isoformat(),
+                "time_slot": time_slot or self.slot.id,
+            },
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retried_booking_replays_response(self):
+        first = self.book("retry-1")
+
+        with self.assertNumQueries(0):
+            retry = self.book("retry-1")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.data), (201, first.data))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertFalse(Waitlist.objects.exists())
+
+    def test_retried_cancellation_replays_response(self):
+        self.book("booking")
+        url = f"/api/appointments/{Appointment.objects.get().id}/"
+
+        first = self.client.delete(url, HTTP_IDEMPOTENCY_KEY="cancel")
+        retry = self.client.delete(url, HTTP_IDEMPOTENCY_KEY="cancel")
+
+        self.assertEqual((first.status_code, retry.status_code), (204, 204))
+        self.assertEqual(self.client.delete(url).status_code, 404)
+
+    def test_key_reused_for_other_request_is_rejected(self):
+        self.book("key")
+        self.assertEqual(self.book("key", make_slot(10).id).status_code, 422)
+        self.assertEqual(self.book("x" * 256).status_code, 400)
+
+    def test_duplicate_waits_for_first_request(self):
+        key = idempotency_store.key(self.patient.user.pk, "in-flight")
+        self.assertIsNone(idempotency_store.claim(key))
+        threading.Timer(0.1, idempotency_store.save, [key, {"status": 201}]).start()
+
+        self.assertEqual(idempotency_store.claim(key), {"status": 201})
+
+    def test_duplicate_gives_up_while_first_is_running(self):
+        idempotency_store.acquire(idempotency_store.key(self.patient.user.pk, "slow"))
+
+        with mock.patch.object(idempotency_store, "wait", 0.1):
+            response = self.book("slow")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Appointment.objects.exists())
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor("doctor1")
+        self.patients = [make_patient("patient1"), make_patient("patient2")]
+        self.slots = [make_slot(hour) for hour in (9, 10, 11)]
+        self.day = date(2024, 5, 22)
+        for slot in self.slots:
+            Availability.objects.create(doctor=self.doctor, date=self.day, time_slot=slot)
+        self.client = APIClient()
+        self.now = 1_000_000.0
+        clock = mock.patch.object(TokenBucketThrottle, "timer", lambda throttle: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def book(self, patient, slot, **headers):
+        self.client.force_authenticate(patient.user)
+        return self.client.post(
+            "/api/appointments/",
+            {
+                "patient": patient.id,
+                "doctor": self.doctor.id,
+                "date": self.day.isoformat(),
+                "time_slot": slot.id,
+            },
+            format="json",
+            **headers,
+        )
+
+    def rates(self, **rates):
+        return mock.patch.dict(BookingThrottle.THROTTLE_RATES, rates)
+
+    def test_user_bucket_allows_burst_then_refills(self):
+        patient = self.patients[0]
+        with self.rates(booking_user="2/min"):
+            self.assertEqual(self.book(patient, self.slots[0]).status_code, 201)
+            self.assertEqual(self.book(patient, self.slots[1]).status_code, 201)
+            throttled = self.book(patient, self.slots[2])
+            self.assertEqual(throttled.status_code, 429)
+            self.assertEqual(throttled["Retry-After"], "30")
+            # Other users have their own bucket.
+            self.assertNotEqual(self.book(self.patients[1], self.slots[2]).status_code, 429)
+
+            self.now += 30
+            self.assertEqual(self.book(patient, self.slots[2]).status_code, 202)
+
+    def test_doctor_bucket_is_shared_by_patients(self):
+        with self.rates(booking_user="1/min", booking_doctor="1/min"):
+            self.assertEqual(self.book(self.patients[0], self.slots[0]).status_code, 201)
+            self.assertEqual(self.book(self.patients[1], self.slots[1]).status_code, 429)
+            # The doctor's refusal did not spend the user's token.
+            self.doctor = make_doctor("doctor2")
+            Availability.objects.create(doctor=self.doctor, date=self.day, time_slot=self.slots[1])
+            self.assertEqual(self.book(self.patients[1], self.slots[1]).status_code, 201)
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_replays_are_not_throttled(self):
+        patient = self.patients[0]
+        with self.rates(booking_user="1/min"):
+            first = self.book(patient, self.slots[0], HTTP_IDEMPOTENCY_KEY="retry")
+            retry = self.book(patient, self.slots[0], HTTP_IDEMPOTENCY_KEY="retry")
+
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    threads = 16
+
+    def test_one_slot_is_booked_exactly_once(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("in-memory SQLite does not support concurrent writers")
+
+        doctor = make_doctor("doctor1")
+        patients = [make_patient(f"patient{i}") for i in range(self.threads)]
+        slot = make_slot(9)
+        day = date(2024, 5, 22)
+        Availability.objects.create(doctor=doctor, date=day, time_slot=slot)
+
+        barrier = threading.Barrier(self.threads)
+        outcomes = []
+
+        def worker(patient):
+            try:
+                barrier.wait()
+                outcomes.append(book_slot(patient.id, doctor.id, day, slot.id).outcome)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(p,)) for p in patients]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(outcomes.count(BookingOutcome.BOOKED), 1)
+        self.assertEqual(outcomes.count(BookingOutcome.WAITLISTED), self.threads - 1)
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(Waitlist.objects.count(), self.threads - 1)
+
+
+class BookingWindowTests(TransactionTestCase):
+    def test_busy_day_is_booked_in_arrival_order(self):
+        doctor = make_doctor("doctor1")
+        patients = [make_patient(f"patient{i}") for i in range(4)]
+        slot = make_slot(9)
+        day = date(2024, 5, 22)
+        Availability.objects.create(doctor=doctor, date=day, time_slot=slot)
+        window = BookingWindow(interval=0.2)
+        # As if another booking for the day were in flight.
+        key = (doctor.id, str(day))
+        window._in_flight[key] = 1
+        outcomes = {}
+
+        def worker(patient):
+            try:
+                outcomes[patient.id] = window.book(patient.id, doctor.id, day, slot.id).outcome
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(p,)) for p in patients]
+        for arrived, thread in enumerate(workers, start=1):
+            thread.start()
+            while len(window._windows.get(key, ())) < arrived:
+                pass
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(outcomes[patients[0].id], BookingOutcome.BOOKED)
+        self.assertEqual(Appointment.objects.get().patient_id, patients[0].id)
+        self.assertEqual(
+            list(Waitlist.objects.order_by("added_at", "id").values_list("patient_id", flat=True)),
+            [patient.id for patient in patients[1:]],
+        )
+
+    def test_follower_of_dead_leader_books_alone(self):
+        doctor, patient = make_doctor("doctor1"), make_patient("patient1")
+        slot = make_slot(9)
+        day = date(2024, 5, 22)
+        Availability.objects.create(doctor=doctor, date=day, time_slot=slot)
+        window = BookingWindow(interval=0, timeout=0.1)
+        key = (doctor.id, str(day))
+        window._in_flight[key] = 1
+        # A leader that joined and then died before booking its window.
+        window._windows[key] = [mock.Mock()]
+
+        result = window.book(patient.id, doctor.id, day, slot.id)
+
+        self.assertEqual(result.outcome, BookingOutcome.BOOKED)
+        self.assertEqual(len(window._windows[key]), 1)
+
+
+class AvailabilityPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor("doctor1")
+        self.other_doctor = make_doctor("doctor2")
+        slots = [make_slot(hour) for hour in (11, 9, 10)]
+        Availability.objects.bulk_create(
+            Availability(doctor=doctor, date=date(2024, 5, day), time_slot=slot)
+            for day in (22, 23)
+            for slot in slots
+            for doctor in (self.doctor, self.other_doctor)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(make_patient("patient1").user)
+
+    def collect(self, url):
+        rows = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            rows.extend(response.data["results"])
+            url = response.data["next"]
+        return rows
+
+    def test_pages_follow_date_and_start_time(self):
+        rows = self.collect("/api/availabilities/?page_size=4")
+
+        self.assertEqual(len(rows), 12)
+        keys = [(row["date"], row["start_time"], row["id"]) for row in rows]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_filters(self):
+        rows = self.collect(
+            f"/api/availabilities/?page_size=2&doctor={self.doctor.id}"
+            "&date_from=2024-05-23&date_to=2024-05-23"
+        )
+
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(row["doctor"] == self.doctor.id for row in rows))
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/availabilities/?cursor=bogus")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_next_free_slots(self):
+        Availability.objects.filter(
+            doctor=self.doctor, date=date(2024, 5, 22), start_time=time(10)
+        ).update(is_available=False)
+
+        response = self.client.get(
+            "/api/availabilities/next/", {"after": "2024-05-22T10:00:00Z", "k": 3}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        keys = [
+            (row["date"], row["start_time"], row["doctor"]) for row in response.data["results"]
+        ]
+        self.assertEqual(
+            keys,
+            [
+                ("2024-05-22", "10:00:00", self.other_doctor.id),
+                ("2024-05-22", "11:00:00", self.doctor.id),
+                ("2024-05-22", "11:00:00", self.other_doctor.id),
+            ],
+        )
+
+    def test_next_free_slots_for_doctors(self):
+        response = self.client.get(
+            "/api/availabilities/next/",
+            {"after": "2024-05-22T11:30:00Z", "k": 2, "doctor": [self.doctor.id]},
+        )
+
+        rows = response.data["results"]
+        self.assertEqual([row["doctor"] for row in rows], [self.doctor.id] * 2)
+        self.assertEqual(
+            [(row["date"], row["start_time"]) for row in rows],
+            [("2024-05-23", "09:00:00"), ("2024-05-23", "10:00:00")],
+        )
+
+
+class ColumnarFormatTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor("doctor1")
+        self.patient = make_patient("patient1")
+        slots = [make_slot(9), make_slot(10), make_slot(11)]
+        for day in (22, 23):
+            for slot in slots:
+                Availability.objects.create(
+                    doctor=self.doctor, date=date(2024, 5, day), time_slot=slot
+                )
+        Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, date=date(2024, 5, 24), time_slot=slots[0]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response, json.loads(response.content)
+
+    def test_availability_columns_match_json_rows(self):
+        rows = self.client.get("/api/availabilities/?page_size=4").json()["results"]
+
+        response, body = self.get("/api/availabilities/?page_size=4&format=columnar")
+
+        self.assertEqual(response["Content-Type"], "application/vnd.columnar+json")
+        columns = body["results"]
+        self.assertEqual(set(columns), set(rows[0]))
+        self.assertEqual(
+            [dict(zip(columns, values)) for values in zip(*columns.values())], rows
+        )
+        _, rest = self.get(body["next"])
+        self.assertEqual(len(rest["results"]["id"]), 2)
+
+    def test_accept_header_selects_columnar(self):
+        _, body = self.get(
+            "/api/availabilities/", HTTP_ACCEPT="application/vnd.columnar+json"
+        )
+        self.assertEqual(len(body["results"]["id"]), 6)
+        # Cached per format, so a JSON request for the same URL is not served columns.
+        self.assertIsInstance(self.client.get("/api/availabilities/").json()["results"], list)
+
+    def test_availability_bitmasks(self):
+        _, body = self.get("/api/availabilities/?format=columnar&layout=bitmask")
+
+        mask = slot_bit(time(9)) | slot_bit(time(10)) | slot_bit(time(11))
+        self.assertEqual(
+            body["results"],
+            {
+                "slot_minutes": 30,
+                "doctors": {str(self.doctor.id): {"2024-05-22": mask, "2024-05-23": mask}},
+            },
+        )
+
+    def test_appointment_columns_in_one_query(self):
+        with self.assertNumQueries(1):
+            _, body = self.get("/api/appointments/?format=columnar")
+
+        self.assertEqual(body["patient_name"], ["patient1"])
+        self.assertEqual(body["start_time"], ["09:00:00"])
+        self.assertEqual(
+            self.client.get(f"/api/appointments/{body['id'][0]}/?format=columnar").status_code,
+            404,
+        )
+
+
+class BulkAvailabilityTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor("doctor1")
+        self.slots = [make_slot(hour, minute) for hour in (9, 10, 11, 12) for minute in (0, 30)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def test_weekly_template_skips_existing_rows(self):
+        monday = date(2024, 5, 20)
+        Availability.objects.create(doctor=self.doctor, date=monday, time_slot=self.slots[0])
+
+        response = self.client.post(
+            "/api/availabilities/bulk/",
+            {
+                "doctor": self.doctor.id,
+                "date_from": "2024-05-20",
+                "date_to": "2024-05-26",
+                "weekdays": [0, 1, 2, 3, 4],
+                "start_time": "09:00",
+                "end_time": "11:00",
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {"created": 19, "skipped": 1})
+        self.assertEqual(Availability.objects.count(), 20)
+        self.assertFalse(
+            Availability.objects.filter(date__gt=monday + timedelta(days=4)).exists()
+        )
+
+    def test_explicit_slots(self):
+        response = self.client.post(
+            "/api/availabilities/bulk/",
+            {
+                "doctor": self.doctor.id,
+                "date_from": "2024-05-20",
+                "date_to": "2024-05-21",
+                "time_slots": [self.slots[0].id, self.slots[5].id],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.data, {"created": 4, "skipped": 0})
+
+    def test_rerun_counts_only_new_rows(self):
+        days = [date(2024, 5, 20), date(2024, 5, 21)]
+        slot_ids = [slot.id for slot in self.slots]
+        self.assertEqual(declare_availability(self.doctor.id, days[:1], slot_ids[:2]), (2, 0))
+
+        self.assertEqual(declare_availability(self.doctor.id, days, slot_ids[:3]), (4, 2))
+        self.assertEqual(declare_availability(self.doctor.id, days, slot_ids[:3]), (0, 6))
+        self.assertEqual(
+            DoctorDailyStats.objects.get(doctor=self.doctor, date=days[0]).declared, 3
+        )
+
+    def test_requires_slots_or_window(self):
+        response = self.client.post(
+            "/api/availabilities/bulk/",
+            {"doctor": self.doctor.id, "date_from": "2024-05-20", "date_to": "2024-05-21"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_roll_schedules_is_incremental(self):
+        ScheduleTemplate.objects.create(
+            doctor=self.doctor,
+            weekdays=0b1111111,
+            start_time=time(9),
+            end_time=time(10),
+        )
+
+        call_command("roll_schedules", days=6, stdout=StringIO())
+        self.assertEqual(Availability.objects.count(), 7 * 2)
+
+        call_command("roll_schedules", days=9, stdout=StringIO())
+        self.assertEqual(Availability.objects.count(), 10 * 2)
+
+
+class MaterializeCalendarTests(TestCase):
+    def test_populate_time_slot_is_idempotent(self):
+        make_slot(9)
+
+        call_command("populate_time_slot", stdout=StringIO())
+        call_command("populate_time_slot", stdout=StringIO())
+
+        self.assertEqual(TimeSlot.objects.count(), 24)
+        self.assertEqual(TimeSlot.objects.filter(start_time=time(9)).count(), 1)
+
+    def test_materializes_missing_rows_only(self):
+        doctors = [make_doctor("doctor1"), make_doctor("doctor2")]
+        slot = make_slot(9)
+        Availability.objects.create(doctor=doctors[0], date=date(2024, 5, 20), time_slot=slot)
+        args = ["--start=09:00", "--end=11:00", "--slot-minutes=60"]
+        args += ["--date-from=2024-05-20", "--days=7", "--weekdays=0,1,2,3,4"]
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("materialize_calendar", *args, stdout=out, stderr=StringIO())
+
+        # Hour-long slots sit alongside the existing half-hour one.
+        self.assertEqual(TimeSlot.objects.count(), 3)
+        self.assertIn("Created 20 availability slots", out.getvalue())
+        self.assertEqual(Availability.objects.count(), 2 * 5 * 2 + 1)
+        self.assertEqual(
+            DoctorDay.objects.get(doctor=doctors[1], date=date(2024, 5, 24)).free_mask,
+            slot_bit(time(9)) | slot_bit(time(10)),
+        )
+
+        out = StringIO()
+        call_command(
+            "materialize_calendar", *args, "--doctor", str(doctors[1].id),
+            stdout=out, stderr=StringIO(),
+        )
+        self.assertIn("Created 0 availability slots (10 already present)", out.getvalue())
+
+
+class ArchiveTests(TestCase):
+    def test_archive_past_moves_old_rows_only(self):
+        doctor, patient = make_doctor("doctor1"), make_patient("patient1")
+        slots = [make_slot(9), make_slot(10)]
+        today = timezone.localdate()
+        old, recent = today - timedelta(days=40), today - timedelta(days=5)
+        for day in (old, recent):
+            declare_availability(doctor.id, [day], [slot.id for slot in slots])
+            book_slot(patient.id, doctor.id, day, slots[0].id)
+            book_slot(make_patient(f"p{day:%d%m}").id, doctor.id, day, slots[0].id)
+        appointment_id = Appointment.objects.get(date=old).id
+
+        out = StringIO()
+        call_command("archive_past", "--keep-days=30", "--batch-size=1", stdout=out)
+
+        self.assertIn("Archived 1 appointments", out.getvalue())
+        self.assertIn("deleted 2 availability and 1 waitlist rows", out.getvalue())
+        archived = ArchivedAppointment.objects.get()
+        self.assertEqual(
+            (archived.appointment_id, archived.date, archived.start_time, archived.patient_id),
+            (appointment_id, old, time(9), patient.id),
+        )
+        self.assertFalse(Availability.objects.filter(date=old).exists())
+        self.assertEqual(Availability.objects.filter(date=recent).count(), 2)
+        self.assertTrue(Appointment.objects.filter(date=recent).exists())
+        # The doctor-day summary of the archived day is kept.
+        self.assertEqual(
+            DoctorDay.objects.get(doctor=doctor, date=old).booked_mask, slot_bit(time(9))
+        )
+
+        out = StringIO()
+        call_command("archive_past", "--keep-days=30", stdout=out)
+        self.assertIn("Archived 0 appointments", out.getvalue())
+
+    def test_partitioning_requires_postgres(self):
+        if connection.vendor == "postgresql":
+            self.skipTest("Only checks the error raised on other databases.")
+        with self.assertRaisesMessage(CommandError, "requires PostgreSQL"):
+            call_command("partition_tables", stdout=StringIO())
+
+
+class DoctorDayTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor("doctor1")
+        self.other_doctor = make_doctor("doctor2")
+        self.patient = make_patient("patient1")
+        self.slots = [make_slot(9), make_slot(9, 30), make_slot(10)]
+        self.day = date(2024, 5, 22)
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+        self.client.post(
+            "/api/availabilities/bulk/",
+            {
+                "doctor": self.doctor.id,
+                "date_from": "2024-05-22",
+                "date_to": "2024-05-23",
+                "time_slots": [slot.id for slot in self.slots],
+            },
+            format="json",
+        )
+
+    def masks(self, doctor=None, day=None):
+        row = DoctorDay.objects.get(doctor=doctor or self.doctor, date=day or self.day)
+        return row.free_mask, row.booked_mask
+
+    def test_masks_follow_bookings_and_cancellations(self):
+        nine, half_nine, ten = (slot_bit(slot.start_time) for slot in self.slots)
+        self.assertEqual(self.masks(), (nine | half_nine | ten, 0))
+
+        result = book_slot(self.patient.id, self.doctor.id, self.day, self.slots[1].id)
+        self.assertEqual(self.masks(), (nine | ten, half_nine))
+
+        self.client.force_authenticate(self.patient.user)
+        self.client.delete(f"/api/appointments/{result.appointment.id}/")
+        self.assertEqual(self.masks(), (nine | half_nine | ten, 0))
+
+    def test_masks_read_current_slot_times(self):
+        book_slot(self.patient.id, self.doctor.id, self.day, self.slots[2].id)
+        TimeSlot.objects.filter(id=self.slots[2].id).update(start_time=time(11))
+
+        mark_free(self.doctor.id, self.day, [self.slots[2].id])
+        free_mask, _ = self.masks()
+        self.assertTrue(free_mask & slot_bit(time(11)))
+
+    def test_off_grid_slots_are_not_represented(self):
+        self.assertEqual(slot_bit(time(9, 15)), 0)
+        self.assertEqual(slot_bit(time(0, 0)), 1)
+        self.assertEqual(slot_bit(time(23, 30)), 1 << 47)
+
+    def test_free_doctors(self):
+        Availability.objects.create(
+            doctor=self.other_doctor, date=self.day, time_slot=self.slots[2]
+        )
+        book_slot(self.patient.id, self.other_doctor.id, self.day, self.slots[2].id)
+        book_slot(self.patient.id, self.doctor.id, self.day, self.slots[0].id)
+
+        self.assertEqual(free_doctors(self.day, time(9)), [])
+        self.assertEqual(free_doctors(self.day, time(10)), [self.doctor.id])
+
+        response = self.client.get(
+            "/api/availabilities/free_doctors/", {"date": "2024-05-22", "time": "09:30"}
+        )
+        self.assertEqual(response.data["doctors"], [self.doctor.id])
+
+    def test_first_free(self):
+        for slot in self.slots[:2]:
+            book_slot(self.patient.id, self.doctor.id, self.day, slot.id)
+
+        self.assertEqual(first_free(self.doctor.id, self.day), (self.day, time(10)))
+        self.assertIsNone(first_free(self.other_doctor.id, self.day))
+
+        response = self.client.get(
+            "/api/availabilities/first_free/",
+            {"doctor": self.doctor.id, "date_from": "2024-05-23", "days": 3},
+        )
+        self.assertEqual(response.data, {"date": date(2024, 5, 23), "start_time": time(9)})
+
+
+class AvailabilityCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor("doctor1")
+        self.patient = make_patient("patient1")
+        self.slot = make_slot(9)
+        self.day = date(2024, 5, 22)
+        Availability.objects.create(doctor=self.doctor, date=self.day, time_slot=self.slot)
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+        self.url = (
+            f"/api/availabilities/?doctor={self.doctor.id}"
+            f"&date_from={self.day}&date_to={self.day}"
+        )
+
+    def test_repeated_reads_are_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(availability_cache.stats(), {"hits": 1, "misses": 1})
+
+    def test_booking_invalidates_doctor_day(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_slot(self.patient.id, self.doctor.id, self.day, self.slot.id)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["results"], [])
+
+    def test_availability_update_invalidates_listing(self):
+        self.client.get("/api/availabilities/")
+        self.client.force_authenticate(self.doctor.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/availabilities/{Availability.objects.get().id}/")
+
+        response = self.client.get("/api/availabilities/")
+        self.assertEqual(response.data["results"], [])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor("doctor1")
+        self.slot = make_slot(9)
+        self.day = date(2024, 5, 22)
+        Availability.objects.create(doctor=self.doctor, date=self.day, time_slot=self.slot)
+        self.user = make_patient("patient1").user
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = (
+            f"/api/availabilities/?doctor={self.doctor.id}"
+            f"&date_from={self.day}&date_to={self.day}"
+        )
+
+    def test_unchanged_timeslots_return_304_without_serializing(self):
+        response = self.client.get("/api/timeslots/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("Last-Modified", response)
+
+        with mock.patch.object(
+            TimeSlotSerializer, "to_representation"
+        ) as serialize, self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/timeslots/", headers={"If-None-Match": response["ETag"]}
+            )
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        serialize.assert_not_called()
+
+    def test_new_timeslot_changes_etag(self):
+        etag = self.client.get(f"/api/timeslots/{self.slot.id}/")["ETag"]
+
+        make_slot(10)
+
+        response = self.client.get(
+            f"/api/timeslots/{self.slot.id}/", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_availability_revalidates_per_doctor_day(self):
+        response = self.client.get(self.url)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        with mock.patch.object(AvailabilitySerializer, "to_representation") as serialize:
+            self.assertEqual(
+                self.client.get(self.url, headers={"If-None-Match": etag}).status_code, 304
+            )
+            self.assertEqual(
+                self.client.get(self.url, headers={"If-Modified-Since": last_modified}).status_code,
+                304,
+            )
+        serialize.assert_not_called()
+
+        # Another doctor's day leaves this one's validators alone.
+        other = make_doctor("doctor2")
+        with self.captureOnCommitCallbacks(execute=True):
+            declare_availability(other.id, [self.day], [self.slot.id])
+        self.assertEqual(
+            self.client.get(self.url, headers={"If-None-Match": etag}).status_code, 304
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_slot(make_patient("patient2").id, self.doctor.id, self.day, self.slot.id)
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"], [])
+
+    def test_errors_carry_no_validators(self):
+        response = self.client.get("/api/availabilities/999/")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("ETag", response)
+
+    async def test_async_timeslots_return_304(self):
+        client = AsyncClient()
+        headers = {"authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        response = await client.get("/api/async/timeslots/", headers=headers)
+
+        response = await client.get(
+            "/api/async/timeslots/", headers={**headers, "If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class AvailabilityEventTests(TestCase):
+    def setUp(self):
+        self.patient = make_patient("patient1")
+
+    def test_write_paths_publish_events(self):
+        doctor, patient, slot = make_doctor("doctor1"), self.patient, make_slot(9)
+        day = date(2024, 5, 22)
+        broker = get_broker()
+        start = broker.publish(0, day, [], "marker")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            declare_availability(doctor.id, [day], [slot.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            book_slot(patient.id, doctor.id, day, slot.id)
+
+        events = broker.replay(start.id)
+        self.assertEqual([event.change for event in events], ["declared", "booked"])
+        self.assertEqual((events[1].doctor_id, events[1].date), (doctor.id, day))
+        self.assertEqual(events[1].time_slot_ids, [slot.id])
+
+    def test_replay_needs_a_buffered_id(self):
+        broker = InProcessBroker(buffer_size=2)
+        first = broker.publish(1, date(2024, 5, 22), [1], "booked")
+        second = broker.publish(1, date(2024, 5, 22), [2], "booked")
+        third = broker.publish(1, date(2024, 5, 22), [3], "freed")
+
+        self.assertEqual(broker.replay(second.id), [third])
+        self.assertEqual(broker.replay(first.id), [second, third])
+        self.assertEqual(broker.replay(third.id), [])
+        self.assertIsNone(broker.replay("0-1"))
+        self.assertIsNone(broker.replay(f"{broker.epoch}-{first.sequence - 1}"))
+
+    async def test_stream_filters_and_resumes(self):
+        broker = get_broker()
+        day = date(2024, 5, 22)
+        seen = broker.publish(1, day, [1], "booked")
+        missed = broker.publish(1, day, [2], "freed")
+        broker.publish(2, day, [3], "freed")
+
+        response = await AsyncClient().get(
+            "/api/async/availabilities/events/?doctor=1",
+            headers={
+                "authorization": f"Bearer {AccessToken.for_user(self.patient.user)}",
+                "Last-Event-ID": seen.id,
+            },
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+
+        chunk = (await anext(stream)).decode()
+        self.assertIn(f"id: {missed.id}\nevent: freed\n", chunk)
+        broker.publish(2, day, [4], "promoted")
+        live = broker.publish(1, day, [5], "promoted")
+        chunk = (await anext(stream)).decode()
+        self.assertIn(f"id: {live.id}\n", chunk)
+        self.assertEqual(json.loads(chunk.split("data: ")[1])["time_slots"], [5])
+        await stream.aclose()
+
+
+class AppointmentSearchTests(TestCase):
+    def setUp(self):
+        self.smith = make_doctor("drsmith")
+        self.jones = make_doctor("drjones")
+        self.alice = make_patient("alice")
+        self.bob = make_patient("bob")
+        slots = [make_slot(9), make_slot(10)]
+        for doctor, patient, day, slot in [
+            (self.smith, self.alice, 22, slots[0]),
+            (self.smith, self.bob, 22, slots[1]),
+            (self.jones, self.alice, 23, slots[1]),
+        ]:
+            Appointment.objects.create(
+                doctor=doctor, patient=patient, date=date(2024, 5, day), time_slot=slot
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice.user)
+
+    def search(self, query):
+        response = self.client.get(f"/api/appointments/search/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_search_by_doctor_and_patient(self):
+        self.assertEqual(self.search("doctor=DRSM")["count"], 2)
+        self.assertEqual(self.search("doctor=drsmith&patient=bob")["count"], 1)
+
+    def test_blank_names_are_ignored(self):
+        self.assertEqual(self.search("doctor=&patient=alice")["count"], 2)
+
+    def test_prefix_of_last_code_point(self):
+        self.assertEqual(prefix_upper_bound("ab"), "ac")
+        self.assertEqual(prefix_upper_bound("a\U0010ffff"), "b")
+        self.assertIsNone(prefix_upper_bound("\U0010ffff"))
+        self.assertEqual(self.search("doctor=%F4%8F%BF%BF")["count"], 0)
+
+    def test_search_filters_and_paginates(self):
+        data = self.search("patient=alice&date_from=2024-05-23")
+        self.assertEqual(data["count"], 1)
+
+        data = self.search("doctor=dr&page_size=2")
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(len(data["results"]), 2)
+        self.assertIsNotNone(data["next"])
+
+        self.assertEqual(self.search("status=upcoming")["count"], 0)
+        self.assertEqual(self.search("status=past")["count"], 3)
+
+    def test_name_lookup_uses_index(self):
+        if connection.vendor == "postgresql":
+            index = "customuser_username_trgm_idx"
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    # The table is tiny; make the planner show its hand.
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                plan = matching_users("smi").explain()
+        else:
+            index = "customuser_username_lower_idx"
+            plan = matching_users("drs").explain()
+
+        self.assertIn(index, plan)
+
+
+class AppointmentExportTests(TestCase):
+    def setUp(self):
+        self.smith = make_doctor("drsmith")
+        self.jones = make_doctor("drjones")
+        self.alice = make_patient("alice")
+        slots = [make_slot(9), make_slot(10)]
+        for doctor, day, slot in [
+            (self.smith, 22, slots[1]),
+            (self.smith, 22, slots[0]),
+            (self.jones, 24, slots[0]),
+        ]:
+            Appointment.objects.create(
+                doctor=doctor, patient=self.alice, date=date(2024, 5, day), time_slot=slot
+            )
+        self.admin = CustomUser.objects.create_user(
+            username="admin", email="admin@example.com", password=None, is_staff=True
+        )
+        self.client = APIClient()
+
+    def export(self, user, query=""):
+        self.client.force_authenticate(user)
+        response = self.client.get(f"/api/appointments/export/?{query}")
+        if response.status_code == 200:
+            self.assertTrue(response.streaming)
+            response.body = b"".join(response.streaming_content).decode()
+        return response
+
+    def test_csv_export_in_date_order(self):
+        response = self.export(self.admin, "date_to=2024-05-23")
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = response.body.splitlines()
+        self.assertEqual(lines[0], ",".join(HEADER))
+        self.assertEqual(len(lines), 3)
+        self.assertIn(",2024-05-22,09:00:00,09:30:00,", lines[1])
+        self.assertIn(",drsmith,", lines[1])
+        self.assertIn(",alice", lines[1])
+
+    def test_ndjson_export(self):
+        response = self.export(self.admin, f"format=ndjson&doctor={self.jones.id}")
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = [json.loads(line) for line in response.body.splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["date"], "2024-05-24")
+        self.assertEqual(records[0]["doctor_name"], "drjones")
+        self.assertEqual(records[0]["patient_id"], self.alice.id)
+
+    def test_doctors_export_only_their_own(self):
+        response = self.export(self.smith.user, f"format=ndjson&doctor={self.jones.id}")
+
+        self.assertEqual(len(response.body.splitlines()), 2)
+        self.assertEqual(self.export(self.alice.user).status_code, 403)
+        no_profile = CustomUser.objects.create_user(
+            username="noprofile", email="noprofile@example.com", password=None, is_doctor=True
+        )
+        self.assertEqual(self.export(no_profile).status_code, 403)
+
+    def test_export_command(self):
+        out, err = StringIO(), StringIO()
+
+        call_command(
+            "export_appointments", "--date-from=2024-05-23", "--chunk-size=1",
+            stdout=out, stderr=err,
+        )
+
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+        self.assertIn("Exported 1 appointments", err.getvalue())
+
+
+class DoctorStatsTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor("doctor1")
+        self.patients = [make_patient(f"patient{i}") for i in range(3)]
+        self.slots = [make_slot(9), make_slot(10)]
+        self.day = date(2024, 5, 20)
+        declare_availability(self.doctor.id, [self.day], [slot.id for slot in self.slots])
+
+    def counts(self, day=None):
+        row = DoctorDailyStats.objects.get(doctor=self.doctor, date=day or self.day)
+        return row.declared, row.booked, row.cancelled, row.waitlisted
+
+    def test_write_paths_keep_counts(self):
+        first, second, third = self.patients
+        book_slot(first.id, self.doctor.id, self.day, self.slots[0].id)
+        book_slot(second.id, self.doctor.id, self.day, self.slots[0].id)
+        book_slots(third.id, [(self.doctor.id, self.day, slot.id) for slot in self.slots])
+        self.assertEqual(self.counts(), (2, 2, 0, 2))
+
+        cancel_appointment(Appointment.objects.get(patient=first))
+        process_promotions()
+        self.assertEqual(self.counts(), (2, 2, 1, 1))
+
+    def test_rebuild_matches_incremental_counts(self):
+        book_slot(self.patients[0].id, self.doctor.id, self.day, self.slots[0].id)
+        book_slot(self.patients[1].id, self.doctor.id, self.day, self.slots[0].id)
+        cancel_appointment(Appointment.objects.get())
+        expected = self.counts()
+        DoctorDailyStats.objects.update(declared=7, booked=7, waitlisted=7)
+
+        out = StringIO()
+        call_command("rebuild_doctor_stats", "--batch-days=1", stdout=out)
+
+        self.assertIn("Rebuilt 1 doctor-day summaries", out.getvalue())
+        # Cancellations leave no rows to recount and are kept.
+        self.assertEqual(self.counts(), expected)
+
+    def test_rebuild_keeps_archived_days(self):
+        book_slot(self.patients[0].id, self.doctor.id, self.day, self.slots[0].id)
+        expected = self.counts()
+        recent = timezone.localdate() - timedelta(days=5)
+        declare_availability(self.doctor.id, [recent], [self.slots[0].id])
+        call_command("archive_past", "--keep-days=30", stdout=StringIO())
+
+        out = StringIO()
+        call_command(
+            "rebuild_doctor_stats", f"--date-from={self.day}", f"--date-to={recent}", stdout=out
+        )
+
+        self.assertIn(f"Rebuilt 1 doctor-day summaries from {recent}", out.getvalue())
+        self.assertEqual(self.counts(), expected)
+        self.assertEqual(self.counts(recent), (1, 0, 0, 0))
+
+    def test_report(self):
+        other_day = self.day + timedelta(days=1)
+        declare_availability(self.doctor.id, [other_day], [self.slots[0].id])
+        book_slot(self.patients[0].id, self.doctor.id, self.day, self.slots[0].id)
+        client = APIClient()
+        client.force_authenticate(self.doctor.user)
+        url = f"/api/doctor_stats/?date_from={self.day}&date_to={other_day}"
+
+        by_doctor = client.get(url).json()
+        self.assertEqual(
+            by_doctor,
+            [
+                {
+                    "doctor": self.doctor.id,
+                    "doctor_name": "doctor1",
+                    "declared": 3,
+                    "booked": 1,
+                    "cancelled": 0,
+                    "waitlisted": 0,
+                    "utilization": 0.3333,
+                }
+            ],
+        )
+        by_day = client.get(url + "&by=day").json()
+        self.assertEqual([row["declared"] for row in by_day], [2, 1])
+
+        client.force_authenticate(self.patients[0].user)
+        self.assertEqual(client.get(url).status_code, 403)
+        client.force_authenticate(
+            CustomUser.objects.create_user(
+                username="noprofile", email="noprofile@example.com", password=None, is_doctor=True
+            )
+        )
+        self.assertEqual(client.get(url).status_code, 403)
+
+
+class MetricsTests(TestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_are_timed_per_route_and_action(self):
+        labels = dict(route="timeslot-list", action="list", method="GET", status="200")
+        before = self.sample("http_request_duration_seconds_count", **labels)
+        queries_before = self.sample("http_request_db_queries_sum", **labels)
+        make_slot(9)
+        client = APIClient()
+        client.force_authenticate(make_patient("patient1").user)
+
+        client.get("/api/timeslots/")
+
+        self.assertEqual(self.sample("http_request_duration_seconds_count", **labels), before + 1)
+        self.assertGreater(self.sample("http_request_db_queries_sum", **labels), queries_before)
+        self.assertGreater(self.sample("http_response_size_bytes_sum", **labels), 0)
+
+    def test_booking_outcomes_are_counted(self):
+        doctor, patient, slot = make_doctor("doctor1"), make_patient("patient1"), make_slot(9)
+        day = date(2024, 5, 22)
+        Availability.objects.create(doctor=doctor, date=day, time_slot=slot)
+        booked = self.sample("booking_outcomes_total", kind="single", outcome="booked")
+        waitlisted = self.sample("booking_outcomes_total", kind="single", outcome="waitlisted")
+
+        book_slot(patient.id, doctor.id, day, slot.id)
+        book_slot(make_patient("patient2").id, doctor.id, day, slot.id)
+
+        self.assertEqual(
+            self.sample("booking_outcomes_total", kind="single", outcome="booked"), booked + 1
+        )
+        self.assertEqual(
+            self.sample("booking_outcomes_total", kind="single", outcome="waitlisted"),
+            waitlisted + 1,
+        )
+
+    def test_metrics_endpoint(self):
+        self.client.get("/api/timeslots/")
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(b"http_request_duration_seconds_bucket{", response.content)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.slots = [make_slot(hour) for hour in range(9, 15)]
+        self.patients = [make_patient(f"patient{i}") for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.patients[0].user)
+        self.days = iter(range(1, 29))
+        self.add_rows()
+
+    def add_rows(self):
+        doctor = make_doctor(f"doctor{Doctor.objects.count()}")
+        day = date(2024, 5, next(self.days))
+        for slot, patient in zip(self.slots, self.patients):
+            Appointment.objects.create(doctor=doctor, patient=patient, date=day, time_slot=slot)
+        for slot in self.slots:
+            Availability.objects.create(doctor=doctor, date=day, time_slot=slot)
+
+    def test_appointment_list(self):
+        self.assertQueryBudget(self.client, "/api/appointments/", self.add_rows, budget=1)
+
+    def test_appointment_search(self):
+        self.assertQueryBudget(
+            self.client, "/api/appointments/search/?doctor=doctor", self.add_rows, budget=2
+        )
+
+    def test_availability_list(self):
+        self.assertQueryBudget(self.client, "/api/availabilities/", self.add_rows, budget=1)
+
+    def test_next_free_slots(self):
+        url = "/api/availabilities/next/?after=2024-05-01T00:00:00Z"
+        self.assertQueryBudget(self.client, url, self.add_rows, budget=1)
+
+    def test_expanded_fields(self):
+        row = self.client.get("/api/appointments/").data[0]
+
+        self.assertEqual(row["doctor_name"], "doctor0")
+        self.assertEqual(row["patient_name"], "patient0")
+        self.assertEqual((row["start_time"], row["end_time"]), ("09:00:00", "09:30:00"))
+
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor("drsmith")
+        self.patient = make_patient("alice")
+        self.slots = [make_slot(hour) for hour in (9, 10, 11)]
+        for slot in self.slots:
+            Availability.objects.create(doctor=self.doctor, date=date(2024, 5, 22), time_slot=slot)
+        Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, date=date(2024, 5, 22), time_slot=self.slots[0]
+        )
+        self.headers = {"authorization": f"Bearer {AccessToken.for_user(self.patient.user)}"}
+
+    async def get(self, url):
+        return await AsyncClient().get(url, headers=self.headers)
+
+    async def test_availability_list_matches_sync_view(self):
+        response = await self.get("/api/async/availabilities/?page_size=2")
+        data = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data["results"]), 2)
+        self.assertEqual(data["results"][0]["doctor_name"], "drsmith")
+        response = await self.get(data["next"])
+        self.assertEqual(len(response.json()["results"]), 1)
+
+    async def test_timeslots_and_search(self):
+        response = await self.get("/api/async/timeslots/")
+        self.assertEqual([slot["start_time"] for slot in response.json()][0], "09:00:00")
+
+        response = await self.get("/api/async/appointments/search/?doctor=drsm")
+        data = response.json()
+        self.assertEqual(data["count"], 1)
+        self.assertEqual(data["results"][0]["patient_name"], "alice")
+
+    async def test_requires_authentication(self):
+        response = await AsyncClient().get("/api/async/timeslots/")
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.get("/api/async/availabilities/?date_from=bogus")
+        self.assertEqual(response.status_code, 400)
+
+        response = await AsyncClient().post("/api/async/timeslots/", headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"], REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTests(TransactionTestCase):
+    # Not TestCase: its wrapping transaction would keep every read on the primary.
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory(headers={"Authorization": "Bearer token"})
+
+        def view(request):
+            self.read_from = router.db_for_read(TimeSlot)
+            if request.method == "POST":
+                self.wrote_to = router.db_for_write(TimeSlot)
+                self.read_after_write = router.db_for_read(TimeSlot)
+            return HttpResponse(status=200)
+
+        self.middleware = ReplicaRoutingMiddleware(view)
+
+    def test_safe_reads_go_to_replica(self):
+        self.middleware(self.factory.get("/api/timeslots/"))
+        self.assertEqual(self.read_from, "replica1")
+
+        self.middleware(self.factory.get("/api/appointments/"))
+        self.assertEqual(self.read_from, "default")
+
+    def test_writes_pin_client_to_primary(self):
+        self.middleware(self.factory.post("/api/appointments/"))
+        self.assertEqual(self.wrote_to, "default")
+        self.assertEqual(self.read_after_write, "default")
+
+        self.middleware(self.factory.get("/api/timeslots/"))
+        self.assertEqual(self.read_from, "default")
+
+        other_client = RequestFactory(headers={"Authorization": "Bearer other"})
+        self.middleware(other_client.get("/api/timeslots/"))
+        self.assertEqual(self.read_from, "replica1")
+
+    def test_cached_availability_is_built_from_primary(self):
+        def view(request):
+            self.read_from = availability_cache.get_or_set(
+                None, "replica-test", lambda: router.db_for_read(TimeSlot)
+            )
+            return HttpResponse()
+
+        with override_settings(REPLICA_READ_VIEWS=["timeslot-list"]):
+            ReplicaRoutingMiddleware(view)(self.factory.get("/api/timeslots/"))
+        self.assertEqual(self.read_from, "default")
+
+    def test_reads_in_transactions_stay_on_primary(self):
+        def view(request):
+            with transaction.atomic():
+                self.read_from = router.db_for_read(TimeSlot)
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(self.factory.get("/api/timeslots/"))
+        self.assertEqual(self.read_from, "default")
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ClaimsJWTAuthentication.user_cache.clear()
+        self.patient = make_patient("patient1")
+        self.patient.user.set_password("secret-password")
+        self.patient.user.save()
+        self.client = APIClient()
+
+    def obtain(self):
+        response = self.client.post(
+            "/api/api/token_obtain/",
+            {"username": "patient1", "password": "secret-password"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_tokens_carry_role_claims(self):
+        claims = AccessToken(self.obtain()["access"])
+
+        self.assertTrue(claims["is_patient"])
+        self.assertFalse(claims["is_doctor"])
+        self.assertEqual(claims["patient_id"], self.patient.id)
+        self.assertIsNone(claims["doctor_id"])
+
+    def test_requests_do_not_load_the_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.obtain()['access']}")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/timeslots/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+    def test_tokens_without_claims_use_cached_user(self):
+        token = AccessToken.for_user(self.patient.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.client.get("/api/timeslots/")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/timeslots/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+    def test_ownership_checks_use_profile_ids(self):
+        doctor = make_doctor("doctor1")
+        slot = make_slot(9)
+        other = Appointment.objects.create(
+            patient=make_patient("patient2"),
+            doctor=doctor,
+            date=date(2024, 5, 22),
+            time_slot=slot,
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.obtain()['access']}")
+
+        response = self.client.delete(f"/api/appointments/{other.id}/")
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_blacklist_lookups_are_cached(self):
+        refresh = self.obtain()["refresh"]
+        url = "/api/api/token_refresh/"
+
+        self.assertEqual(self.client.post(url, {"refresh": refresh}).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(url, {"refresh": refresh}).status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+        RefreshToken(refresh).blacklist()
+        self.assertTrue(BlacklistedToken.objects.exists())
+        self.assertEqual(self.client.post(url, {"refresh": refresh}).status_code, 401)
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+)
+class OnboardingTests(TestCase):
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, "w") as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_users_command_is_resumable(self):
+        path = self.write_file(
+            ".csv",
+            "username,email,password,role\n"
+            + "".join(
+                f"user{i},user{i}@example.com,pw-{i},{'doctor' if i % 2 else 'patient'}\n"
+                for i in range(10)
+            )
+            + "bad,,pw,doctor\n",
+        )
+        out, err = StringIO(), StringIO()
+
+        call_command(
+            "import_users", path, "--workers", "2", "--chunk-size", "4", stdout=out, stderr=err
+        )
+
+        self.assertIn("Created 10 users", out.getvalue())
+        self.assertIn("line 12: Missing email", err.getvalue())
+        self.assertEqual(Doctor.objects.count(), 5)
+        self.assertEqual(Patient.objects.count(), 5)
+        self.assertTrue(CustomUser.objects.get(username="user3").check_password("pw-3"))
+
+        out = StringIO()
+        call_command("import_users", path, "--workers", "0", stdout=out, stderr=StringIO())
+        self.assertIn("Created 0 users, skipped 10 existing", out.getvalue())
+
+    def test_bulk_registration_endpoint(self):
+        admin = CustomUser.objects.create_user(
+            username="admin", email="admin@example.com", password=None, is_staff=True
+        )
+        make_patient("taken")
+        client = APIClient()
+        client.force_authenticate(admin)
+        body = "\n".join(
+            [
+                '{"username": "new1", "email": "new1@example.com", "password": "pw"}',
+                '{"username": "taken", "email": "other@example.com", "password": "pw"}',
+                "not json",
+            ]
+        )
+
+        response = client.post(
+            "/api/register_bulk/?role=patient", body, content_type="application/x-ndjson"
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data["created"], response.data["skipped"]), (1, 1))
+        self.assertEqual(response.data["errors"][0]["line"], 3)
+        self.assertTrue(Patient.objects.filter(user__username="new1").exists())
+
+    @override_settings(ONBOARDING_MAX_RECORDS=2)
+    def test_bulk_registration_endpoint_caps_records(self):
+        admin = CustomUser.objects.create_user(
+            username="admin", email="admin@example.com", password=None, is_staff=True
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+        body = "".join(
+            f'{{"username": "u{i}", "email": "u{i}@example.com", "password": "pw"}}\n'
+            for i in range(3)
+        )
+
+        response = client.post(
+            "/api/register_bulk/?role=patient", body, content_type="application/x-ndjson"
+        )
+
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("import_users", response.data["error"])
+        self.assertFalse(Patient.objects.exists())
+
+    def test_invalid_usernames_and_emails_are_reported(self):
+        records = [
+            (1, {"username": "x" * 151, "email": "long@example.com", "password": "pw"}),
+            (2, {"username": "bad email", "email": "not-an-email", "password": "pw"}),
+            (3, {"username": "fine", "email": "fine@example.com", "password": "pw"}),
+        ]
+
+        summary = import_users(records, default_role="patient")
+
+        self.assertEqual(summary.created, 1)
+        self.assertEqual([error["line"] for error in summary.errors], [1, 2])
+        self.assertTrue(summary.errors[0]["error"].startswith("username:"))
+        self.assertTrue(summary.errors[1]["error"].startswith("username:"))
+        self.assertFalse(CustomUser.objects.filter(email="long@example.com").exists())
+
+        summary = import_users(
+            [(1, {"username": "ok", "email": "not-an-email", "password": "pw"})],
+            default_role="patient",
+        )
+        self.assertEqual(summary.errors[0]["error"], "email: Enter a valid email address.")
+
+    def test_users_registered_while_hashing_are_skipped(self):
+        class RacingExecutor:
+            def map(self, function, passwords, chunksize=1):
+                make_patient("racer")
+                return map(function, passwords)
+
+        records = [
+            (1, {"username": "racer", "email": "racer@example.com", "password": "pw"}),
+            (2, {"username": "calm", "email": "calm@example.com", "password": "pw"}),
+        ]
+
+        summary = import_users(records, RacingExecutor(), "patient")
+
+        self.assertEqual((summary.created, summary.skipped), (1, 1))
+        self.assertTrue(Patient.objects.filter(user__username="calm").exists())
+
+    def test_registration_saves_user_once(self):
+        client = APIClient()
+        client.force_authenticate(make_doctor("admin").user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(
+                "/api/register_patient/",
+                {"user": {"username": "p1", "email": "p1@example.com", "password": "pw"}},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 201)
+        inserts = [query for query in queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 2)
+        self.assertTrue(CustomUser.objects.get(username="p1").check_password("pw"))
@@ -0,0 +1,124 @@
+"""
+Token-bucket throttles for the booking endpoints.
+
+Each bucket holds up to N tokens for a rate of "N/period" in
+REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] and refills continuously at that
+rate, so a client may spend a burst of N at once but no more than N per
+period on average. Buckets live in the cache named by
+settings.THROTTLE_CACHE, which must be shared by every process for the
+limits to hold across them.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Spends one token from each bucket get_buckets() names, or from none.
+
+    Every bucket is checked before any is debited, so a request refused by
+    one bucket costs nothing in the others. Buckets are updated under short
+    cache.add locks, taken in key order so that two requests sharing
+    buckets cannot deadlock; a request waits for a busy lock rather than
+    being refused, since a lock only guards a few cache round trips.
+    """
+
+    THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+    cache_format = "throttle_%(scope)s_%(ident)s"
+    lock_timeout = 1
+    timer = time.time
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "THROTTLE_CACHE", "default")]
+
+    def get_rate(self, scope):
+        """(tokens, seconds) for ``scope``'s rate, or None when it is not limited."""
+        rate = self.THROTTLE_RATES.get(scope)
+        if rate is None:
+            return None
+        num, period = rate.split("/")
+        return int(num), PERIODS[period[0]]
+
+    def bucket(self, scope, ident):
+        rate = self.get_rate(scope)
+        if rate is None:
+            return None
+        return (self.cache_format % {"scope": scope, "ident": ident}, *rate)
+
+    def get_buckets(self, request, view):
+        """(cache key, capacity, seconds to refill it) of each bucket to draw from."""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        buckets = sorted(filter(None, self.get_buckets(request, view)))
+        if not buckets:
+            return True
+        keys = [key for key, _, _ in buckets]
+        locks = [f"{key}:lock" for key in keys]
+        for lock in locks:
+            while not self.cache.add(lock, 1, self.lock_timeout):
+                time.sleep(0.001)
+        try:
+            now = self.timer()
+            states = self.cache.get_many(keys)
+            levels = {}
+            waits = []
+            for key, capacity, seconds in buckets:
+                refill = capacity / seconds
+                tokens, updated = states.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * refill)
+                if tokens < 1:
+                    waits.append((1 - tokens) / refill)
+                levels[key] = tokens
+            if waits:
+                self.wait_seconds = max(waits)
+                return False
+            # A bucket left alone for a full period is full again anyway.
+            self.cache.set_many(
+                {key: (levels[key] - 1, now) for key in keys},
+                max(seconds for _, _, seconds in buckets),
+            )
+            return True
+        finally:
+            self.cache.delete_many(locks)
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class BookingThrottle(TokenBucketThrottle):
+    """
+    Draws from the booking user's bucket (scope "booking_user") and from the
+    bucket of every doctor booked (scope "booking_doctor"), which everyone
+    booking with that doctor shares.
+    """
+
+    def get_buckets(self, request, view):
+        if request.user and request.user.is_authenticated:
+            user = request.user.pk
+        else:
+            user = self.get_ident(request)
+        return [self.bucket("booking_user", user)] + [
+            self.bucket("booking_doctor", doctor) for doctor in self.doctors(request)
+        ]
+
+    def doctors(self, request):
+        data = request.data if hasattr(request.data, "get") else {}
+        slots = data.get("slots")
+        if isinstance(slots, list):
+            # A batch draws from the bucket of every doctor it books.
+            doctors = [slot.get("doctor") for slot in slots if isinstance(slot, dict)]
+        else:
+            doctors = [data.get("doctor")]
+        return sorted({str(doctor) for doctor in doctors if str(doctor).isdigit()})
@@ -1,11 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     TimeSlotViewSet,
     AvailabilityViewSet,
+    ScheduleTemplateViewSet,
     AppointmentViewSet,
     DoctorRegistrationViewSet,
     PatientRegistrationViewSet,
+    BulkRegistrationView,
+    DoctorStatsView,
 )
 from rest_framework_simplejwt.views import (
     TokenRefreshView,
@@ -16,6 +20,7 @@ from rest_framework_simplejwt.views import (
 router = DefaultRouter()
 router.register(r"timeslots", TimeSlotViewSet)
 router.register(r"availabilities", AvailabilityViewSet)
+router.register(r"schedule_templates", ScheduleTemplateViewSet)
 router.register(r"appointments", AppointmentViewSet)
 router.register(
     r"register_doctor", DoctorRegistrationViewSet, basename="doctor-registration"
@@ -26,7 +31,30 @@ router.register(
 
 urlpatterns = [
     path("", include(router.urls)),
+    path("register_bulk/", BulkRegistrationView.as_view(), name="register-bulk"),
+    path("doctor_stats/", DoctorStatsView.as_view(), name="doctor-stats"),
     path("api/token_refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/token_verify/", TokenVerifyView.as_view(), name="token_verify"),
     path("api/token_obtain/", TokenObtainPairView.as_view(), name="token_obtain"),
+    path(
+        "async/availabilities/",
+        async_views.availability_list,
+        name="async-availability-list",
+    ),
+    path(
+        "async/availabilities/events/",
+        async_views.availability_events,
+        name="async-availability-events",
+    ),
+    path(
+        "async/availabilities/<int:pk>/",
+        async_views.availability_detail,
+        name="async-availability-detail",
+    ),
+    path("async/timeslots/", async_views.timeslot_list, name="async-timeslot-list"),
+    path(
+        "async/appointments/search/",
+        async_views.appointment_search,
+        name="async-appointment-search",
+    ),
 ]
@@ -1,39 +1,242 @@
+import codecs
+from itertools import islice
+
+from django.conf import settings
+from django.db import router, transaction
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from .models import Doctor, Patient, TimeSlot, Availability, Appointment, Waitlist
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from .models import Doctor, Patient, TimeSlot, Availability, Appointment, ScheduleTemplate
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from .serializers import (
     TimeSlotSerializer,
     AvailabilitySerializer,
+    AvailabilityFilterSerializer,
+    BulkAvailabilitySerializer,
+    FreeDoctorsSerializer,
+    FirstFreeSerializer,
+    NextSlotsSerializer,
+    ScheduleTemplateSerializer,
     AppointmentSerializer,
+    AppointmentSearchSerializer,
+    AppointmentExportSerializer,
+    DoctorStatsSerializer,
+    BatchBookingSerializer,
     DoctorRegistrationSerializer,
     PatientRegistrationSerializer,
 )
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from django.utils import timezone
 from appointments.permission import IsDoctorOrReadOnly
+from appointments.authentication import ClaimsJWTAuthentication
+from appointments.pagination import KeysetPagination, SearchPagination
+from appointments.search import search_appointments
+from appointments.schedule import (
+    declare_availability,
+    lock_declarations,
+    expand_dates,
+    next_free_slots,
+    slots_between,
+)
+from appointments.cache import availability_cache, timeslot_versions
+from appointments.conditional import conditional_response
+from appointments.idempotency import idempotent, is_replay
+from appointments.signals import SlotChange, notify_slot_changed
+from appointments.booking import (
+    BookingOutcome,
+    book_slot,
+    book_slots,
+    cancel_appointment,
+)
+from appointments.booking_window import get_booking_window
+from appointments.throttles import BookingThrottle
+from appointments.export import CONTENT_TYPES, export_lines, export_rows
+from appointments.renderers import ColumnarRenderer, CSVRenderer, NDJSONRenderer
+from appointments import columnar
+from appointments.onboarding import ROLES, import_users, read_records
+from appointments.doctor_days import first_free, free_doctors, refresh_doctor_day
+from appointments import stats
 from rest_framework.decorators import action
 
 
+class ColumnarListMixin:
+    """Offers the columnar format (appointments.columnar) on the list action."""
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action == "list":
+            renderers.append(ColumnarRenderer())
+        return renderers
+
+
 class TimeSlotViewSet(viewsets.ModelViewSet):
     queryset = TimeSlot.objects.all()
     serializer_class = TimeSlotSerializer
 
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request,
+            timeslot_versions,
+            None,
+            lambda: super(TimeSlotViewSet, self).list(request, *args, **kwargs),
+            request.accepted_renderer.format,
+        )
 
-class AvailabilityViewSet(viewsets.ModelViewSet):
-    queryset = Availability.objects.all()
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request,
+            timeslot_versions,
+            None,
+            lambda: super(TimeSlotViewSet, self).retrieve(request, *args, **kwargs),
+            request.accepted_renderer.format,
+        )
+
+
+class AvailabilityViewSet(ColumnarListMixin, viewsets.ModelViewSet):
+    # Everything AvailabilitySerializer reads, in one query per page.
+    queryset = Availability.objects.select_related("doctor__user", "time_slot").only(
+        "date",
+        "start_time",
+        "is_available",
+        "doctor__user__username",
+        "time_slot__end_time",
+    )
     serializer_class = AvailabilitySerializer
     permission_classes = [IsDoctorOrReadOnly, IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def list(self, request, *args, **kwargs):
-        queryset = (
-            self.get_queryset()
-            .filter(is_available=True)
-            .order_by("date", "time_slot__start_time")
+        filters = AvailabilityFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        queryset = filters.filter(self.get_queryset().filter(is_available=True))
+        params = filters.validated_data
+        format = request.accepted_renderer.format
+
+        def produce():
+            if format != columnar.FORMAT:
+                page = self.paginate_queryset(queryset)
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data).data
+            if params.get("layout") == "bitmask":
+                rows = self.paginator.paginate_values(queryset, request, columnar.MASK_FIELDS)
+                data = columnar.to_masks(rows)
+            else:
+                columns = columnar.AVAILABILITY_COLUMNS
+                rows = self.paginator.paginate_values(
+                    queryset, request, columnar.fields(columns)
+                )
+                data = columnar.to_columns(rows, columns)
+            return self.paginator.get_paginated_response(data).data
+
+        scope = None
+        single_day = "date_from" in params and params["date_from"] == params.get("date_to")
+        if "doctor" in params and single_day:
+            scope = (params["doctor"], params["date_from"])
+        return conditional_response(
+            request,
+            availability_cache,
+            scope,
+            lambda: Response(
+                # The format may come from the Accept header rather than the URL.
+                availability_cache.get_or_set(
+                    scope, f"{format}:{request.build_absolute_uri()}", produce
+                )
+            ),
+            format,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        def respond():
+            data = availability_cache.get_or_set(
+                None,
+                f"detail:{kwargs['pk']}",
+                lambda: super(AvailabilityViewSet, self).retrieve(request, *args, **kwargs).data,
+            )
+            return Response(data)
+
+        return conditional_response(
+            request, availability_cache, None, respond, request.accepted_renderer.format
+        )
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="cache_stats",
+        permission_classes=[IsAdminUser],
+    )
+    def cache_stats(self, request):
+        return Response(availability_cache.stats())
+
+    @action(detail=False, methods=["get"], url_path="next")
+    def next_slots(self, request):
+        params = NextSlotsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        after = params.validated_data.get("after") or timezone.now()
+        rows = next_free_slots(
+            self.get_queryset(),
+            timezone.localtime(after),
+            params.validated_data["k"],
+            params.validated_data.get("doctor"),
+        )
+        return Response({"results": self.get_serializer(rows, many=True).data})
+
+    @action(detail=False, methods=["get"], url_path="free_doctors")
+    def free_doctors(self, request):
+        params = FreeDoctorsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        date = params.validated_data["date"]
+        return Response(
+            {"date": date, "doctors": free_doctors(date, params.validated_data["time"])}
         )
-        print(f"queryset: {[i.__dict__ for i in queryset]}")
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
 
+    @action(detail=False, methods=["get"], url_path="first_free")
+    def first_free(self, request):
+        params = FirstFreeSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        found = first_free(
+            params.validated_data["doctor"],
+            params.validated_data.get("date_from") or timezone.localdate(),
+            params.validated_data["days"],
+        )
+        if found is None:
+            return Response({"date": None, "start_time": None})
+        return Response({"date": found[0], "start_time": found[1]})
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            lock_declarations(serializer.validated_data["doctor"].id)
+            instance = serializer.save()
+        refresh_doctor_day(instance.doctor_id, instance.date)
+        stats.record(instance.doctor_id, instance.date, declared=1)
+        notify_slot_changed(
+            instance.doctor_id, instance.date, [instance.time_slot_id], SlotChange.DECLARED
+        )
+
+    def perform_update(self, serializer):
+        previous = serializer.instance
+        previous_day = (previous.doctor_id, previous.date)
+        notify_slot_changed(
+            previous.doctor_id, previous.date, [previous.time_slot_id], SlotChange.UPDATED
+        )
+        instance = serializer.save()
+        refresh_doctor_day(*previous_day)
+        if (instance.doctor_id, instance.date) != previous_day:
+            refresh_doctor_day(instance.doctor_id, instance.date)
+            stats.record(*previous_day, declared=-1)
+            stats.record(instance.doctor_id, instance.date, declared=1)
+        notify_slot_changed(
+            instance.doctor_id, instance.date, [instance.time_slot_id], SlotChange.UPDATED
+        )
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        refresh_doctor_day(instance.doctor_id, instance.date)
+        stats.record(instance.doctor_id, instance.date, declared=-1)
+        notify_slot_changed(
+            instance.doctor_id, instance.date, [instance.time_slot_id], SlotChange.REMOVED
+        )
+
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -47,6 +250,28 @@ class AvailabilityViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    @idempotent
+    def bulk(self, request):
+        serializer = BulkAvailabilitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        if params.get("time_slots"):
+            time_slot_ids = [slot.id for slot in params["time_slots"]]
+        else:
+            time_slot_ids = slots_between(params["start_time"], params["end_time"])
+
+        created, skipped = declare_availability(
+            params["doctor"].id,
+            expand_dates(params["date_from"], params["date_to"], params["weekdays"]),
+            time_slot_ids,
+        )
+        return Response(
+            {"created": created, "skipped": skipped}, status=status.HTTP_201_CREATED
+        )
+
+    @idempotent
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data)
@@ -61,6 +286,7 @@ class AvailabilityViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
+    @idempotent
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
 
@@ -74,12 +300,41 @@ class AvailabilityViewSet(viewsets.ModelViewSet):
             )
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
-    queryset = Appointment.objects.all()
+class ScheduleTemplateViewSet(viewsets.ModelViewSet):
+    queryset = ScheduleTemplate.objects.all()
+    serializer_class = ScheduleTemplateSerializer
+    permission_classes = [IsDoctorOrReadOnly, IsAuthenticated]
+
+
+class AppointmentViewSet(ColumnarListMixin, viewsets.ModelViewSet):
+    # Everything AppointmentSerializer reads, in one query per page.
+    queryset = Appointment.objects.select_related(
+        "doctor__user", "patient__user", "time_slot"
+    ).only(
+        "date",
+        "doctor__user__username",
+        "patient__user__username",
+        "time_slot__start_time",
+        "time_slot__end_time",
+    )
     serializer_class = AppointmentSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != columnar.FORMAT:
+            return super().list(request, *args, **kwargs)
+        columns = columnar.APPOINTMENT_COLUMNS
+        rows = self.filter_queryset(self.get_queryset()).values_list(*columnar.fields(columns))
+        return Response(columnar.to_columns(list(rows), columns))
+
+    def get_throttles(self):
+        # A replayed Idempotency-Key runs nothing, so it spends no tokens.
+        if self.action in ("create", "batch") and not is_replay(self.request):
+            return [BookingThrottle()]
+        return super().get_throttles()
+
+    @idempotent
     def create(self, request, *args, **kwargs):
         patient_id = request.data.get("patient")
         doctor_id = request.data.get("doctor")
@@ -92,99 +347,123 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        if Appointment.objects.filter(
-            patient_id=patient_id, date=date, time_slot_id=time_slot_id
-        ).exists():
+        window = get_booking_window()
+        book = book_slot if window is None else window.book
+        try:
+            result = book(patient_id, doctor_id, date, time_slot_id)
+        except TimeoutError:
+            return Response(
+                {"error": "The booking could not be confirmed in time. Check your appointments before retrying."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        if result.outcome == BookingOutcome.BOOKED:
+            appointment = self.get_queryset().get(pk=result.appointment.pk)
+            return Response(
+                AppointmentSerializer(appointment).data,
+                status=status.HTTP_201_CREATED,
+            )
+        if result.outcome == BookingOutcome.CONFLICT:
             return Response(
                 {"error": "Patient already has an appointment at this time"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if result.outcome == BookingOutcome.WAITLISTED:
+            return Response(
+                {"message": "The requested time slot is already booked. You have been added to the waitlist."},
+                status=status.HTTP_202_ACCEPTED,
+            )
+        if result.outcome == BookingOutcome.ALREADY_WAITLISTED:
+            return Response(
+                {"message": "You are already on the waitlist for this time slot."},
+                status=status.HTTP_200_OK,
+            )
+        return Response(
+            {"error": "The requested time slot is not available"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-        if Appointment.objects.filter(
-            doctor_id=doctor_id, date=date, time_slot_id=time_slot_id
-        ).exists():
-            waitlist_entry, created = Waitlist.objects.get_or_create(
-                patient_id=patient_id,
-                doctor_id=doctor_id,
-                date=date,
-                time_slot_id=time_slot_id,
+    @action(detail=False, methods=["post"], url_path="batch")
+    @idempotent
+    def batch(self, request):
+        if not request.user.is_patient:
+            return Response(
+                {"error": "Only patients can create appointments."},
+                status=status.HTTP_403_FORBIDDEN,
             )
-            if created:
-                return Response(
-                    {"message": "The requested time slot is already booked. You have been added to the waitlist."},
-                    status=status.HTTP_202_ACCEPTED,
-                )
-            else:
-                return Response(
-                    {"message": "You are already on the waitlist for this time slot."},
-                    status=status.HTTP_200_OK,
-                )
 
-        availability = Availability.objects.filter(
-            doctor_id=doctor_id, date=date, time_slot_id=time_slot_id, is_available=True
-        ).first()
+        serializer = BatchBookingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = book_slots(serializer.validated_data["patient"].id, serializer.slot_keys())
 
-        if availability:
-            appointment = Appointment.objects.create(
-                patient_id=patient_id,
-                doctor_id=doctor_id,
-                date=date,
-                time_slot_id=time_slot_id,
-            )
-            availability.is_available = False
-            availability.save()
+        def slot_data(slots):
+            return [
+                {"doctor": doctor_id, "date": date, "time_slot": time_slot_id}
+                for doctor_id, date, time_slot_id in slots
+            ]
+
+        if result.outcome == BookingOutcome.CONFLICT:
             return Response(
-                AppointmentSerializer(appointment).data, status=status.HTTP_201_CREATED
+                {
+                    "error": "Patient already has an appointment at one of these times",
+                    "slots": slot_data(result.rejected),
+                },
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        else:
+        if result.outcome == BookingOutcome.UNAVAILABLE:
             return Response(
-                {"error": "The requested time slot is not available"},
+                {
+                    "error": "Some of the requested time slots are not available",
+                    "slots": slot_data(result.rejected),
+                },
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        appointments = self.get_queryset().filter(
+            pk__in=[appointment.pk for appointment in result.appointments]
+        ).order_by("date", "time_slot__start_time")
+        return Response(
+            {
+                "appointments": AppointmentSerializer(appointments, many=True).data,
+                "waitlisted": slot_data(result.waitlisted),
+            },
+            status=(
+                status.HTTP_201_CREATED
+                if result.outcome == BookingOutcome.BOOKED
+                else status.HTTP_202_ACCEPTED
+            ),
+        )
+
+    @idempotent
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        previous_day = (serializer.instance.doctor_id, serializer.instance.date)
+        instance = serializer.save()
+        refresh_doctor_day(*previous_day)
+        if (instance.doctor_id, instance.date) != previous_day:
+            refresh_doctor_day(instance.doctor_id, instance.date)
+            stats.record(*previous_day, booked=-1)
+            stats.record(instance.doctor_id, instance.date, booked=1)
+
+    @idempotent
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
 
-        if request.user.is_patient and instance.patient.user != request.user:
+        if request.user.is_patient and instance.patient_id != request.user.patient_id:
             return Response(
                 {"error": "You do not have permission to cancel this appointment."},
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        if request.user.is_doctor and instance.doctor.user != request.user:
+        if request.user.is_doctor and instance.doctor_id != request.user.doctor_id:
             return Response(
                 {"error": "You do not have permission to cancel this appointment."},
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        availability = Availability.objects.get(
-            doctor_id=instance.doctor_id,
-            date=instance.date,
-            time_slot_id=instance.time_slot_id,
-        )
-        availability.is_available = True
-        availability.save()
-        waitlist_entry = Waitlist.objects.filter(
-            doctor_id=instance.doctor_id,
-            date=instance.date,
-            time_slot_id=instance.time_slot_id,
-        ).order_by('added_at').first()
-
-        if waitlist_entry:
-            new_appointment = Appointment.objects.create(
-                patient=waitlist_entry.patient,
-                doctor=waitlist_entry.doctor,
-                date=waitlist_entry.date,
-                time_slot=waitlist_entry.time_slot,
-            )
-            waitlist_entry.delete()
-            availability.is_available = False
-            availability.save()
-            return Response(
-                AppointmentSerializer(new_appointment).data, status=status.HTTP_201_CREATED
-            )
-
-        self.perform_destroy(instance)
+        cancel_appointment(instance)
         return Response(
             {"message": "Appointment deleted successfully"},
             status=status.HTTP_204_NO_CONTENT
@@ -192,18 +471,65 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"], url_path="search")
     def search(self, request):
-        doctor_name = request.query_params.get("doctor", None)
-        patient_name = request.query_params.get("patient", None)
+        params = AppointmentSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
 
-        queryset = self.queryset
+        queryset = search_appointments(
+            doctor=params.validated_data.get("doctor"),
+            patient=params.validated_data.get("patient"),
+            queryset=params.filter(self.get_queryset()),
+        )
+
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="export",
+        renderer_classes=[CSVRenderer, NDJSONRenderer],
+    )
+    def export(self, request):
+        """
+        Stream every matching appointment as CSV (default) or, with
+        ?format=ndjson, one JSON object per line. Staff may export any
+        doctor's appointments, doctors only their own.
+        """
+        if not (request.user.is_staff or request.user.is_doctor):
+            return Response(
+                {"error": "Only staff and doctors can export appointments."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
 
-        if doctor_name:
-            queryset = queryset.filter(doctor__user__username__icontains=doctor_name)
-        if patient_name:
-            queryset = queryset.filter(patient__user__username__icontains=patient_name)
+        params = AppointmentExportSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        doctor_id = params.validated_data.get("doctor")
+        if not request.user.is_staff:
+            doctor_id = request.user.doctor_id
+            if doctor_id is None:
+                # A doctor account without a profile; None would mean all doctors.
+                return Response(
+                    {"error": "Only staff and doctors can export appointments."},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        # Rows are read while the response streams, after the routing
+        # middleware has returned, so choose the database now.
+        queryset = Appointment.objects.using(router.db_for_read(Appointment))
+        rows = export_rows(
+            queryset,
+            params.validated_data.get("date_from"),
+            params.validated_data.get("date_to"),
+            doctor_id,
+        )
+        format = request.accepted_renderer.format
+        response = StreamingHttpResponse(
+            export_lines(rows, format), content_type=CONTENT_TYPES[format]
+        )
+        response["Content-Disposition"] = f'attachment; filename="appointments.{format}"'
+        return response
 
 
 class DoctorRegistrationViewSet(viewsets.ModelViewSet):
@@ -214,3 +540,84 @@ class DoctorRegistrationViewSet(viewsets.ModelViewSet):
 class PatientRegistrationViewSet(viewsets.ModelViewSet):
     queryset = Patient.objects.all()
     serializer_class = PatientRegistrationSerializer
+
+
+class DoctorStatsView(APIView):
+    """
+    Declared, booked, cancelled and waitlisted counts with utilisation over
+    a date range, per doctor or, with ?by=day, per day. Staff may report on
+    any doctor, doctors only on themselves.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if not (request.user.is_staff or request.user.is_doctor):
+            return Response(
+                {"error": "Only staff and doctors can view utilization."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        params = DoctorStatsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        doctor_id = params.validated_data.get("doctor")
+        if not request.user.is_staff:
+            doctor_id = request.user.doctor_id
+            if doctor_id is None:
+                # A doctor account without a profile; None would mean all doctors.
+                return Response(
+                    {"error": "Only staff and doctors can view utilization."},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+
+        return Response(
+            list(
+                stats.report(
+                    params.validated_data["date_from"],
+                    params.validated_data["date_to"],
+                    doctor_id,
+                    params.validated_data["by"],
+                )
+            )
+        )
+
+
+class BulkRegistrationView(APIView):
+    """
+    Register doctors and patients from a CSV (text/csv) or JSON Lines body.
+
+    Passwords are hashed in the request, so a body may hold at most
+    settings.ONBOARDING_MAX_RECORDS records; larger files are for the
+    import_users command, which hashes them in a process pool.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        role = request.query_params.get("role")
+        if role is not None and role not in ROLES:
+            return Response(
+                {"error": f"role must be one of {', '.join(ROLES)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        format = "csv" if request.content_type.startswith("text/csv") else "jsonl"
+        lines = codecs.iterdecode(request._request, "utf-8")
+        limit = getattr(settings, "ONBOARDING_MAX_RECORDS", 200)
+        try:
+            records = list(islice(read_records(lines, format), limit + 1))
+        except UnicodeDecodeError:
+            return Response(
+                {"error": "The body must be UTF-8 encoded"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(records) > limit:
+            return Response(
+                {
+                    "error": f"At most {limit} records per request; "
+                    "use `manage.py import_users` for larger files."
+                },
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        summary = import_users(records, default_role=role)
+        return Response(summary.as_dict(), status=status.HTTP_201_CREATED)
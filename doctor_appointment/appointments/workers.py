@@ -0,0 +1,28 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connections
+
+
+def _setup_worker():
+    # Spawned (rather than forked) workers start without configured settings.
+    if not settings.configured:
+        django.setup()
+
+
+def process_pool(workers=None):
+    """
+    A ProcessPoolExecutor whose workers can use the ORM.
+
+    The parent's idle connections are closed first so forked workers open
+    their own instead of sharing its sockets. Connections inside a
+    transaction cannot be closed, so create pools outside of one.
+    """
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close()
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(), initializer=_setup_worker
+    )
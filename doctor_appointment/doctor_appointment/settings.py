@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,7 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "appointments.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "appointments.db_routers.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -83,17 +86,102 @@ WSGI_APPLICATION = "doctor_appointment.wsgi.application"
 #     }
 # }
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds (0 closes them after
+# every request) and checked before reuse. For pooling across processes put
+# PgBouncer in front, point DB_HOST/DB_PORT at it and, with transaction
+# pooling, set DB_DISABLE_SERVER_SIDE_CURSORS=1: a server-side cursor
+# opened by QuerySet.iterator() does not survive the pooler reassigning
+# the connection between transactions.
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": "appointment",
-        "USER": "omkar",
-        "PASSWORD": "123",
-        "HOST": "localhost",
-        "PORT": "5432",
+        "ENGINE": os.environ.get("DB_ENGINE", "django.db.backends.postgresql"),
+        "NAME": os.environ.get("DB_NAME", "appointment"),
+        "USER": os.environ.get("DB_USER", "omkar"),
+        "PASSWORD": os.environ.get("DB_PASSWORD", "123"),
+        "HOST": os.environ.get("DB_HOST", "localhost"),
+        "PORT": os.environ.get("DB_PORT", "5432"),
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        "DISABLE_SERVER_SIDE_CURSORS": bool(
+            int(os.environ.get("DB_DISABLE_SERVER_SIDE_CURSORS", 0))
+        ),
+    }
+}
+if DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+    # The default in-memory test database cannot take concurrent writers,
+    # which ConcurrentBookingTests needs.
+    DATABASES["default"]["TEST"] = {"NAME": str(BASE_DIR / "test_db.sqlite3")}
+
+# Read replicas: a comma-separated list of host[:port] entries, or of
+# database files when DB_ENGINE is SQLite. Each becomes a "replicaN" alias
+# that appointments.db_routers.PrimaryReplicaRouter reads from.
+
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+    filter(None, os.environ.get("DB_REPLICAS", "").split(",")), start=1
+):
+    alias = f"replica{index}"
+    DATABASES[alias] = dict(DATABASES["default"], TEST={"MIRROR": "default"})
+    if DATABASES[alias]["ENGINE"].endswith("sqlite3"):
+        DATABASES[alias]["NAME"] = replica
+    else:
+        host, _, port = replica.strip().partition(":")
+        DATABASES[alias].update(HOST=host, PORT=port or DATABASES["default"]["PORT"])
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["appointments.db_routers.PrimaryReplicaRouter"]
+
+# Views (URL names) whose GET requests may be served from a replica, and how
+# long a client stays on the primary after a write so it reads its own
+# changes despite replication lag. The cached availability list and detail
+# views are not among them: their cache misses are always read from the
+# primary (see AvailabilityCache.get_or_set).
+REPLICA_READ_VIEWS = [
+    "availability-next-slots",
+    "availability-free-doctors",
+    "availability-first-free",
+    "timeslot-list",
+    "appointment-search",
+    "appointment-export",
+    "doctor-stats",
+    "async-timeslot-list",
+    "async-appointment-search",
+]
+REPLICA_PIN_SECONDS = 10
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# LocMemCache is per process; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) in production so
+# availability invalidation reaches every worker.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
     }
 }
 
+AVAILABILITY_CACHE_TIMEOUT = 300
+
+# Availability change stream (/api/async/availabilities/events/). The
+# in-process broker only reaches streams served by the process that made
+# the change; see appointments.events.
+AVAILABILITY_EVENT_BROKER = "appointments.events.InProcessBroker"
+AVAILABILITY_EVENT_BROKER_OPTIONS = {"buffer_size": 1000}
+AVAILABILITY_EVENT_HEARTBEAT = 15
+
+# Idempotency-Key responses on the appointment and availability write
+# endpoints; see appointments.idempotency. The cache must be shared by
+# every process serving the API.
+IDEMPOTENCY_CACHE = "default"
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+IDEMPOTENCY_WAIT = 10
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -141,11 +229,27 @@ AUTH_USER_MODEL = "appointments.CustomUser"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "appointments.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    # Token buckets for booking (appointments.throttles): each user may book
+    # in bursts of up to 20, each doctor takes up to 300 bookings a minute.
+    "DEFAULT_THROTTLE_RATES": {
+        "booking_user": "20/min",
+        "booking_doctor": "300/min",
+    },
 }
 
+# Cache holding the throttle buckets; must be shared by every process.
+THROTTLE_CACHE = "default"
+
+# Seconds a booking for a busy doctor-day waits to be batched with the
+# others (appointments.booking_window); None books each request directly.
+BOOKING_WINDOW = None
+# Seconds a batched booking waits for its window's leader before booking on
+# its own.
+BOOKING_WINDOW_TIMEOUT = 10
+
 from datetime import timedelta
 
 SIMPLE_JWT = {
@@ -161,4 +265,19 @@ SIMPLE_JWT = {
     "USER_ID_CLAIM": "user_id",
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
+    # Role claims let ClaimsJWTAuthentication skip the user query; blacklist
+    # checks on refresh/verify go through the cache.
+    "TOKEN_OBTAIN_SERIALIZER": "appointments.serializers.RoleTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "appointments.serializers.CachedTokenRefreshSerializer",
+    "TOKEN_VERIFY_SERIALIZER": "appointments.serializers.CachedTokenVerifySerializer",
 }
+
+# Fallback user cache for tokens issued without role claims, and how long a
+# refresh token's "not blacklisted" status is cached.
+JWT_USER_CACHE_SIZE = 1024
+JWT_USER_CACHE_TTL = 60
+JWT_BLACKLIST_CACHE_TIMEOUT = 300
+
+# Records the bulk registration endpoint hashes within one request; larger
+# files go through the import_users command.
+ONBOARDING_MAX_RECORDS = 200
@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from appointments.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include('appointments.urls')),
     path('api-auth/', include('rest_framework.urls')),  # Adds login/logout views for the browsable API
 ]